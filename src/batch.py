@@ -0,0 +1,178 @@
+'''
+Headless batch pipeline: load -> papermesh -> unfold -> project -> multiply, without the Qt user interface.
+
+The manifest is a json file of the form
+{
+    "iterations": 10000,
+    "resolution": 500,
+    "texelDensity": 10,
+    "structures": [
+        {"files": ["../meshes/inner_mesh.stl"], "projection": "Inflate"},
+        {"files": ["../meshes/mid_mesh.stl", "../meshes/hipB.stl"], "projection": "Clipping"}
+    ]
+}
+Every entry of "structures" is added like one "Add Mesh" selection in the ui, relative paths are resolved against the
+directory of the manifest. The optional "texelDensity" renders every triangle with that many pixels per world unit of
+the meshes, the unit of the stl files, instead of the fixed "resolution", see Projector.adaptiveRendering().
+The printed template is rescaled, so it is no density on the paper. The optional "unfoldSeeds" tries these seeds for
+every papermesh and keeps the first successful one, within "unfoldTimeBudget" seconds per papermesh if given,
+see MeshProcessing.mu3dUnfoldSeeds(). "parallelProjection" projects the structures in "projectionWorkers" worker
+processes, one per cpu by default, see Organizer.projectParallel().
+The exit status is 0 on success, 1 if a step failed and 2 for an invalid manifest.
+The json report is written to the --report file or to stdout, the progress of the pipeline always goes to stderr.
+'''
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import argparse
+import contextlib
+import json
+import time
+import vtkmodules.all as vtk
+import util
+import organizer
+from projectionStructure import ProjectionStructure
+
+
+def loadManifest(path):
+    '''
+    Reads and validates the manifest.
+    :param path: path of the json manifest.
+    :return: the manifest dict with absolute file paths.
+    '''
+    with open(path) as f:
+        manifest = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(path))
+    if not manifest.get("structures"):
+        raise ValueError("manifest contains no structures")
+    for structure in manifest["structures"]:
+        if not structure.get("files"):
+            raise ValueError("structure without files in manifest")
+        if structure.get("projection", "Inflate") not in ProjectionStructure.ProjectionMethod.__members__:
+            raise ValueError("unknown projection method {}".format(structure.get("projection")))
+        structure["files"] = [os.path.join(base, f) for f in structure["files"]]
+        for f in structure["files"]:
+            if not os.path.isfile(f):
+                raise ValueError("file {} does not exist".format(f))
+    return manifest
+
+
+def run(manifest, report):
+    '''
+    Runs the whole pipeline for the structures of the manifest with offscreen rendering.
+    :param manifest: the validated manifest.
+    :param report: dict the timings and errors are written to.
+    :return: True if all steps succeeded.
+    '''
+    util.messageHandler = report["errors"].append
+
+    ren = vtk.vtkRenderer()
+    renWin = vtk.vtkRenderWindow()
+    renWin.SetOffScreenRendering(True)
+    renWin.AddRenderer(ren)
+
+    org = organizer.Organizer(ren)
+    org.setUp()
+    org.projector.texelDensity = manifest.get("texelDensity")
+    org.parallelProjection = manifest.get("parallelProjection", False)
+    org.projectionWorkers = manifest.get("projectionWorkers")
+    if manifest.get("unfoldSeeds"):
+        org.hierarchical_mesh_anchor.multiSeedUnfolding = True
+        org.meshProcessor.unfoldSeeds = manifest["unfoldSeeds"]
+        org.meshProcessor.unfoldTimeBudget = manifest.get("unfoldTimeBudget")
+
+    steps = [("load", lambda: addStructures(org, manifest["structures"])),
+             ("unfold", lambda: org.unfoldPaperMeshPass(manifest.get("iterations", 10000))),
+             ("project", lambda: org.projectPass(resolution = [manifest.get("resolution", 500)] * 2)),
+             ("multiply", lambda: org.brightenMultiplication())]
+
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            report["errors"].append("{}: {}".format(name, e))
+        report["timings"][name] = time.perf_counter() - start
+        if report["errors"]:
+            report["failedStep"] = name
+            return False
+
+    report["renderStats"] = {str(k): v for k, v in org.projector.renderStats.items()}
+    return True
+
+
+def addStructures(org, structures):
+    '''
+    Adds the structures to the hierarchy of the organizer, like the "Add Mesh" button.
+    :param org: the organizer.
+    :param structures: the structure entries of the manifest.
+    :return:
+    '''
+    numberOfLoadedStructures = 0
+    meshLists = []
+    for structure in structures:
+        meshes = []
+        for name in structure["files"]:
+            numberOfLoadedStructures += 1
+            mesh = ProjectionStructure(name, numberOfLoadedStructures)
+            mesh.projectionMethod = ProjectionStructure.ProjectionMethod[structure.get("projection", "Inflate")]
+            meshes.append(mesh)
+        meshLists.append(meshes)
+
+    for meshes, hierarchicalMesh in zip(meshLists, org.addMeshes(meshLists)):
+        for mesh in meshes:
+            mesh.hierarchicalMesh = hierarchicalMesh
+
+
+@contextlib.contextmanager
+def progressToStderr():
+    '''
+    Redirects sys.stdout and the file descriptor of stdout to stderr, so the progress printed by the pipeline, by vtk
+    and by the worker processes does not end up in the report.
+    '''
+    sys.stdout.flush()
+    stdout = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+    finally:
+        sys.stderr.flush()
+        os.dup2(stdout, 1)
+        os.close(stdout)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Runs the paper template pipeline without user interface.")
+    parser.add_argument("manifest", help="json manifest with the structures to process")
+    parser.add_argument("--report", help="file the json timing report is written to, default is stdout, "
+                                         "the progress is written to stderr")
+    args = parser.parse_args(argv)
+
+    report = {"manifest": args.manifest, "timings": {}, "errors": []}
+    start = time.perf_counter()
+
+    with progressToStderr():
+        try:
+            manifest = loadManifest(args.manifest)
+        except (OSError, ValueError) as e:
+            report["errors"].append("manifest: {}".format(e))
+            status = 2
+        else:
+            status = 0 if run(manifest, report) else 1
+
+    report["timings"]["total"] = time.perf_counter() - start
+    report["status"] = status
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
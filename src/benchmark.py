@@ -0,0 +1,312 @@
+'''
+Benchmarks comparing optimized processing steps against the former implementations.
+Usage: python benchmark.py [name ...], without names all benchmarks are run.
+'''
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import time
+import numpy as np
+import vtkmodules.all as vtk
+from vtkmodules.numpy_interface.dataset_adapter import numpy_support
+import util
+
+
+def timeIt(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def report(name, reference, optimized, identical):
+    print("{}: former {:.3f}s, now {:.3f}s, speedup {:.1f}x, identical results: {}".format(
+        name, reference, optimized, reference / max(optimized, 1e-9), identical))
+
+
+# --------------------- uv normalization ---------------------
+
+def referenceGetMinMaxUV(mesh, axis = False):
+    textureCoordinates = mesh.GetPointData().GetTCoords()
+    if axis:
+        uMax = 0
+        uMin = 0
+        vMax = 0
+        vMin = 0
+        for i in range(int(textureCoordinates.GetNumberOfTuples() / 3)):
+            uvs = [[0.0, 0.0], [0.0, 0.0], [0.0, 0.0]]
+            textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(0), uvs[0])
+            textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(1), uvs[1])
+            textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(2), uvs[2])
+            umax = np.amax(np.array(uvs)[:, 0])
+            umin = np.amin(np.array(uvs)[:, 0])
+            vmax = np.amax(np.array(uvs)[:, 1])
+            vmin = np.amin(np.array(uvs)[:, 1])
+            if umax > uMax: uMax = umax
+            if umin < uMin: uMin = umin
+            if vmax > vMax: vMax = vmax
+            if vmin < vMin: vMin = vmin
+        return uMin, uMax, vMin, vMax
+    else:
+        gmax = 0.0
+        gmin = 0.0
+        for i in range(int(textureCoordinates.GetNumberOfTuples() / 3)):
+            uvs = [[0.0, 0.0], [0.0, 0.0], [0.0, 0.0]]
+            textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(0), uvs[0])
+            textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(1), uvs[1])
+            textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(2), uvs[2])
+            max = np.amax(np.array(uvs))
+            min = np.amin(np.array(uvs))
+            if max > gmax: gmax = max
+            if min < gmin: gmin = min
+        return gmin, gmax
+
+
+def referenceShiftUVsToOrigin(mesh):
+    uMin, uMax, vMin, vMax = referenceGetMinMaxUV(mesh, axis=True)
+    textureCoordinates = mesh.GetPointData().GetTCoords()
+    newTCoords = vtk.vtkFloatArray()
+    newTCoords.SetNumberOfComponents(2)
+    for i in range(int(textureCoordinates.GetNumberOfTuples() / 3)):
+        for j in range(3):
+            if uMin > 0:
+                u = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[0]) - uMin)
+            else:
+                u = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[0]) + abs(uMin))
+            if vMin > 0:
+                v = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[1]) - vMin)
+            else:
+                v = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[1]) + abs(vMin))
+            newTCoords.InsertNextTuple2(u, v)
+    mesh.GetPointData().SetTCoords(newTCoords)
+    return mesh
+
+
+def referenceNormalizeUV(mesh):
+    mesh = referenceShiftUVsToOrigin(mesh)
+    textureCoordinates = mesh.GetPointData().GetTCoords()
+    newTCoords = vtk.vtkFloatArray()
+    newTCoords.SetNumberOfComponents(2)
+    gmin, gmax = referenceGetMinMaxUV(mesh)
+    for i in range(int(textureCoordinates.GetNumberOfTuples() / 3)):
+        for j in range(3):
+            u = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[0]) - gmin) / (gmax - gmin)
+            v = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[1]) - gmin) / (gmax - gmin)
+            newTCoords.InsertNextTuple2(u, v)
+    mesh.GetPointData().SetTCoords(newTCoords)
+    return mesh
+
+
+def unfoldedTestMesh(numberOfTriangles):
+    '''
+    :return: a triangle soup like the unfolded models, every triangle with its own three points and uvs.
+    '''
+    random = np.random.default_rng(0)
+    points = random.uniform(-50.0, 50.0, (numberOfTriangles * 3, 3))
+    mesh = util.arraysToPolyData(points, np.arange(numberOfTriangles * 3).reshape(-1, 3))
+    uvs = random.uniform(-3.0, 5.0, (numberOfTriangles * 3, 2)).astype(np.float32)
+    mesh.GetPointData().SetTCoords(numpy_support.numpy_to_vtk(uvs, deep=1))
+    return mesh
+
+
+def benchmarkNormalizeUV(numberOfTriangles = 100000):
+    from meshProcessing import MeshProcessing
+
+    reference, referenceMesh = timeIt(referenceNormalizeUV, unfoldedTestMesh(numberOfTriangles))
+    optimized, optimizedMesh = timeIt(MeshProcessing().normalizeUV, unfoldedTestMesh(numberOfTriangles))
+
+    identical = np.array_equal(numpy_support.vtk_to_numpy(referenceMesh.GetPointData().GetTCoords()),
+                               numpy_support.vtk_to_numpy(optimizedMesh.GetPointData().GetTCoords()))
+    report("normalizeUV, {} triangles".format(numberOfTriangles), reference, optimized, identical)
+
+
+# --------------------- brighten ---------------------
+
+def referenceOptimizedBrighten(image, width, height):
+    from PIL import Image
+
+    img1 = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())[:, 0:3]
+
+    img1 = np.reshape(np.ravel(img1), (width, height, 3))
+
+    if img1.shape[0] < height:
+        dif = height - img1.shape[0]
+        arr = np.full((dif,img1.shape[1],3),255)
+        img1 = np.vstack((arr,img1))
+
+    if img1.shape[1] < width:
+        dif = width - img1.shape[1]
+        arr = np.full((img1.shape[0],dif,3),255)
+        img1 = np.hstack((img1,arr))
+
+    if img1.shape[0] > height or img1.shape[1] > width:
+        im = Image.fromarray(img1)
+        img1 = np.asarray(im.resize((width,height)))
+
+    img1 = img1 / 255
+
+    averagePixelRed = np.mean(img1[:,:,0])
+    averagePixelGreen = np.mean(img1[:,:,1])
+    averagePixelBlue = np.mean(img1[:,:,2])
+
+    x = img1[:,:,0] + img1[:,:,1] + img1[:,:,2]
+
+    white = np.where(x>2.0)
+    black = np.where(x<=1.1)
+    colored = np.where(x<=2.0)
+
+    if averagePixelBlue > averagePixelGreen and averagePixelRed > averagePixelGreen:
+        img1[colored[0],colored[1],1] = img1[colored[0],colored[1],1] + (((img1[colored[0],colored[1],0]+img1[colored[0],colored[1],2])*0.48))
+        img1[colored[0],colored[1],0] = 1.0
+        img1[colored[0],colored[1],2] = 1.0
+
+        img1[black[0],black[1],0] = 1.0
+        img1[black[0],black[1],1] = 0.0
+        img1[black[0],black[1],2] = 1.0
+    if averagePixelGreen > averagePixelBlue and averagePixelRed > averagePixelBlue:
+        img1[colored[0],colored[1],2] = img1[colored[0],colored[1],2] + (((img1[colored[0],colored[1],0]+img1[colored[0],colored[1],1])*0.48))
+        img1[colored[0],colored[1],1] = 1.0
+        img1[colored[0],colored[1],0] = 1.0
+
+        img1[black[0],black[1],0] = 1.0
+        img1[black[0],black[1],1] = 1.0
+        img1[black[0],black[1],2] = 0.0
+    if averagePixelGreen > averagePixelRed and averagePixelBlue > averagePixelRed:
+        img1[colored[0],colored[1],0] = img1[colored[0],colored[1],0] + (((img1[colored[0],colored[1],2]+img1[colored[0],colored[1],1])*0.48))
+        img1[colored[0],colored[1],1] = 1.0
+        img1[colored[0],colored[1],2] = 1.0
+
+        img1[black[0],black[1],0] = 0.0
+        img1[black[0],black[1],1] = 1.0
+        img1[black[0],black[1],2] = 1.0
+    img1[white[0], white[1], :] = 1.0
+
+    img1 = img1 * 255
+
+    resultImg = vtk.vtkImageData()
+    dy, dx, dz = img1.shape
+    resultImg.SetDimensions(dx, dy, 1)
+    resultImg.GetPointData().SetScalars(numpy_support.numpy_to_vtk(img1.reshape(dy * dx, dz)))
+
+    castFilter = vtk.vtkImageCast()
+    castFilter.SetInputData(resultImg)
+    castFilter.SetOutputScalarTypeToUnsignedChar()
+    castFilter.Update()
+    return castFilter.GetOutput()
+
+
+def renderingTestImage(size, darkChannel):
+    '''
+    :return: a random rgba image whose given channel is darker on average, so it selects one case of the brightening.
+    '''
+    pixels = np.random.default_rng(darkChannel).integers(0, 256, (size * size, 4), dtype=np.uint8)
+    pixels[:, darkChannel] //= 2
+    image = vtk.vtkImageData()
+    image.SetDimensions(size, size, 1)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(pixels, deep=1))
+    return image
+
+
+def benchmarkBrighten(size = 2000):
+    from imageProcessing import ImageProcessor
+
+    processor = ImageProcessor(size, size)
+    for darkChannel in range(3):
+        image = renderingTestImage(size, darkChannel)
+        reference, referenceImage = timeIt(referenceOptimizedBrighten, image, size, size)
+        optimized, optimizedImage = timeIt(processor.optimizedBrighten, image, size, size)
+
+        identical = np.array_equal(numpy_support.vtk_to_numpy(referenceImage.GetPointData().GetScalars()),
+                                   numpy_support.vtk_to_numpy(optimizedImage.GetPointData().GetScalars()))
+        report("optimizedBrighten, {0}x{0}, dark channel {1}".format(size, darkChannel), reference, optimized, identical)
+
+
+# --------------------- per triangle projection ---------------------
+
+def sphereActor(radius, center, resolution, color):
+    source = vtk.vtkSphereSource()
+    source.SetRadius(radius)
+    source.SetCenter(center)
+    source.SetThetaResolution(resolution)
+    source.SetPhiResolution(resolution)
+    triangles = vtk.vtkTriangleFilter()
+    triangles.SetInputConnection(source.GetOutputPort())
+    triangles.Update()
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputData(triangles.GetOutput())
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    actor.GetProperty().SetColor(color)
+    return actor
+
+
+def benchmarkProjection(resolution = 24, frameSize = 200):
+    '''
+    Regression benchmark of the frame time of projectPerTriangle. Every second triangle counts as failed,
+    the former loop added another actor of the whole paper mesh for each of them, so later frames got slower.
+    '''
+    import tempfile
+    from projector import Projector
+
+    projector = Projector()
+    projector.batchSize = None
+    projector.analyticUVs = False
+    projector.dirname = os.path.join(tempfile.mkdtemp(), "src")
+    os.makedirs(os.path.join(projector.dirname, "../out/2D/texture"))
+
+    frameTimes = []
+    renderHelper = projector.renderHelper
+    def timedRenderHelper(*args):
+        start = time.perf_counter()
+        result = renderHelper(*args)
+        frameTimes.append(time.perf_counter() - start)
+        return result
+    projector.renderHelper = timedRenderHelper
+
+    findMarkerCorners = projector.findMarkerCorners
+    projector.findMarkerCorners = lambda pointsImg: findMarkerCorners(pointsImg) if len(frameTimes) % 2 else None
+
+    paper = sphereActor(10.0, (0, 0, 0), resolution, (1, 1, 1))
+    structure = sphereActor(6.0, (2, 0, 0), 32, (1, 0, 0))
+    projector.projectPerTriangle(paper, structure, 0, [frameSize, frameSize])
+
+    # the median of the first and the last quarter, without the first frames warming up the renderer
+    quarter = max(len(frameTimes) // 4, 1)
+    first = np.median(frameTimes[10:10 + quarter])
+    last = np.median(frameTimes[-quarter:])
+    print("projectPerTriangle, {} frames of {}x{}: first quarter {:.1f}ms, last quarter {:.1f}ms per frame, ratio {:.2f}".format(
+        len(frameTimes), frameSize, frameSize, first * 1000, last * 1000, last / first))
+
+
+def benchmarkAdaptiveProjection(resolution = 24, frameSize = 200, texelDensity = 20):
+    '''
+    Rendered pixels, render calls and time of projectPerTriangle and projectBatched with the fixed frameSize and with the
+    render size of each triangle chosen from its area and the texelDensity.
+    '''
+    import tempfile
+    from projector import Projector
+
+    paper = sphereActor(10.0, (0, 0, 0), resolution, (1, 1, 1))
+    structure = sphereActor(6.0, (2, 0, 0), 32, (1, 0, 0))
+
+    for name in ["projectPerTriangle", "projectBatched"]:
+        for density in [None, texelDensity]:
+            projector = Projector()
+            projector.texelDensity = density
+            projector.dirname = os.path.join(tempfile.mkdtemp(), "src")
+            os.makedirs(os.path.join(projector.dirname, "../out/2D/texture"))
+
+            start = time.perf_counter()
+            getattr(projector, name)(paper, structure, 0, [frameSize, frameSize])
+            duration = time.perf_counter() - start
+            print("{}, {}: {:.2f}s, {} render calls, {} rendered pixels".format(name,
+                "{}x{}".format(frameSize, frameSize) if density is None else "{} pixels per unit".format(density),
+                duration, projector.renderStats[0]["renderCalls"], projector.renderStats[0]["renderedPixels"]))
+
+
+benchmarks = {"uv": benchmarkNormalizeUV, "brighten": benchmarkBrighten, "projection": benchmarkProjection,
+              "adaptive": benchmarkAdaptiveProjection}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or benchmarks.keys():
+        benchmarks[name]()
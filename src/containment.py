@@ -0,0 +1,203 @@
+import numpy as np
+
+
+class ContainmentTree(object):
+    '''
+    Axis aligned bounding box tree over the triangles of a closed mesh, used for containment tests between meshes.
+    The tree is stored in flat numpy arrays and queried for many rays or segments at once.
+    '''
+
+    leafSize = 8
+    # directions of the rays for the point in mesh test, not aligned with the axes or diagonals to avoid hitting edges
+    rayDirections = np.array([[0.8314, 0.4237, 0.3596], [-0.3713, 0.8121, -0.4502], [0.2441, -0.5068, 0.8269]])
+    epsilon = 1e-9
+
+    def __init__(self, points, triangles):
+        '''
+        Builds the tree.
+        :param points: (n, 3) float array.
+        :param triangles: (m, 3) int array of point ids.
+        '''
+        points = np.asarray(points, dtype=np.float64)
+        triangles = np.asarray(triangles, dtype=np.int64)
+
+        usedIds = np.unique(triangles)
+        self.vertices = points[usedIds]
+        edges = np.sort(triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        self.edges = points[np.unique(edges, axis=0)]
+
+        corners = points[triangles]
+        self.lower = corners.reshape(-1, 3).min(axis=0)
+        self.upper = corners.reshape(-1, 3).max(axis=0)
+
+        order = self.build(corners)
+        corners = corners[order]
+        self.v0 = corners[:, 0]
+        self.e1 = corners[:, 1] - corners[:, 0]
+        self.e2 = corners[:, 2] - corners[:, 0]
+
+    def build(self, corners):
+        '''
+        Builds the nodes by splitting the triangles at the median centroid along the longest axis.
+        :param corners: (m, 3, 3) array of the triangle corners.
+        :return: the order of the triangles, every leaf references a contiguous range of it.
+        '''
+        centroids = corners.mean(axis=1)
+        triangleLower = corners.min(axis=1) - self.epsilon
+        triangleUpper = corners.max(axis=1) + self.epsilon
+        order = np.arange(len(corners))
+
+        nodeLower, nodeUpper, left, right, start, count = [], [], [], [], [], []
+
+        def addNode(first, last):
+            nodeLower.append(triangleLower[order[first:last]].min(axis=0))
+            nodeUpper.append(triangleUpper[order[first:last]].max(axis=0))
+            left.append(-1)
+            right.append(-1)
+            start.append(first)
+            count.append(last - first)
+            return len(left) - 1
+
+        stack = [(addNode(0, len(corners)), 0, len(corners))]
+        while stack:
+            node, first, last = stack.pop()
+            if last - first <= self.leafSize:
+                continue
+
+            subset = order[first:last]
+            axis = np.argmax(np.ptp(centroids[subset], axis=0))
+            middle = (first + last) // 2
+            order[first:last] = subset[np.argpartition(centroids[subset, axis], middle - first)]
+
+            left[node] = addNode(first, middle)
+            right[node] = addNode(middle, last)
+            count[node] = 0
+            stack.append((left[node], first, middle))
+            stack.append((right[node], middle, last))
+
+        self.nodeLower = np.array(nodeLower)
+        self.nodeUpper = np.array(nodeUpper)
+        self.nodeLeft = np.array(left)
+        self.nodeRight = np.array(right)
+        self.nodeStart = np.array(start)
+        self.nodeCount = np.array(count)
+        return order
+
+    def candidatePairs(self, origins, directions, maxT):
+        '''
+        Traverses the tree breadth first for all rays at once.
+        :param origins: (k, 3) array.
+        :param directions: (k, 3) array.
+        :param maxT: (k,) array, the rays end at origin + maxT * direction.
+        :return: the ray ids and triangle ids of all pairs whose leaf bounding box is hit.
+        '''
+        with np.errstate(divide='ignore'):
+            inverse = 1.0 / directions
+
+        rays = np.arange(len(origins))
+        nodes = np.zeros(len(origins), dtype=np.int64)
+        leafRays = []
+        leafNodes = []
+        while len(rays):
+            with np.errstate(invalid='ignore'):
+                t1 = (self.nodeLower[nodes] - origins[rays]) * inverse[rays]
+                t2 = (self.nodeUpper[nodes] - origins[rays]) * inverse[rays]
+            tNear = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+            tFar = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+            hit = (tNear <= tFar) & (tFar >= 0.0) & (tNear <= maxT[rays])
+
+            rays = rays[hit]
+            nodes = nodes[hit]
+            leaf = self.nodeLeft[nodes] < 0
+            leafRays.append(rays[leaf])
+            leafNodes.append(nodes[leaf])
+
+            rays = np.concatenate((rays[~leaf], rays[~leaf]))
+            nodes = np.concatenate((self.nodeLeft[nodes[~leaf]], self.nodeRight[nodes[~leaf]]))
+
+        rays = np.concatenate(leafRays)
+        nodes = np.concatenate(leafNodes)
+        counts = self.nodeCount[nodes]
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(rays, counts), np.repeat(self.nodeStart[nodes], counts) + offsets
+
+    def intersect(self, origins, directions, maxT):
+        '''
+        Intersects rays with the triangles (Moeller-Trumbore) for all candidate pairs of the tree.
+        :param origins: (k, 3) array.
+        :param directions: (k, 3) array.
+        :param maxT: (k,) array, the rays end at origin + maxT * direction.
+        :return: the ray ids and the ray parameters t of all hits with 0 <= t <= maxT.
+        '''
+        rayIds, triangleIds = self.candidatePairs(origins, directions, maxT)
+
+        d = directions[rayIds]
+        e1 = self.e1[triangleIds]
+        e2 = self.e2[triangleIds]
+        p = np.cross(d, e2)
+        determinant = np.einsum('ij,ij->i', e1, p)
+        valid = np.abs(determinant) > self.epsilon * self.epsilon
+        inverse = np.where(valid, 1.0 / np.where(valid, determinant, 1.0), 0.0)
+
+        s = origins[rayIds] - self.v0[triangleIds]
+        u = np.einsum('ij,ij->i', s, p) * inverse
+        q = np.cross(s, e1)
+        v = np.einsum('ij,ij->i', d, q) * inverse
+        t = np.einsum('ij,ij->i', e2, q) * inverse
+
+        hit = valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t >= 0.0) & (t <= maxT[rayIds])
+        return rayIds[hit], t[hit]
+
+    def pointsInside(self, points):
+        '''
+        Point in mesh test by the parity of ray intersections, decided by the majority of three ray directions.
+        :param points: (k, 3) array.
+        :return: (k,) bool array.
+        '''
+        points = np.asarray(points, dtype=np.float64)
+        votes = np.zeros(len(points), dtype=np.int64)
+        for direction in self.rayDirections:
+            directions = np.broadcast_to(direction / np.linalg.norm(direction), points.shape)
+            rayIds, t = self.intersect(points, directions, np.full(len(points), np.inf))
+            rayIds = rayIds[t > self.epsilon]
+            votes += np.bincount(rayIds, minlength=len(points)) % 2
+        return votes >= 2
+
+    def intersectsSegments(self, starts, ends):
+        '''
+        :param starts: (k, 3) array.
+        :param ends: (k, 3) array.
+        :return: True if any of the segments intersects a triangle.
+        '''
+        rayIds, t = self.intersect(starts, ends - starts, np.ones(len(starts)))
+        return len(rayIds) > 0
+
+    def boundsContain(self, other):
+        '''
+        :param other: the containment tree of the other mesh.
+        :return: True if the bounding box of the other mesh lies inside the bounding box of this mesh.
+        '''
+        return bool(np.all(other.lower >= self.lower) and np.all(other.upper <= self.upper))
+
+    def getVolume(self):
+        '''
+        :return: the volume of the bounding box.
+        '''
+        return float(np.prod(self.upper - self.lower))
+
+    def contains(self, other):
+        '''
+        Checks if the mesh of the other tree lies inside this mesh: bounding box reject first,
+        then all vertices of the other mesh inside this mesh and no edge of either mesh crossing the other mesh.
+        :param other: the containment tree of the other mesh.
+        :return: True if the other mesh is inside this mesh.
+        '''
+        if not self.boundsContain(other):
+            return False
+        if not np.all(self.pointsInside(other.vertices)):
+            return False
+        if self.intersectsSegments(other.edges[:, 0], other.edges[:, 1]):
+            return False
+        if other.intersectsSegments(self.edges[:, 0], self.edges[:, 1]):
+            return False
+        return True
@@ -0,0 +1,164 @@
+import os
+import hashlib
+import json
+import tempfile
+import numpy as np
+import vtkmodules.all as vtk
+
+
+class DiskCache(object):
+    '''
+    Persistent content-addressed cache on the disk.
+    Entries are stored as one file per key, polydata as compressed binary .vtp and plain arrays as .npz.
+    The modification time of an entry is its last access, the least recently used entries are evicted
+    as soon as the cache grows beyond maxBytes.
+    '''
+
+    def __init__(self, directory, maxBytes = 500 * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    @staticmethod
+    def createKey(files = (), parameters = None, arrays = ()):
+        '''
+        Hashes the content of the given files, the parameters and the arrays into a key.
+        :param files: paths of files whose bytes are part of the key.
+        :param parameters: json serializable parameters.
+        :param arrays: numpy arrays whose shape, type and bytes are part of the key.
+        :return: the hex digest, or None if a file can not be read.
+        '''
+        sha = hashlib.sha256()
+        for filename in files:
+            try:
+                with open(filename, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        sha.update(chunk)
+            except OSError:
+                return None
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            sha.update("{}{}".format(array.dtype.str, array.shape).encode())
+            sha.update(array.tobytes())
+        sha.update(json.dumps(parameters, sort_keys=True).encode())
+        return sha.hexdigest()
+
+    def getPath(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def get(self, key):
+        '''
+        :param key:
+        :return: the cached polydata, or None on a miss.
+        '''
+        path = self.getPath(key, ".vtp")
+        if not self.touch(path):
+            return None
+        reader = vtk.vtkXMLPolyDataReader()
+        reader.SetFileName(path)
+        reader.Update()
+        return reader.GetOutput()
+
+    def put(self, key, polydata):
+        '''
+        Stores a polydata, replacing an existing entry with the same key.
+        :param key:
+        :param polydata:
+        :return:
+        '''
+        def write(path):
+            writer = vtk.vtkXMLPolyDataWriter()
+            writer.SetFileName(path)
+            writer.SetInputData(polydata)
+            writer.SetDataModeToAppended()
+            writer.EncodeAppendedDataOff()
+            writer.SetCompressorTypeToZLib()
+            writer.Write()
+
+        self.store(key, ".vtp", write)
+
+    def getArrays(self, key):
+        '''
+        :param key:
+        :return: dict of the cached arrays, or None on a miss.
+        '''
+        path = self.getPath(key, ".npz")
+        if not self.touch(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+
+    def putArrays(self, key, arrays):
+        '''
+        Stores a dict of arrays, replacing an existing entry with the same key.
+        :param key:
+        :param arrays: dict of numpy arrays.
+        :return:
+        '''
+        def write(path):
+            with open(path, "wb") as f:
+                np.savez_compressed(f, **arrays)
+
+        self.store(key, ".npz", write)
+
+    def remove(self, key):
+        for extension in [".vtp", ".npz"]:
+            try:
+                os.remove(self.getPath(key, extension))
+            except OSError:
+                pass
+
+    def store(self, key, extension, write):
+        '''
+        Writes an entry through a temporary file, so concurrent readers never see partial entries, and evicts afterwards.
+        :param key:
+        :param extension:
+        :param write: function writing the entry to the given path.
+        :return:
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        handle, tempPath = tempfile.mkstemp(suffix=extension + ".tmp", dir=self.directory)
+        os.close(handle)
+        try:
+            write(tempPath)
+            os.replace(tempPath, self.getPath(key, extension))
+        finally:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+        self.evict()
+
+    def touch(self, path):
+        '''
+        Marks an entry as used.
+        :param path:
+        :return: False if the entry does not exist.
+        '''
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def evict(self):
+        '''
+        Removes the least recently used entries until the cache fits into maxBytes.
+        :return:
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        size = sum(entry[1] for entry in entries)
+        for mtime, entrySize, name in sorted(entries):
+            if size <= self.maxBytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            size -= entrySize
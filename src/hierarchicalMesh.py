@@ -1,10 +1,10 @@
 import os
 import trimesh
-from mim.mim import meshB_inside_meshA
 import vtkmodules.all as vtk
 import util
-from mu3d.mu3dpy.mu3d import Graph
 from boolean import boolean_interface
+from diskCache import DiskCache
+from containment import ContainmentTree
 
 class HierarchicalMesh(object):
     """
@@ -15,6 +15,21 @@ class HierarchicalMesh(object):
     """
     dirname = os.path.dirname(__file__)
 
+    # parameters of the papermesh generation, part of the key of the papermesh cache.
+    # hullSpherePlanes 0 uses the cube face planes for the hull, otherwise the recursive sphere planes of that level.
+    paperMeshParameters = {"hullSpherePlanes": 0, "subdivisions": 1, "edgeSmoothing": True, "offset": 5.0}
+    paperMeshCache = DiskCache(os.path.join(dirname, "../out/cache/papermesh"))
+
+    # the papermesh and its modification time last written to each papermesh file, shared by all nodes
+    # since nodes exchange names when the tree changes.
+    writtenFiles = {}
+
+    # unfold the papermeshes of the hierarchy in worker processes, None uses one worker per cpu
+    parallelUnfolding = True
+    unfoldWorkers = None
+    # try the seeds of the meshProcessor within its time budget for every papermesh instead of the one seed
+    multiSeedUnfolding = False
+
     def __init__(self, parent, meshes, meshProcessor):
         """
         Initialises a hierarchical mesh.
@@ -28,6 +43,16 @@ class HierarchicalMesh(object):
         self.parent = parent
         self.meshProcessor = meshProcessor
 
+        # position in the tree, maintained by setPosition() whenever the mesh is inserted or moved
+        self.level = 0
+        self.childIdx = 0
+        # the indices of the children from the anchor down to this mesh, unique unlike the concatenated childIdx
+        self.position = ()
+        self.anchor = self
+        # flat index of all meshes below by (level, childIdx) and by level and position, only filled on the anchor
+        self.nodesByPath = {}
+        self.nodesByLevel = {}
+
         # new sub node of the tree
         if meshes:
             if isinstance(meshes,list):
@@ -36,9 +61,9 @@ class HierarchicalMesh(object):
                 self.meshes = [meshes]
 
             # generates a papermesh for the loaded structures
-            # and writes it to the disk as papermeshLevelTemp.stl and .off
+            # and names it papermeshLevelTemp, the files are written on demand by materialize()
             self.mesh = self.generatePaperMesh()
-            self.setName(self.writePapermeshStlAndOff("Temp"))
+            self.setLevelIdx("Temp")
 
         # no structures thus anchor of the tree
         else:
@@ -58,26 +83,30 @@ class HierarchicalMesh(object):
         self.offname = filename[:filename.rfind('.')] + ".off"
         self.file = filename
 
+    def setLevelIdx(self, levelIdx):
+        '''
+        Names the papermesh papermeshLevel{levelIdx} without writing its files.
+        :param levelIdx:
+        :return:
+        '''
+        self.levelIdx = levelIdx
+        self.setName(self.getPapermeshPath(levelIdx))
+
     def render(self, level, renderer):
         """
-        Adds actors for the papermeshes to the given renderer based on the level.
+        Shows the papermeshes from the given level below this mesh on and hides the ones above.
+        The meshes are looked up by level in the index of the anchor.
         :param level:
         :param renderer:
         :return:
         """
-        if level == 0:
-            if self.mesh:
-                # renderer.AddActor(self.mesh)
-                self.mesh.SetVisibility(True)
-
-            for child in self.children:
-                child.render(level, renderer)
-        else:
-            if self.mesh:
-                self.mesh.SetVisibility(False)
+        if self.mesh:
+            self.mesh.SetVisibility(level == 0)
 
-            for child in self.children:
-                child.render(level-1, renderer)
+        for nodeLevel, nodes in self.getNodesBelow().items():
+            for node in nodes:
+                if node.mesh:
+                    node.mesh.SetVisibility(0 <= level <= nodeLevel - self.level)
 
     def inside(self, mesh):
         """
@@ -87,7 +116,18 @@ class HierarchicalMesh(object):
         """
 
         print("checking if ", mesh.name, " is inside of ", self.name)
-        return meshB_inside_meshA(bytes(self.offname, 'utf-8'), bytes(mesh.offname, 'utf-8'))
+        return self.getContainmentTree().contains(mesh.getContainmentTree())
+
+    def getContainmentTree(self):
+        """
+        The bounding box tree of the papermesh used by inside(), built once and only rebuilt if the papermesh changed.
+        :return: the ContainmentTree of the papermesh.
+        """
+        key = (id(self.papermesh), self.papermesh.GetMTime())
+        if getattr(self, "containmentTreeKey", None) != key:
+            self.containmentTree = ContainmentTree(*util.polyDataToArrays(self.papermesh))
+            self.containmentTreeKey = key
+        return self.containmentTree
 
 
     def add(self, mesh):
@@ -112,8 +152,8 @@ class HierarchicalMesh(object):
             self.children.clear()
             self.appendChild(mesh)
             for tmp_child in temp:
-                #write the temp child as .stl and .off and change the name temporarily so it wont be equal to mesh.name
-                tmp_child.setName(tmp_child.writePapermeshStlAndOff('Temp'))
+                #change the name temporarily so it wont be equal to mesh.name
+                tmp_child.setLevelIdx('Temp')
                 # either add as child to the new hierarchical mesh, or add to the same level as the new hm.
                 if not mesh.add(tmp_child):
                     self.appendChild(tmp_child)
@@ -121,27 +161,123 @@ class HierarchicalMesh(object):
 
         return False
 
+    def addAll(self, meshes):
+        """
+        Adds many hierarchical meshes at once to the hierarchy of this anchor.
+        The result is the same tree as calling add() for each mesh in the given order, but the containment relation
+        is built first from the meshes sorted by bounding box volume, so a mesh is only tested against the candidate
+        containers whose bounding box contains its own, and inserting the meshes afterwards needs no further tests.
+        :param meshes: list of Hierarchical Meshes that should be added to the hierarchy
+        :return: None
+        """
+        containers = self.findContainers(self.getDescendants() + list(meshes))
+        for mesh in meshes:
+            self.insertContained(mesh, containers)
+        self.reName()
+
+    def getDescendants(self):
+        """
+        :return: all hierarchical meshes below this one.
+        """
+        descendants = []
+        for child in self.children:
+            descendants.append(child)
+            descendants.extend(child.getDescendants())
+        return descendants
+
+    @staticmethod
+    def findContainers(meshes):
+        """
+        Tests which of the given meshes contain each other. Every container is kept, as add() may place a mesh below
+        any of them when containers overlap. The meshes are sorted by bounding box volume, so a mesh is only tested
+        against the larger meshes and only if their bounding box contains its own.
+        :param meshes: list of hierarchical meshes.
+        :return: dict from the id of each mesh to the set of ids of all meshes containing it.
+        """
+        trees = {id(mesh): mesh.getContainmentTree() for mesh in meshes}
+        volumes = {id(mesh): trees[id(mesh)].getVolume() for mesh in meshes}
+        ordered = sorted(meshes, key=lambda mesh: -volumes[id(mesh)])
+
+        containers = {}
+        for mesh in ordered:
+            tree = trees[id(mesh)]
+            containers[id(mesh)] = set()
+            for candidate in ordered:
+                if volumes[id(candidate)] < volumes[id(mesh)]:
+                    break
+                if candidate is not mesh and trees[id(candidate)].boundsContain(tree) and candidate.inside(mesh):
+                    containers[id(mesh)].add(id(candidate))
+        return containers
+
+    def insertContained(self, mesh, containers):
+        """
+        Same insertion as add(), with the containment looked up in the precomputed containers instead of being tested.
+        :param mesh: Hierarchical Mesh that should be added to the hierarchy
+        :param containers: dict from the id of each mesh to the set of ids of all meshes containing it.
+        :return: True if the mesh was added below this mesh.
+        """
+        for child in self.children:
+            if child.insertContained(mesh, containers):
+                return True
+
+        if self.mesh is None or id(self) in containers[id(mesh)]:
+            temp = self.children.copy()
+            self.children.clear()
+            self.children.append(mesh)
+            mesh.parent = self
+            for tmp_child in temp:
+                if not mesh.insertContained(tmp_child, containers):
+                    self.children.append(tmp_child)
+                    tmp_child.parent = self
+            return True
+
+        return False
+
     def reName(self):
         '''
-        Name the mesh according to its current position in the tree
-        and also write .stl and .off file with the new name
+        Name the mesh according to its current position in the tree, the .stl and .off file with the new name
+        are only written once needed by materialize().
         also calls reName() of all children.
         :return:
         '''
-        for child in self.children:
-            idx = "{}_{}".format(child.getLevel(), child.getChildIdx())
-            child.setName(child.writePapermeshStlAndOff(idx))
-            child.reName()
+        for i, child in enumerate(self.children):
+            child.setPosition(self, i)
+
+    def setPosition(self, parent, idx):
+        '''
+        Stores the level and childIdx of this mesh at the given position, updates the index of the anchor
+        and names the mesh accordingly, then does the same for all children.
+        :param parent:
+        :param idx: the index of this mesh in the children of the parent.
+        :return:
+        '''
+        anchor = parent.anchor
+        path = "{}{}".format(idx, parent.childIdx if parent.parent else "")
+        if self.anchor.nodesByPath.get((self.level, self.childIdx)) is self:
+            del self.anchor.nodesByPath[(self.level, self.childIdx)]
+        if self.anchor.nodesByLevel.get(self.level, {}).get(self.position) is self:
+            del self.anchor.nodesByLevel[self.level][self.position]
+
+        self.parent = parent
+        self.anchor = anchor
+        self.level = parent.level + 1
+        self.childIdx = path
+        self.position = parent.position + (idx,)
+        anchor.nodesByPath[(self.level, path)] = self
+        anchor.nodesByLevel.setdefault(self.level, {})[self.position] = self
+        self.setLevelIdx("{}_{}".format(self.level, path))
+
+        self.reName()
 
     def appendChild(self,newChild):
         '''
         Helper method to trigger side effects necessary when appending a child.
+        Only the new child and its descendants change their position.
         :param newChild:
         :return:
         '''
         self.children.append(newChild)
-        newChild.parent = self
-        self.reName()
+        newChild.setPosition(self, len(self.children) - 1)
 
     def recursive_difference(self):
         """
@@ -150,9 +286,9 @@ class HierarchicalMesh(object):
         :return: None
         """
         if self.mesh is not None:
-            final_mesh = trimesh.load(self.file)
+            final_mesh = trimesh.load(self.materialize())
             for child in self.children:
-                tri_child = trimesh.load(child.file)
+                tri_child = trimesh.load(child.materialize())
                 #final_mesh = final_mesh.difference(tri_child, engine='blender')
                 final_mesh = trimesh.boolean.difference([final_mesh, tri_child], engine="blender")
 
@@ -188,21 +324,33 @@ class HierarchicalMesh(object):
         '''
         Generates a papermesh for the loaded structures in self.meshes.
         As a side effect the papermesh itself is saved to self.papermesh.
+        Papermeshes are cached on the disk by the content of the structure files and the generation parameters.
         :return: A vtk actor of the generated papermesh.
         '''
-        meshes = [m.mesh for m in self.meshes]
-        polysAppended = util.appendMeshes(meshes)
-        hull = vtk.vtkHull()
-        hull.SetInputData(polysAppended)
-        hull.AddCubeFacePlanes()
-        hull.Update()
-        triangleFilter = vtk.vtkTriangleFilter()
-        triangleFilter.SetInputData(hull.GetOutput())
-        triangleFilter.Update()
-        mesh = util.subdivideMesh(triangleFilter.GetOutput())
-        mesh = util.cleanMesh(mesh)
-        mesh = util.shrinkWrap(mesh,polysAppended)
-        self.papermesh = util.offsetMesh(mesh)
+        key = DiskCache.createKey([m.filename for m in self.meshes], self.paperMeshParameters)
+        self.papermesh = self.paperMeshCache.get(key) if key else None
+
+        if self.papermesh is None:
+            parameters = self.paperMeshParameters
+            meshes = [m.mesh for m in self.meshes]
+            polysAppended = util.appendMeshes(meshes)
+            hull = vtk.vtkHull()
+            hull.SetInputData(polysAppended)
+            if parameters["hullSpherePlanes"]:
+                hull.AddRecursiveSpherePlanes(parameters["hullSpherePlanes"])
+            else:
+                hull.AddCubeFacePlanes()
+            hull.Update()
+            triangleFilter = vtk.vtkTriangleFilter()
+            triangleFilter.SetInputData(hull.GetOutput())
+            triangleFilter.Update()
+            mesh = util.subdivideMesh(triangleFilter.GetOutput(), parameters["subdivisions"])
+            mesh = util.cleanMesh(mesh)
+            mesh = util.shrinkWrap(mesh,polysAppended, parameters["edgeSmoothing"])
+            self.papermesh = util.offsetMesh(mesh, parameters["offset"])
+            if key:
+                self.paperMeshCache.put(key, self.papermesh)
+
         mapper = vtk.vtkPolyDataMapper()
         mapper.SetInputData(self.papermesh)
         actor = vtk.vtkActor()
@@ -211,23 +359,62 @@ class HierarchicalMesh(object):
         return actor
 
     def unfoldWholeHierarchy(self, iterations):
-        if hasattr(self,'papermesh'):
-            self.unfoldPaperMesh(iterations)
-        for child in self.children:
-            child.unfoldWholeHierarchy(iterations)
+        '''
+        Unfolds the papermeshes of this mesh and all meshes below.
+        With parallelUnfolding all papermeshes are unfolded in worker processes, with multiSeedUnfolding each with
+        the seeds of the meshProcessor within its time budget. The actors are created afterwards on the calling thread
+        in the order of the hierarchy.
+        :param iterations:
+        :return:
+        '''
+        nodes = [node for node in [self] + self.getDescendants() if hasattr(node, 'papermesh')]
+        if self.parallelUnfolding and nodes:
+            meshes = [node.unfoldTask() for node in nodes]
+            if self.multiSeedUnfolding:
+                results = self.meshProcessor.mu3dUnfoldSeeds(meshes, iterations, workers=self.unfoldWorkers)
+                timedOut = self.meshProcessor.timedOutMeshes
+            else:
+                results = self.meshProcessor.mu3dUnfoldParallel(meshes, iterations, workers=self.unfoldWorkers)
+                timedOut = []
+            for idx, (node, unfolded) in enumerate(zip(nodes, results)):
+                node.finishUnfold(unfolded, iterations, idx in timedOut)
+        else:
+            for node in nodes:
+                node.unfoldPaperMesh(iterations)
 
     def unfoldPaperMesh(self, iterations):
         '''
-        Calls the mu3dUnfoldPaperMesh() method of the given meshProcessor and afterward the createDedicatedPaperMesh()
-        to create a projectionMesh for each mesh in self.meshes.
-        :param meshProcessor:
+        Unfolds the papermesh with the mu3dUnfold() method of the given meshProcessor and afterward calls
+        createDedicatedMeshes() to create a projectionMesh for each mesh in self.meshes.
         :param iterations:
         :return:
         '''
+        points, triangles = self.unfoldTask()
+        self.graph = self.meshProcessor.createGraph()
+        self.finishUnfold(self.meshProcessor.mu3dUnfold(points, triangles, self.graph, iterations), iterations)
+
+    def unfoldTask(self):
+        '''
+        Names the papermesh according to its position and prepares the unfolding.
+        mu3d gets the papermesh as arrays, its files are only written by materialize() for the boolean difference
+        or toList().
+        :return: the points and triangles of the papermesh.
+        '''
         idx = "{}_{}".format(self.getLevel(), self.getChildIdx())
-        self.writePapermeshStlAndOff(idx)
-        self.graph = Graph()
-        unfoldedActor = self.meshProcessor.mu3dUnfoldPaperMesh(self.papermesh, self.graph, iterations)
+        self.setLevelIdx(idx)
+        return util.polyDataToArrays(self.papermesh)
+
+    def finishUnfold(self, unfolded, iterations, timedOut = False):
+        '''
+        Creates the unfolded actor and the projection meshes from the result of an unfolding.
+        :param unfolded: the arrays returned by mu3dUnfold(), None if the unfolding failed.
+        :param iterations:
+        :param timedOut: if true the unfolding failed since its time budget was used up.
+        :return:
+        '''
+        if unfolded is None and timedOut:
+            print("papermesh {} was not unfolded within the time budget".format(self.name))
+        unfoldedActor = self.meshProcessor.createUnfoldedActor(unfolded, iterations, timedOut=timedOut)
         if unfoldedActor:
             self.unfoldedActor = unfoldedActor
             self.meshProcessor.createDedicatedMeshes(self)
@@ -254,11 +441,36 @@ class HierarchicalMesh(object):
         '''
         name = "papermeshLevel{}".format(levelIdx)
         util.writeStl(self.papermesh, name)
-        inpath = os.path.join(self.dirname, "../out/3D/papermeshLevel{}.stl".format(levelIdx))
+        inpath = self.getPapermeshPath(levelIdx)
         outpath = os.path.join(self.dirname, "../out/3D/papermeshLevel{}.off".format(levelIdx))
         util.meshioIO(inpath,outpath)
+        self.writtenFiles[os.path.normpath(inpath)] = (self.papermesh, self.papermesh.GetMTime())
         return inpath
 
+    def getPapermeshPath(self, levelIdx):
+        '''
+        :return: The full path to the stl file of the papermesh named papermesh{level}, without writing it.
+        '''
+        return os.path.join(self.dirname, "../out/3D/papermeshLevel{}.stl".format(levelIdx))
+
+    def isDirty(self):
+        '''
+        :return: True if the files of the current name do not contain the current papermesh.
+        '''
+        written = self.writtenFiles.get(os.path.normpath(self.file))
+        return written is None or written[0] is not self.papermesh or written[1] != self.papermesh.GetMTime()
+
+    def materialize(self):
+        '''
+        Writes the .stl and .off file of the papermesh under the current name, if they are not up to date.
+        :return: The full path to the stl file, None for the anchor.
+        '''
+        if self.file is None:
+            return None
+        if self.isDirty():
+            self.writePapermeshStlAndOff(self.levelIdx)
+        return self.file
+
 
     def toString(self):
         '''
@@ -279,44 +491,53 @@ class HierarchicalMesh(object):
         e.g.: 100 ... mesh is second child of parent, which is first child of its parent, which is the first child of the anchor mesh.
         :return:
         '''
-        if not self.parent:
-            return 0
-        childIdx = "{}".format(self.parent.children.index(self))
-        parent = self.parent
-        # if there is another level above the parent
-        # sum the childIdx
-        while parent is not None:
-            if parent.parent:
-                childIdx += "{}".format(parent.parent.children.index(parent))
-            parent = parent.parent
-        return childIdx
+        return self.childIdx
 
     def getLevel(self):
         """
         :return: the level of this hierarchical mesh.
         """
-        if not self.parent:
-            return 0
-        parent = self.parent
-        level = 0
-        while parent is not None:
-            parent = parent.parent
-            level += 1
-        return level
+        return self.level
 
-    def toLevelDict(self, hierarchical_dict):
+    def getNode(self, level, childIdx):
         """
-        :return:
+        :param level:
+        :param childIdx: the concatenated childIdx as returned by getChildIdx().
+        :return: the hierarchical mesh at this position below the anchor, or None.
         """
-        current_level = self.getLevel()
-        print(current_level, self.file)
-        if current_level not in hierarchical_dict:
-            hierarchical_dict[current_level] = []
+        return self.anchor.nodesByPath.get((level, childIdx))
 
-        hierarchical_dict[current_level].append(self.file)
+    def getNodesOfLevel(self, level):
+        """
+        :param level:
+        :return: the hierarchical meshes of the given level below the anchor, in the order of the tree.
+        """
+        nodes = self.anchor.nodesByLevel.get(level, {})
+        return [nodes[position] for position in sorted(nodes)]
 
-        for child in self.children:
-            child.toLevelDict(hierarchical_dict)
+    def getNodesBelow(self):
+        """
+        :return: dict from each level below this mesh to its hierarchical meshes below this mesh,
+        in the order of the tree, looked up in the index of the anchor.
+        """
+        depth = len(self.position)
+        levels = {}
+        for level in sorted(self.anchor.nodesByLevel):
+            if level <= self.level:
+                continue
+            nodes = [node for node in self.getNodesOfLevel(level) if node.position[:depth] == self.position]
+            if nodes:
+                levels[level] = nodes
+        return levels
+
+    def toLevelDict(self, hierarchical_dict):
+        """
+        Collects the paths of the papermeshes of this mesh and all below by level, the files are written if needed.
+        :return:
+        """
+        hierarchical_dict.setdefault(self.getLevel(), []).append(self.materialize())
+        for level, nodes in self.getNodesBelow().items():
+            hierarchical_dict.setdefault(level, []).extend(node.materialize() for node in nodes)
 
         return hierarchical_dict
 
@@ -0,0 +1,151 @@
+'''
+Shared bridge between vtkImageData and numpy arrays of shape (height, width, components).
+Arrays are views on the vtk scalars and vtk images use the memory of the arrays, nothing is copied.
+Rows are kept in the bottom up order of vtk, flip() turns them into the top down order of image files.
+FrameReader reads rendered frames into reused buffers.
+'''
+
+import numpy as np
+import vtkmodules.all as vtk
+from vtkmodules.numpy_interface.dataset_adapter import numpy_support
+
+
+def toNumpy(image, components = 3):
+    '''
+    :param image: vtkImageData, e.g. the output of a window to image filter.
+    :param components: the number of leading components to view.
+    :return: (height, width, components) view of the scalars, bottom row first. The view keeps the scalars alive.
+    '''
+    width, height, _ = image.GetDimensions()
+    scalars = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+    return scalars.reshape(height, width, -1)[:, :, :components]
+
+
+def toPixels(image, components = 3):
+    '''
+    :param image: vtkImageData.
+    :param components: the number of leading components to view.
+    :return: (width * height, components) view of the scalars, bottom row first.
+    '''
+    width, height, _ = image.GetDimensions()
+    scalars = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+    return scalars.reshape(width * height, -1)[:, :components]
+
+
+def fromNumpy(array):
+    '''
+    :param array: (height, width, components) array, bottom row first.
+    :return: vtkImageData using the memory of the array, which is only copied if it is not contiguous.
+    The vtk scalars keep a reference to the array.
+    '''
+    height, width, components = array.shape
+    array = np.ascontiguousarray(array)
+    image = vtk.vtkImageData()
+    image.SetSpacing(1., 1., 1.)
+    image.SetOrigin(0., 0., 0.)
+    image.SetDimensions(width, height, 1)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(array.reshape(-1, components), deep=0))
+    return image
+
+
+def flip(array):
+    '''
+    Flips the rows between the bottom up order of vtk and the top down order of image files.
+    :param array: (height, width, components) array.
+    :return: flipped view of the array.
+    '''
+    return array[::-1]
+
+
+def toUint8(array):
+    '''
+    :param array:
+    :return: the array as uint8, truncated and wrapped like vtkImageCast does, not copied if it already is uint8.
+    '''
+    if array.dtype == np.uint8:
+        return array
+    return (array.astype(np.int64) & 255).astype(np.uint8)
+
+
+def writePng(image, path):
+    '''
+    Writes an image to a png with the vtkPNGWriter, arrays are handed to it without copying.
+    :param image: vtkImageData or (height, width, 3 or 4) array, bottom row first.
+    :param path:
+    :return: vtkImageData of the written uint8 pixels.
+    '''
+    if isinstance(image, vtk.vtkImageData):
+        if image.GetScalarType() != vtk.VTK_UNSIGNED_CHAR:
+            image = fromNumpy(toUint8(toNumpy(image, image.GetNumberOfScalarComponents())))
+    else:
+        image = fromNumpy(toUint8(image))
+
+    writer = vtk.vtkPNGWriter()
+    writer.SetFileName(path)
+    writer.SetInputData(image)
+    writer.Write()
+    return image
+
+
+class FrameReader(object):
+    '''
+    Reads the frames of a render window straight into preallocated buffers, without a window to image filter.
+    The rgb frame is a (height, width, 3) uint8 and the depth frame a (height, width) float32 array, bottom row first.
+    Like a window to image filter the front buffer is read unless front is False.
+    The own buffers are reused for every frame and only reallocated if the size of the window changes,
+    caller owned buffers are filled in place.
+    '''
+
+    def __init__(self, renWin, depth = False, front = True):
+        self.renWin = renWin
+        self.depth = depth
+        self.front = front
+        # per frame kind the buffer, the vtk array using its memory and whether the buffer is owned by the reader
+        self.buffers = {}
+
+    def read(self, rgb = None, z = None):
+        '''
+        Reads the last rendered frame.
+        :param rgb: optional caller owned (height, width, 3) contiguous uint8 buffer to fill.
+        :param z: optional caller owned (height, width) contiguous float32 buffer to fill, the depth is read
+        if it is given or the reader was created with depth.
+        :return: the rgb frame and the depth frame or None, own buffers are overwritten by the next read.
+        '''
+        width, height = self.renWin.GetSize()
+
+        rgb, rgbArray = self.getBuffer("rgb", rgb, (height, width, 3), np.uint8)
+        if not self.renWin.GetPixelData(0, 0, width - 1, height - 1, int(self.front), rgbArray, 0):
+            raise Exception("The pixels of the render window could not be read")
+
+        if z is None and not self.depth:
+            return rgb, None
+        z, zArray = self.getBuffer("z", z, (height, width), np.float32)
+        if not self.renWin.GetZbufferData(0, 0, width - 1, height - 1, zArray):
+            raise Exception("The depth of the render window could not be read")
+        return rgb, z
+
+    def getBuffer(self, kind, buffer, shape, dtype):
+        '''
+        :param kind: "rgb" or "z".
+        :param buffer: the caller owned buffer or None.
+        :param shape:
+        :param dtype:
+        :return: the buffer to fill and the vtk array using its memory.
+        '''
+        last, array, owned = self.buffers.get(kind, (None, None, False))
+
+        if buffer is None:
+            if owned and last.shape == shape:
+                return last, array
+            buffer = np.empty(shape, dtype=dtype)
+            owned = True
+        elif buffer is last and buffer.shape == shape:
+            return last, array
+        else:
+            if buffer.shape != shape or buffer.dtype != dtype or not buffer.flags["C_CONTIGUOUS"]:
+                raise Exception("The buffer has to be a contiguous {} array of shape {}".format(np.dtype(dtype).name, shape))
+            owned = False
+
+        array = numpy_support.numpy_to_vtk(buffer.reshape(-1, shape[2]) if len(shape) == 3 else buffer.ravel(), deep=0)
+        self.buffers[kind] = (buffer, array, owned)
+        return buffer, array
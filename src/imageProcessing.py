@@ -1,8 +1,115 @@
 import vtkmodules.all as vtk
-from vtkmodules.numpy_interface.dataset_adapter import numpy_support
 import numpy as np
 from PIL import Image
 import util
+import imageBuffer
+from pngStream import PngRowReader, PngRowWriter
+
+def createBrightenTables(white, black):
+    '''
+    Tabulates the brightening of a channel c by the other channels o1 and o2, as the former float implementation
+    computed it: trunc(255 * (c / 255 + (o1 / 255 + o2 / 255) * 0.48)) wrapped to uint8 like vtkImageCast does,
+    0 if c + o1 + o2 <= black and 255 if c + o1 + o2 > white.
+    The sum o1 / 255 + o2 / 255 only takes a few hundred float values, the pairs are mapped to them first.
+    :param white:
+    :param black:
+    :return: the (65536,) uint16 index of the float sum of each pair o1 << 8 | o2, and the (256, number of sums)
+    uint8 table of the brightened channel.
+    '''
+    normalized = np.arange(256) / 255
+    pairSums, pairs = np.unique((normalized[:, np.newaxis] + normalized[np.newaxis, :]).ravel(), return_inverse=True)
+    channelSums = np.empty(len(pairSums), dtype=np.int64)
+    channelSums[pairs] = (np.arange(256)[:, np.newaxis] + np.arange(256)[np.newaxis, :]).ravel()
+    channelSums = np.arange(256)[:, np.newaxis] + channelSums[np.newaxis, :]
+
+    table = ((normalized[:, np.newaxis] + pairSums[np.newaxis, :] * 0.48) * 255).astype(np.int64) & 255
+    table[channelSums <= black] = 0
+    table[channelSums > white] = 255
+    return pairs.astype(np.uint16), table.astype(np.uint8)
+
+
+class RenderContext():
+    '''
+    Offscreen renderer, render window and frame reader, created once and reused for every multiplication.
+    The window is only resized if the requested size changes and the rendered layers are read straight into image buffers
+    that are kept between the calls.
+    '''
+
+    def __init__(self):
+        self.ren = None
+        self.iren = None
+        self.renWin = None
+        self.frameReader = None
+        # per layer the vtkImageData and the numpy buffer of its scalars
+        self.layers = []
+
+    def setUp(self, camera, width, height, depthPeeling, occlusion, numberOfPeels):
+        '''
+        Creates the render window on the first call and applies the settings of the current multiplication.
+        :return:
+        '''
+        if self.renWin is None:
+            self.ren, self.iren, self.renWin, wti = util.getbufferRenIntWin(camera, width, height)
+            self.renWin.SetOffScreenRendering(True)
+            self.frameReader = imageBuffer.FrameReader(self.renWin, front=False)
+
+        self.ren.SetActiveCamera(camera)
+        if tuple(self.renWin.GetSize()) != (width, height):
+            self.renWin.SetSize(width, height)
+
+        self.ren.SetUseDepthPeeling(depthPeeling)
+        if depthPeeling:
+            self.ren.SetOcclusionRatio(occlusion)
+            self.ren.SetMaximumNumberOfPeels(numberOfPeels)
+
+    def renderLayers(self, actorList):
+        '''
+        Renders every actor on its own by toggling the visibility of the actors, which is restored afterwards.
+        :param actorList:
+        :return: one vtkImageData per actor, the images are overwritten by the next call.
+        '''
+        visibilities = [a.GetVisibility() for a in actorList]
+
+        self.ren.RemoveAllViewProps()
+        for a in actorList:
+            self.ren.AddActor(a)
+            a.SetVisibility(False)
+
+        try:
+            for i, a in enumerate(actorList):
+                a.SetVisibility(visibilities[i])
+                self.renWin.Render()
+                a.SetVisibility(False)
+
+                image, buffer = self.getLayer(i, *self.renWin.GetSize())
+                self.frameReader.read(buffer)
+                image.GetPointData().GetScalars().Modified()
+        finally:
+            for a, visibility in zip(actorList, visibilities):
+                a.SetVisibility(visibility)
+            self.ren.RemoveAllViewProps()
+
+        return [image for image, buffer in self.layers[:len(actorList)]]
+
+    def getLayer(self, i, width, height):
+        '''
+        :param i: the index of the layer.
+        :param width: the width of the rendered image.
+        :param height: the height of the rendered image.
+        :return: the image and the (height, width, 3) buffer of the layer, reallocated only if the size changed.
+        '''
+        if i < len(self.layers) and self.layers[i][1].shape == (height, width, 3):
+            return self.layers[i]
+
+        buffer = np.empty((height, width, 3), dtype=np.uint8)
+        image = imageBuffer.fromNumpy(buffer)
+
+        if i < len(self.layers):
+            self.layers[i] = (image, buffer)
+        else:
+            self.layers.append((image, buffer))
+        return self.layers[i]
+
 
 #Class responsible for 2D image related processing steps.
 class ImageProcessor():
@@ -10,12 +117,11 @@ class ImageProcessor():
     def __init__(self,width,height):
         self.width = width
         self.height = height
+        self.renderContext = RenderContext()
 
     width = 2000
     height = 2000
 
-    renList = []
-
     canvas_source = vtk.vtkImageCanvasSource2D()
     canvas_source.SetExtent(0, width-1, 0, height-1, 0, 0)
     canvas_source.SetScalarTypeToUnsignedChar()
@@ -24,178 +130,216 @@ class ImageProcessor():
     canvas_source.FillBox(0, width-1, 0, height-1)
     canvas_source.Update()
 
+    # the product of two uint8 values as computed by the former float multiplication, indexed by a << 8 | b
+    multiplyTable = (np.outer(np.arange(256) / 255, np.arange(256) / 255) * 255).astype(np.uint8).ravel()
+    # pixels multiplied at once, bounds the temporary index arrays
+    multiplyChunk = 1 << 16
+    # rows of the png images processed at once by brightenMultiplyFiles
+    tileRows = 64
+
     #Main method to muliply structures
     def multiplyingActors(self,dethPeeling,filter,brightBool,actorList,camera,height,width,occlusion,numberOfPeels):
 
-        self.renList.clear()
+        #render every actor on its own with the reused offscreen render context
+        self.renderContext.setUp(camera,height,width,dethPeeling,occlusion,numberOfPeels)
+        images = self.renderContext.renderLayers(actorList)
 
-        #render every actor in an own renderer window
-        for a in actorList:
-
-            ren, iren, renWin, wti = util.getbufferRenIntWin(camera,height,width)
-            renWin.SetOffScreenRendering(True)
-            self.renList.append([ren, iren, renWin, wti])
-
-            if dethPeeling:
-                ren.SetUseDepthPeeling(True)
-                ren.SetOcclusionRatio(occlusion)
-                ren.SetMaximumNumberOfPeels(numberOfPeels)
-            else:
-                ren.SetUseDepthPeeling(False)
-
-            ren.AddActor(a)
-            renWin.Render()
-            wti.Update()
-
-        #if only one actor
-        if len(actorList) == 1:
-            result = self.renList[0][3].GetOutput()
-            if brightBool:
-                result = self.optimizedBrighten(result,self.width,self.height,"0")
-
-        elif len(actorList) >= 2:
-            #first two actors
-            image = self.renList[0][3].GetOutput()
-            image2 = self.renList[1][3].GetOutput()
-            if brightBool:
-                image = self.optimizedBrighten(image,self.width,self.height,"0")
-                image2 = self.optimizedBrighten(image2,self.width,self.height,"1")
-
-            result = self.normalizeMultiplication(image,image2,self.width,self.height).GetOutput()
-
-            #the rest
-            i = 0
-            for a in actorList[2:]:
-                img = result
-                img2 = self.renList[2+i][3].GetOutput()
-                if brightBool:
-                    img2 = self.optimizedBrighten(img2,self.width,self.height,"2")
-                result = self.normalizeMultiplication(img, img2,self.width,self.height).GetOutput()
-                i = i + 1
+        if brightBool:
+            images = [self.optimizedBrighten(image,self.width,self.height,str(i)) for i, image in enumerate(images)]
 
         if filter:
-            img = result
-            img2 = self.canvas_source.GetOutput()
-            result = self.normalizeMultiplication(img, img2,self.width,self.height).GetOutput()
+            images.append(self.canvas_source.GetOutput())
 
-        return result
+        #if only one image
+        if len(images) == 1:
+            return images[0]
+        return self.multiplyImages(images,self.width,self.height)
 
     #method carrying out the normalization and multiplication of the structurs
-    def normalizeMultiplication(self, image, image2, width, height):
-
-        img1 = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())[:, 0:3]
-        img2 = numpy_support.vtk_to_numpy(image2.GetPointData().GetScalars())[:, 0:3]
-
-        img1.astype(float)
-        img2.astype(float)
-
-        img1 = np.reshape(np.ravel(img1), (height, width, 3))
-        img2 = np.reshape(np.ravel(img2), (height, width, 3))
-
-        img1 = img1 / 255
-        img2 = img2 / 255
-
-        result = (img1 * img2)
-
-        result = result * 255
-
-        resultImg = vtk.vtkImageData()
-
-        dy, dx, dz = result.shape
-
-        vtkResult = numpy_support.numpy_to_vtk(result.reshape(dy * dx, dz))
-
-        resultImg.SetSpacing(1., 1., 1.)
-        resultImg.SetOrigin(0., 0., 0.)
-        resultImg.SetDimensions(dx, dy, 1)
-        resultImg.AllocateScalars(numpy_support.get_vtk_array_type(result.dtype), dz)
-        resultImg.GetPointData().SetScalars(vtkResult)
-
-        castFilter = vtk.vtkImageCast()
-        castFilter.SetInputData(resultImg)
-        castFilter.SetOutputScalarTypeToUnsignedChar()
-        castFilter.Update()
-
-        return castFilter
+    def multiplyImages(self, images, width, height):
+        '''
+        Multiplies all images in one pass over chunks of pixels on uint8, the normalized product of each step is looked
+        up in multiplyTable, so the result is identical to multiplying the normalized images pairwise in float
+        and casting to uint8.
+        :param images: list of vtkImageData with uint8 scalars of at least 3 components.
+        :param width:
+        :param height:
+        :return: vtkImageData viewing the uint8 result without copy.
+        '''
+        layers = [imageBuffer.toPixels(image) for image in images]
+
+        result = np.array(layers[0], dtype=np.uint8)
+        self.multiplyPixels(result, layers[1:])
+        return imageBuffer.fromNumpy(result.reshape(height, width, 3))
+
+    def multiplyPixels(self, result, layers):
+        '''
+        Multiplies the layers into the result in place, chunk by chunk.
+        :param result: (n, 3) uint8 array.
+        :param layers: list of (n, 3) uint8 arrays.
+        :return:
+        '''
+        index = np.empty((min(self.multiplyChunk, len(result)), 3), dtype=np.uint16)
+        for start in range(0, len(result), self.multiplyChunk):
+            chunk = result[start:start + self.multiplyChunk]
+            chunkIndex = index[:len(chunk)]
+            for layer in layers:
+                chunkIndex[...] = chunk
+                chunkIndex <<= 8
+                chunkIndex |= layer[start:start + self.multiplyChunk]
+                np.take(self.multiplyTable, chunkIndex, out=chunk, mode='clip')
+
+    def brightenMultiplyFiles(self, paths, outPath):
+        '''
+        Brightens the png images and multiplies them into one png like optimizedBrighten and multiplyImages,
+        streamed in tiles of tileRows rows so only a tile of every image is in memory at once.
+        The first pass sums the channels of every image to select the brightened channels like brightenChannels,
+        the second pass brightens and multiplies the tiles and writes the result tile by tile.
+        :param paths: the png images, all of the same size.
+        :param outPath: the png to write.
+        :return:
+        '''
+        channels = []
+        for path in paths:
+            with PngRowReader(path) as reader:
+                sums = np.zeros(3, dtype=np.int64)
+                for start in range(0, reader.height, self.tileRows):
+                    tile = reader.readRows(self.tileRows)
+                    sums += tile[:, :, 0:3].sum(axis=(0, 1), dtype=np.int64)
+                channels.append(self.selectBrightenChannels(sums))
+
+        readers = []
+        try:
+            for path in paths:
+                readers.append(PngRowReader(path))
+            width, height = readers[0].width, readers[0].height
+            if any((reader.width, reader.height) != (width, height) for reader in readers):
+                raise Exception("The images to multiply differ in size")
+
+            result = np.empty((self.tileRows * width, 3), dtype=np.uint8)
+            layer = np.empty_like(result)
+            with PngRowWriter(outPath, width, height) as writer:
+                for start in range(0, height, self.tileRows):
+                    rows = min(self.tileRows, height - start)
+                    tileResult = result[:rows * width]
+                    tileLayer = layer[:rows * width]
+                    for i, reader in enumerate(readers):
+                        pixels = reader.readRows(rows)[:, :, 0:3].reshape(rows * width, 3)
+                        self.brightenPixels(pixels, channels[i], tileResult if i == 0 else tileLayer)
+                        if i > 0:
+                            self.multiplyPixels(tileResult, [tileLayer])
+                    writer.writeRows(tileResult.reshape(rows, width, 3))
+        finally:
+            for reader in readers:
+                reader.close()
+
+    # sums of the three uint8 channels: above brightenWhite pixels become white, up to brightenBlack black
+    # in the brightened channel, equal to the former thresholds 2.0 and 1.1 on the normalized sums
+    brightenWhite = 510
+    brightenBlack = 280
+    # the brightened channel of a pixel as the former float computation cast by vtkImageCast produced it,
+    # looked up in brightenTable at c * len(brightenPairs) + brightenPairs[o1 << 8 | o2] for the brightened channel c
+    # and the other channels o1 and o2. The other channels of every pixel become 255.
+    brightenPairs, brightenTable = createBrightenTables(brightenWhite, brightenBlack)
+    # pixels brightened at once, bounds the temporary arrays
+    brightenChunk = 1 << 16
 
     def optimizedBrighten(self,image,width,height,name = "0"):
-
-        img1 = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())[:, 0:3]
-
-        img1.astype(float)
-
-        img1 = np.reshape(np.ravel(img1), (width, height, 3))
+        '''
+        Brightens the pixels of a rendering towards the dominant color of the image, pixel identical to the former
+        float implementation. The channel with the smallest mean is brightened, its new value is looked up
+        in brightenTable chunk by chunk.
+        :param image: vtkImageData with uint8 scalars of at least 3 components.
+        :param width:
+        :param height:
+        :param name:
+        :return: vtkImageData viewing the uint8 result without copy.
+        '''
+        img1 = imageBuffer.toPixels(image).reshape(width, height, 3)
 
         if img1.shape[0] < height:
             dif = height - img1.shape[0]
-            arr = np.full((dif,img1.shape[1],3),255)
+            arr = np.full((dif,img1.shape[1],3),255,dtype=np.uint8)
             img1 = np.vstack((arr,img1))
 
         if img1.shape[1] < width:
             dif = width - img1.shape[1]
-            arr = np.full((img1.shape[0],dif,3),255)
+            arr = np.full((img1.shape[0],dif,3),255,dtype=np.uint8)
             img1 = np.hstack((img1,arr))
 
         if img1.shape[0] > height or img1.shape[1] > width:
             im = Image.fromarray(img1)
             img1 = np.asarray(im.resize((width,height)))
 
-        img1 = img1 / 255
-
-        averagePixelRed = np.mean(img1[:,:,0])
-        averagePixelGreen = np.mean(img1[:,:,1])
-        averagePixelBlue = np.mean(img1[:,:,2])
-
-        x = img1[:,:,0] + img1[:,:,1] + img1[:,:,2]
-
-        white = np.where(x>2.0)
-        black = np.where(x<=1.1)
-        #colored = np.where(np.logical_and(x>1.0,x<2.0))
-        colored = np.where(x<=2.0)
-
-        if averagePixelBlue > averagePixelGreen and averagePixelRed > averagePixelGreen:
-            img1[colored[0],colored[1],1] = img1[colored[0],colored[1],1] + (((img1[colored[0],colored[1],0]+img1[colored[0],colored[1],2])*0.48))
-            img1[colored[0],colored[1],0] = 1.0
-            img1[colored[0],colored[1],2] = 1.0
-
-            img1[black[0],black[1],0] = 1.0
-            img1[black[0],black[1],1] = 0.0
-            img1[black[0],black[1],2] = 1.0
-        if averagePixelGreen > averagePixelBlue and averagePixelRed > averagePixelBlue:
-            img1[colored[0],colored[1],2] = img1[colored[0],colored[1],2] + (((img1[colored[0],colored[1],0]+img1[colored[0],colored[1],1])*0.48))
-            img1[colored[0],colored[1],1] = 1.0
-            img1[colored[0],colored[1],0] = 1.0
-
-            img1[black[0],black[1],0] = 1.0
-            img1[black[0],black[1],1] = 1.0
-            img1[black[0],black[1],2] = 0.0
-        if averagePixelGreen > averagePixelRed and averagePixelBlue > averagePixelRed:
-            img1[colored[0],colored[1],0] = img1[colored[0],colored[1],0] + (((img1[colored[0],colored[1],2]+img1[colored[0],colored[1],1])*0.48))
-            img1[colored[0],colored[1],1] = 1.0
-            img1[colored[0],colored[1],2] = 1.0
-
-            img1[black[0],black[1],0] = 0.0
-            img1[black[0],black[1],1] = 1.0
-            img1[black[0],black[1],2] = 1.0
-        img1[white[0], white[1], :] = 1.0
-
-        img1 = img1 * 255
-
-        resultImg = vtk.vtkImageData()
-
         dy, dx, dz = img1.shape
-
-        vtkResult = numpy_support.numpy_to_vtk(img1.reshape(dy * dx, dz))
-
-        resultImg.SetSpacing(1., 1., 1.)
-        resultImg.SetOrigin(0., 0., 0.)
-        resultImg.SetDimensions(dx, dy, 1)
-        resultImg.AllocateScalars(numpy_support.get_vtk_array_type(img1.dtype), dz)
-        resultImg.GetPointData().SetScalars(vtkResult)
-
-        castFilter = vtk.vtkImageCast()
-        castFilter.SetInputData(resultImg)
-        castFilter.SetOutputScalarTypeToUnsignedChar()
-        castFilter.Update()
-
-        return castFilter.GetOutput()
\ No newline at end of file
+        pixels = img1.reshape(dy * dx, dz)
+        result = np.empty((dy * dx, 3), dtype=np.uint8)
+
+        channels = self.brightenChannels(img1)
+        self.brightenPixels(pixels, channels, result)
+        return imageBuffer.fromNumpy(result.reshape(dy, dx, 3))
+
+    def brightenPixels(self, pixels, channels, result):
+        '''
+        Brightens the pixels chunk by chunk.
+        :param pixels: (n, 3) uint8 array.
+        :param channels: the channels returned by brightenChannels for the whole image.
+        :param result: (n, 3) uint8 array receiving the brightened pixels.
+        :return:
+        '''
+        chunkSize = min(self.brightenChunk, len(pixels))
+        if channels is None:
+            # no dominant color, only the white pixels change
+            sums = np.empty(chunkSize, dtype=np.uint16)
+            for start in range(0, len(pixels), self.brightenChunk):
+                chunk = pixels[start:start + self.brightenChunk]
+                out = result[start:start + self.brightenChunk]
+                chunkSums = sums[:len(chunk)]
+                np.add(chunk[:, 0], chunk[:, 1], out=chunkSums, dtype=np.uint16)
+                chunkSums += chunk[:, 2]
+                out[...] = chunk
+                out[chunkSums > self.brightenWhite] = 255
+            return
+
+        channel, other1, other2 = channels
+        numberOfPairs = self.brightenTable.shape[1]
+        table = self.brightenTable.ravel()
+        pairIndex = np.empty(chunkSize, dtype=np.uint16)
+        index = np.empty(chunkSize, dtype=np.uint32)
+        result.fill(255)
+        for start in range(0, len(pixels), self.brightenChunk):
+            chunk = pixels[start:start + self.brightenChunk]
+            chunkPairIndex = pairIndex[:len(chunk)]
+            chunkIndex = index[:len(chunk)]
+            chunkPairIndex[...] = chunk[:, other1]
+            chunkPairIndex <<= 8
+            chunkPairIndex |= chunk[:, other2]
+            np.multiply(chunk[:, channel], numberOfPairs, out=chunkIndex, dtype=np.uint32)
+            chunkIndex += self.brightenPairs.take(chunkPairIndex)
+            result[start:start + self.brightenChunk, channel] = table.take(chunkIndex)
+
+    def brightenChannels(self, img1):
+        '''
+        :param img1: (height, width, 3) uint8 array.
+        :return: the channels selected by selectBrightenChannels from the channel sums of the image.
+        '''
+        return self.selectBrightenChannels(img1[:, :, 0:3].sum(axis=(0, 1), dtype=np.int64))
+
+    def selectBrightenChannels(self, sums):
+        '''
+        Selects the channel with the smallest mean, compared exactly on the integer channel sums of the whole image,
+        so the tiled sums of brightenMultiplyFiles select the same channels. Equal sums are equal, unlike the float
+        means of the former implementation, which told them apart only by rounding.
+        :param sums: the integer sums of the red, green and blue channel.
+        :return: the channel to brighten and the two other channels,
+        None if no channel sum is strictly smaller than the others.
+        '''
+        red, green, blue = (int(s) for s in sums)
+
+        if blue > green and red > green:
+            return 1, 0, 2
+        if green > blue and red > blue:
+            return 2, 0, 1
+        if green > red and blue > red:
+            return 0, 2, 1
+        return None
@@ -2,6 +2,7 @@ import vtkmodules.all as vtk
 import sys
 from PyQt5 import QtWidgets, QtCore
 import organizer
+import util
 import os
 from projectionStructure import ProjectionStructure
 import random
@@ -666,6 +667,13 @@ if __name__ == '__main__':
     # Set the exception hook to our wrapping function
     sys.excepthook = my_exception_hook
 
+    def showMessageBox(text):
+        msgBox = QtWidgets.QMessageBox()
+        msgBox.setText(text)
+        msgBox.exec()
+
+    util.messageHandler = showMessageBox
+
     try:
         app = QtWidgets.QApplication(sys.argv)
         window = SimpleView()
@@ -1,11 +1,16 @@
 import vtkmodules.all as vtk
 import numpy as np
 import os
+import shutil
+import tempfile
+import time
+import queue
+import multiprocessing
+from vtkmodules.numpy_interface.dataset_adapter import numpy_support
 from projectionStructure import ProjectionStructure
 import util
+from diskCache import DiskCache
 from boolean import boolean_interface
-from mu3d.mu3dpy.mu3d import Graph
-from PyQt5 import QtWidgets
 
 class MeshProcessing():
     '''
@@ -16,38 +21,165 @@ class MeshProcessing():
 
     tempPaperActor = vtk.vtkActor()
 
+    unfoldCache = DiskCache(os.path.join(dirname, "../out/cache/unfold"))
+
+    # seeds tried by mu3dUnfoldSeeds() for every mesh, and the wall clock budget in seconds of each mesh,
+    # None waits for every seed
+    unfoldSeeds = [0, 1, 2, 3]
+    unfoldTimeBudget = None
+    # indices of the meshes of the last mu3dUnfoldSeeds() that ran out of time without a successful seed
+    timedOutMeshes = []
+
     #meshInteractor = meshInteraction.MeshInteraction(dedicatedPaperMeshes)
 
-    def mu3dUnfoldPaperMesh(self, mesh, graph, iterations):
+    @staticmethod
+    def createGraph():
+        '''
+        Imports the mu3d wrapper only when a mesh is unfolded, so the other modules work without the mu3d submodule.
+        :return: a new wrapped mu3d graph object.
+        '''
+        from mu3d.mu3dpy.mu3d import Graph
+        return Graph()
+
+    def mu3dUnfoldPaperMesh(self, mesh, graph, iterations, writeFiles = False):
         '''
         Forwards the mesh to the mu3d wrapper to unfold it.
         :param actor: The vtk actor containing the mesh to unfold.
-        :param graph: The wrapped mu3d graph object.
+        :param graph: The wrapped mu3d graph object, if None the seeds of unfoldSeeds are tried in worker processes.
         :param iterations: The iterations for the unfolding.
+        :param writeFiles: If true the unfolded mesh and the glue tabs are written to out/3D/unfolded/.
         :return: If the unfolding is successful the vtk actor containing the unfolded mesh is returned.
         '''
-        inpath = os.path.join(self.dirname, "../out/3D/papermesh.stl")
-        outpath = os.path.join(self.dirname, "../out/3D/papermesh.off")
-        util.writeStl(mesh,"papermesh")
+        points, triangles = util.polyDataToArrays(mesh)
+        if graph is None:
+            unfolded = self.mu3dUnfoldSeeds([(points, triangles)], iterations)[0]
+            return self.createUnfoldedActor(unfolded, iterations, writeFiles, timedOut=bool(self.timedOutMeshes))
+        unfolded = self.mu3dUnfold(points, triangles, graph, iterations)
+        return self.createUnfoldedActor(unfolded, iterations, writeFiles)
+
+    def mu3dUnfoldParallel(self, meshes, iterations, seed = 0, workers = None):
+        '''
+        Unfolds triangle meshes given as arrays in parallel worker processes, each mesh with the one seed
+        and without a time limit, like mu3dUnfold() one after the other.
+        :param meshes: list of (points, triangles) arrays.
+        :param iterations: The iterations for the unfolding.
+        :param seed: The seed for the unfolding of every mesh.
+        :param workers: the number of worker processes, None uses one per cpu.
+        :return: per mesh the arrays returned by mu3dUnfold(), None if the unfolding failed.
+        '''
+        pool = multiprocessing.Pool(workers)
+        try:
+            return pool.map(unfoldMeshWorker, [(points, triangles, iterations, seed) for points, triangles in meshes])
+        finally:
+            pool.terminate()
 
-        util.meshioIO(inpath,outpath)
+    def mu3dUnfoldSeeds(self, meshes, iterations, seeds = None, timeBudget = None, workers = None):
+        '''
+        Unfolds triangle meshes given as arrays with several seeds each in parallel worker processes.
+        The first seed of every mesh is started first. For every mesh the unfolding of the first seed in the order of
+        seeds that succeeds within the time budget is kept, so the result does not depend on which worker finishes
+        first. A seed that raises counts as failed. Seeds after a successful one are skipped.
+        The time budget of a mesh starts with its first seed. Once it is used up, the remaining seeds of the mesh
+        are skipped and the seeds still running count as failed, the meshes left without an unfolding are reported
+        in timedOutMeshes. Once every mesh is decided the workers are terminated.
+        :param meshes: list of (points, triangles) arrays.
+        :param iterations: The iterations for the unfolding.
+        :param seeds: the seeds to try for every mesh, by default unfoldSeeds.
+        :param timeBudget: the wall clock budget in seconds of each mesh, by default unfoldTimeBudget.
+        None waits for every seed.
+        :param workers: the number of worker processes, None uses one per cpu.
+        :return: per mesh the arrays returned by mu3dUnfold(), None if no seed succeeded in time.
+        '''
+        seeds = self.unfoldSeeds if seeds is None else seeds
+        timeBudget = self.unfoldTimeBudget if timeBudget is None else timeBudget
+
+        # per mesh and seed the unfolding, False if the seed failed and None while it is running
+        outcomes = [[None] * len(seeds) for mesh in meshes]
+        decided = [False] * len(meshes)
+        timedOut = []
+        finished = queue.Queue()
+        # per mesh the index of the first seed that succeeded so far, the workers skip the seeds after it
+        firstSuccess = multiprocessing.Array('i', [len(seeds)] * len(meshes))
+        # per mesh the time its first seed started, 0 before
+        startTimes = multiprocessing.Array('d', [0.0] * len(meshes))
+        pool = multiprocessing.Pool(workers, initializer=initUnfoldWorker, initargs=(firstSuccess, startTimes))
+        try:
+            for s, seed in enumerate(seeds):
+                for idx, (points, triangles) in enumerate(meshes):
+                    pool.apply_async(unfoldWorker, ((idx, points, triangles, iterations, s, seed),),
+                                     callback=lambda result, idx=idx, s=s: finished.put((idx, s, result)),
+                                     error_callback=lambda error, idx=idx, s=s: finished.put((idx, s, error)))
+
+            pending = len(seeds) * len(meshes)
+            while pending and not all(decided):
+                timeout = None
+                if timeBudget is not None:
+                    started = [startTimes[idx] for idx in range(len(meshes)) if not decided[idx] and startTimes[idx]]
+                    timeout = max(min(started) + timeBudget - time.time(), 0.0) if started else timeBudget
+                try:
+                    idx, s, result = finished.get(timeout=timeout)
+                except queue.Empty:
+                    for idx in range(len(meshes)):
+                        if not decided[idx] and startTimes[idx] and startTimes[idx] + timeBudget <= time.time():
+                            print("unfolding of mesh {} stopped after the time budget of {}s".format(idx, timeBudget))
+                            decided[idx] = True
+                            timedOut.append(idx)
+                            firstSuccess[idx] = -1
+                    continue
+                pending -= 1
+                if decided[idx]:
+                    continue
+                if isinstance(result, Exception):
+                    print("unfolding with seed {} failed: {}".format(seeds[s], result))
+                    result = None
+
+                outcomes[idx][s] = False if result is None else result
+                if result is not None and s < firstSuccess[idx]:
+                    firstSuccess[idx] = s
+                decided[idx] = self.firstSuccessfulSeed(outcomes[idx])[0]
+        finally:
+            pool.terminate()
+
+        results = [self.firstSuccessfulSeed(meshOutcomes, final=True)[1] for meshOutcomes in outcomes]
+        self.timedOutMeshes = [idx for idx in timedOut if results[idx] is None]
+        return results
 
-        graph.load(outpath)
-        if not graph.unfold(iterations, 0):
-            msgBox = QtWidgets.QMessageBox()
-            msgBox.setText("failed to unfold :( in {} iterations".format(iterations))
-            msgBox.exec()
+    @staticmethod
+    def firstSuccessfulSeed(outcomes, final = False):
+        '''
+        :param outcomes: per seed the unfolding, False if the seed failed and None while it is running.
+        :param final: if true the seeds still running count as failed.
+        :return: whether the choice is decided and the unfolding of the first successful seed,
+        None if no seed succeeded.
+        '''
+        for outcome in outcomes:
+            if outcome is None and not final:
+                return False, None
+            if outcome is not None and outcome is not False:
+                return True, outcome
+        return True, None
+
+    def createUnfoldedActor(self, unfolded, iterations, writeFiles = False, timedOut = False):
+        '''
+        Creates the actor of an unfolding with normalized uvs.
+        :param unfolded: the arrays returned by mu3dUnfold(), None if the unfolding failed.
+        :param iterations: The iterations of the unfolding, for the messages.
+        :param writeFiles: If true the unfolded mesh and the glue tabs are written to out/3D/unfolded/.
+        :param timedOut: If true the unfolding failed since the time budget was used up, for the messages.
+        :return: If the unfolding is successful the vtk actor containing the unfolded mesh is returned.
+        '''
+        if unfolded is None and timedOut:
+            util.showMessage("failed to unfold :( within the time budget in {} iterations".format(iterations))
+            return None
+        elif unfolded is None:
+            util.showMessage("failed to unfold :( in {} iterations".format(iterations))
             return None
         else:
             print("succesfully unfolded :) in {} iterations".format(iterations))
 
-            filename = os.path.join(self.dirname, "../out/3D/unfolded/model.obj")
-            gluetabs_filename = os.path.join(self.dirname, "../out/3D/unfolded/gluetabs.obj")
-
-            graph.save(filename, gluetabs_filename)
-
-            filename = os.path.join(self.dirname, "../out/3D/unfolded/model.obj")
-            mesh = util.readObj(filename)
+            points, triangles, uvs, gluePoints, glueTriangles = unfolded
+            mesh = util.arraysToPolyData(points, triangles)
+            mesh.GetPointData().SetTCoords(numpy_support.numpy_to_vtk(uvs, deep=1))
             mesh = self.normalizeUV(mesh)
             mesh = self.calcMeshNormals(mesh)
 
@@ -60,10 +192,63 @@ class MeshProcessing():
             actor.GetProperty().BackfaceCullingOn()
             actor.GetProperty().SetOpacity(0.5)
 
-            #just to write the model with normalized uvs
-            util.writeObj(actor.GetMapper().GetInput(), "unfolded/model")
+            if writeFiles:
+                #just to write the model with normalized uvs
+                util.writeObj(actor.GetMapper().GetInput(), "unfolded/model")
+                util.writeObj(util.arraysToPolyData(gluePoints, glueTriangles), "unfolded/gluetabs")
             return actor
 
+    def mu3dUnfold(self, points, triangles, graph, iterations, seed = 0):
+        '''
+        Unfolds a triangle mesh given as arrays with mu3d.
+        The mu3d wrapper only loads and saves meshes by path, it does not take or return them in memory. So the mesh
+        still goes to mu3d as a .off written from the arrays and comes back as .obj files parsed into arrays,
+        both in a scratch directory that is removed afterwards. Only the former .stl and its conversion to .off are skipped.
+        Successful unfoldings are cached on the disk by the geometry, the iterations and the seed,
+        so unchanged papermeshes are not unfolded again.
+        :param points: (n, 3) float array.
+        :param triangles: (m, 3) int array of point ids.
+        :param graph: The wrapped mu3d graph object.
+        :param iterations: The iterations for the unfolding.
+        :param seed: The seed for the unfolding.
+        :return: the unfolded points, triangles and uvs and the glue tab points and triangles as arrays,
+        or None if the unfolding failed.
+        '''
+        # one vertex per position, as the former stl -> off conversion produced it
+        vertices, ids = np.unique(points[triangles].reshape(-1, 3), axis=0, return_inverse=True)
+        ids = ids.reshape(-1, 3)
+
+        key = DiskCache.createKey(parameters={"iterations": iterations, "seed": seed}, arrays=[vertices, ids])
+        cached = self.unfoldCache.getArrays(key)
+        if cached is not None:
+            print("unfolding loaded from cache")
+            return cached["points"], cached["triangles"], cached["uvs"], cached["gluePoints"], cached["glueTriangles"]
+
+        scratch = tempfile.mkdtemp(prefix="mu3d")
+        try:
+            offPath = os.path.join(scratch, "papermesh.off")
+            util.writeOff(vertices, ids, offPath)
+
+            graph.load(offPath)
+            if not graph.unfold(iterations, seed):
+                return None
+
+            filename = os.path.join(scratch, "model.obj")
+            gluetabs_filename = os.path.join(scratch, "gluetabs.obj")
+            graph.save(filename, gluetabs_filename)
+
+            unfoldedPoints, unfoldedTriangles, uvs = util.readObjArrays(filename)
+            if os.path.exists(gluetabs_filename):
+                gluePoints, glueTriangles, glueUVs = util.readObjArrays(gluetabs_filename)
+            else:
+                gluePoints, glueTriangles = np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        self.unfoldCache.putArrays(key, {"points": unfoldedPoints, "triangles": unfoldedTriangles, "uvs": uvs,
+                                         "gluePoints": gluePoints, "glueTriangles": glueTriangles})
+        return unfoldedPoints, unfoldedTriangles, uvs, gluePoints, glueTriangles
+
     def createDedicatedMeshes(self, hierarchy):
         '''
         For each loaded structure in the given hierarchical mesh create a projection mesh depending on the chosen projection method for this structure.
@@ -124,71 +309,53 @@ class MeshProcessing():
 
         mesh = self.shiftUVsToOrigin(mesh)
 
-        textureCoordinates = mesh.GetPointData().GetTCoords()
-        newTCoords = vtk.vtkFloatArray()
-        newTCoords.SetNumberOfComponents(2)
-
-        gmin, gmax = self.getMinMaxUV(mesh)
+        uvs = self.getCellUVs(mesh)
+        gmin, gmax = self.minMaxOfUVs(uvs)
 
         # Normalize the uvs.
-        for i in range(int(textureCoordinates.GetNumberOfTuples() / 3)):
-            for j in range(3):
-                u = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[0])-gmin) / (gmax-gmin)
-                v = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[1])-gmin) / (gmax-gmin)
-                newTCoords.InsertNextTuple2(u, v)
+        newTCoords = ((uvs - gmin) / (gmax - gmin)).reshape(-1, 2).astype(np.float32)
 
-        mesh.GetPointData().SetTCoords(newTCoords)
+        mesh.GetPointData().SetTCoords(numpy_support.numpy_to_vtk(newTCoords, deep=1))
         return mesh
 
-    def getMinMaxUV(self,mesh, axis = False):
+    def getCellUVs(self,mesh):
         '''
-        Helper method for normalizeUVs and shiftUVsToOrigin.
+        Helper method for normalizeUVs, shiftUVsToOrigin and getMinMaxUV.
+        Gathers the uvs of the corners of the first (number of uvs / 3) triangles.
         :param mesh:
+        :return: the uvs as (n, 3, 2) array.
+        '''
+        textureCoordinates = numpy_support.vtk_to_numpy(mesh.GetPointData().GetTCoords()).astype(np.float64)
+        numberOfCells = len(textureCoordinates) // 3
+        pointIds = util.polyDataTriangles(mesh)[:numberOfCells]
+        return textureCoordinates[pointIds]
+
+    def minMaxOfUVs(self,uvs, axis = False):
+        '''
+        Helper method for getMinMaxUV, the bounds always include the origin.
+        :param uvs: the uvs as (n, 3, 2) array.
         :param axis:
         :return: Depending on axis, either the min and max of the UVs for each axis,
         or the global min and max.
         '''
-        textureCoordinates = mesh.GetPointData().GetTCoords()
-
         if(axis):
-            uMax = 0
-            uMin = 0
-            vMax = 0
-            vMin = 0
-
-            for i in range(int(textureCoordinates.GetNumberOfTuples() / 3)):
-                uvs = [[0.0, 0.0], [0.0, 0.0], [0.0, 0.0]]
-                textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(0), uvs[0])
-                textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(1), uvs[1])
-                textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(2), uvs[2])
-
-                umax = np.amax(np.array(uvs)[:,0])
-                umin = np.amin(np.array(uvs)[:,0])
-                vmax = np.amax(np.array(uvs)[:,1])
-                vmin = np.amin(np.array(uvs)[:,1])
-
-                if umax > uMax: uMax = umax
-                if umin < uMin: uMin = umin
-                if vmax > vMax: vMax = vmax
-                if vmin < vMin: vMin = vmin
-
+            uMin = float(np.min(uvs[:, :, 0], initial=0.0))
+            uMax = float(np.max(uvs[:, :, 0], initial=0.0))
+            vMin = float(np.min(uvs[:, :, 1], initial=0.0))
+            vMax = float(np.max(uvs[:, :, 1], initial=0.0))
             return uMin,uMax,vMin,vMax
-
         else:
-            gmax = 0.0
-            gmin = 0.0
-            for i in range(int(textureCoordinates.GetNumberOfTuples() / 3)):
-                uvs = [[0.0, 0.0], [0.0, 0.0], [0.0, 0.0]]
-                textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(0), uvs[0])
-                textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(1), uvs[1])
-                textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(2), uvs[2])
+            return float(np.min(uvs, initial=0.0)), float(np.max(uvs, initial=0.0))
 
-                max = np.amax(np.array(uvs))
-                min = np.amin(np.array(uvs))
-                if max > gmax: gmax = max
-                if min < gmin: gmin = min
-
-            return gmin, gmax
+    def getMinMaxUV(self,mesh, axis = False):
+        '''
+        Helper method for normalizeUVs and shiftUVsToOrigin.
+        :param mesh:
+        :param axis:
+        :return: Depending on axis, either the min and max of the UVs for each axis,
+        or the global min and max.
+        '''
+        return self.minMaxOfUVs(self.getCellUVs(mesh), axis)
 
     def shiftUVsToOrigin(self,mesh):
         '''
@@ -197,25 +364,12 @@ class MeshProcessing():
         :param mesh:
         :return:
         '''
-        uMin, uMax, vMin, vMax = self.getMinMaxUV(mesh, axis=True)
-        textureCoordinates = mesh.GetPointData().GetTCoords()
-        newTCoords = vtk.vtkFloatArray()
-        newTCoords.SetNumberOfComponents(2)
-
-        for i in range(int(textureCoordinates.GetNumberOfTuples() / 3)):
-            for j in range(3):
-                if uMin > 0:
-                    u = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[0]) - uMin)
-                else:
-                    u = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[0]) + abs(uMin))
-
-                if vMin > 0:
-                    v = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[1]) - vMin)
-                else:
-                    v = ((textureCoordinates.GetTuple2((mesh.GetCell(i).GetPointId(j)))[1]) + abs(vMin))
-                newTCoords.InsertNextTuple2(u, v)
-
-        mesh.GetPointData().SetTCoords(newTCoords)
+        uvs = self.getCellUVs(mesh)
+        uMin, uMax, vMin, vMax = self.minMaxOfUVs(uvs, axis=True)
+
+        newTCoords = (uvs - [uMin, vMin]).reshape(-1, 2).astype(np.float32)
+
+        mesh.GetPointData().SetTCoords(numpy_support.numpy_to_vtk(newTCoords, deep=1))
         return mesh
 
     def calcMeshNormals(self,polydata):
@@ -293,7 +447,7 @@ class MeshProcessing():
 
         bool = boolean_interface.Boolean_Interface()
         bool.boolean(mesh, cutout)
-        graph = Graph()
+        graph = self.createGraph()
         filename = os.path.join(self.dirname, "difference.off")
         graph.load(filename)
         #todo use iterations from ui
@@ -318,7 +472,7 @@ class MeshProcessing():
         outpath = os.path.join(self.dirname, "../out/3D/papermesh.off")
         util.meshioIO(inpath,outpath)
 
-        graph = Graph()
+        graph = self.createGraph()
         graph.load(outpath)
         if not graph.unfold(50000, 0):
             print("failed to unfold :(")
@@ -328,3 +482,42 @@ class MeshProcessing():
             gluetabs_filename = os.path.join(self.dirname, "../out/3D/unfolded/gluetabs_" + name + ".obj")
 
             graph.save(filename, gluetabs_filename)
+
+
+
+# per mesh the index of the first seed that succeeded so far, set by initUnfoldWorker() in the worker processes
+firstSuccessfulSeeds = None
+# per mesh the time its first seed started, set by initUnfoldWorker() in the worker processes
+unfoldStartTimes = None
+
+
+def unfoldMeshWorker(task):
+    '''
+    Unfolds a papermesh in a worker process of mu3dUnfoldParallel() with its own mu3d graph.
+    :param task: the points, triangles, iterations and seed of the unfolding.
+    :return: the arrays returned by mu3dUnfold(), None if the unfolding failed.
+    '''
+    points, triangles, iterations, seed = task
+    return MeshProcessing().mu3dUnfold(points, triangles, MeshProcessing.createGraph(), iterations, seed)
+
+
+def initUnfoldWorker(firstSuccess, startTimes):
+    global firstSuccessfulSeeds, unfoldStartTimes
+    firstSuccessfulSeeds = firstSuccess
+    unfoldStartTimes = startTimes
+
+
+def unfoldWorker(task):
+    '''
+    Unfolds a papermesh in a worker process with its own mu3d graph, unless an earlier seed already unfolded it
+    or its time budget is used up.
+    :param task: the mesh index, points, triangles, iterations and the index and value of the seed of the unfolding.
+    :return: the arrays returned by mu3dUnfold(), None if the unfolding failed or was skipped.
+    '''
+    idx, points, triangles, iterations, seedIndex, seed = task
+    if firstSuccessfulSeeds[idx] < seedIndex:
+        return None
+    with unfoldStartTimes.get_lock():
+        if not unfoldStartTimes[idx]:
+            unfoldStartTimes[idx] = time.time()
+    return MeshProcessing().mu3dUnfold(points, triangles, MeshProcessing.createGraph(), iterations, seed)
@@ -1,13 +1,14 @@
 import vtkmodules.all as vtk
 import os
 from meshProcessing import MeshProcessing
-from projector import Projector
+from projector import Projector, projectionWorker
 from imageProcessing import ImageProcessor
 import util
-from mu3d.mu3dpy.mu3d import Graph
+import imageBuffer
 from src.hierarchicalMesh import HierarchicalMesh
-from PyQt5 import QtWidgets
 import time
+import concurrent.futures
+import multiprocessing
 
 class Organizer():
     '''
@@ -37,6 +38,10 @@ class Organizer():
     filter = False
     sessionMultiplySaves = 0
 
+    # project the structures in a process pool, meant for headless runs like batch.py, None workers uses one per core.
+    parallelProjection = False
+    projectionWorkers = None
+
     fullViewport = [0.0, 0.0, 1.0, 1.0]
     noViewport = [0.0, 0.0, 0.0, 0.0]
 
@@ -44,6 +49,8 @@ class Organizer():
     resultRen.SetBackground(255.0, 255.0, 255.0)
     resultRen.ResetCamera()
     resultRen.InteractiveOff()
+    # the image actor showing the result of the multiplication, its input is replaced on every multiplication
+    resultImageActor = vtk.vtkImageActor()
 
     ctf = vtk.vtkColorTransferFunction()
     ctf.SetColorSpaceToHSV()
@@ -97,66 +104,35 @@ class Organizer():
         :param brighten:
         :return:
         '''
-        imageActor = vtk.vtkImageActor()
-
         #firsttime multiplication
         if not self.window.HasRenderer(self.resultRen):
             self.window.AddRenderer(self.resultRen)
+            self.resultRen.AddActor(self.resultImageActor)
 
-        self.resultRen.RemoveActor(imageActor)
         self.ren.SetViewport(self.noViewport)
         self.resultRen.SetViewport(self.fullViewport)
         result = self.imageProcessor.multiplyingActors(depthPeeling,filter,brighten,self.hierarchical_mesh_anchor.getAllMeshes(),self.camera,self.height,self.width,self.occlusion,self.numberOfPeels)
 
-        imageActor = vtk.vtkImageActor()
-        imageActor.GetMapper().SetInputData(result)
-        imageActor.Update()
+        self.resultImageActor.GetMapper().SetInputData(result)
+        self.resultImageActor.Update()
 
-        self.resultRen.AddActor(imageActor)
         self.resultRen.Render()
 
         filename = os.path.join(self.dirname, "../out/2D/multiply{}.png".format(self.sessionMultiplySaves))
-        util.writeImage(result,filename)
+        imageBuffer.writePng(result,filename)
 
         self.sessionMultiplySaves += 1
 
     def brightenMultiplication(self):
         '''
-        Multiplies the created unfolding images of the structures into a single unfolded texture.
+        Multiplies the created unfolding images of the structures into a single unfolded texture,
+        streamed in tiles of rows so the memory does not grow with the size of the images.
         :return:
         '''
-        reader = vtk.vtkPNGReader()
-        imgList=[]
-
-        for i in range(len(self.hierarchical_mesh_anchor.getAllMeshes())):
-
-            filename = os.path.join(self.dirname, "../out/2D/unfolding{}.png".format(i))
-
-            reader.SetFileName(filename)
-
-            castFilter = vtk.vtkImageCast()
-            castFilter.SetInputConnection(reader.GetOutputPort())
-            castFilter.SetOutputScalarTypeToUnsignedChar()
-            castFilter.Update()
-
-            imageDim = castFilter.GetOutput().GetDimensions()
-
-            width = imageDim[0]
-            height = imageDim[1]
-
-            imgList.append(self.imageProcessor.optimizedBrighten(castFilter.GetOutput(), width, height, str(i)))
-
-            if i == 1:
-                result = self.imageProcessor.normalizeMultiplication(imgList[i-1], imgList[i], width, height).GetOutput()
-            elif(i > 1):
-                resultCast = self.imageProcessor.normalizeMultiplication(result, imgList[i], width, height)
-
-        writer = vtk.vtkPNGWriter()
+        filenames = [os.path.join(self.dirname, "../out/2D/unfolding{}.png".format(i))
+                     for i in range(len(self.hierarchical_mesh_anchor.getAllMeshes()))]
         filename = os.path.join(self.dirname, "../out/2D/texture.png")
-
-        writer.SetFileName(filename)
-        writer.SetInputConnection(resultCast.GetOutputPort())
-        writer.Write()
+        self.imageProcessor.brightenMultiplyFiles(filenames, filename)
         self.finish()
     '''
     def addMesh(self, mesh, parent, childId):
@@ -207,12 +183,22 @@ class Organizer():
         self.hierarchical_mesh_anchor.add(newHierarchicalMesh)
         return newHierarchicalMesh
 
+    def addMeshes(self, meshLists):
+        '''
+        Adds several structures at once, each list of meshes becomes one hierarchical mesh.
+        :param meshLists: list of lists of ProjectionStructures.
+        :return: the new hierarchical meshes.
+        '''
+        newHierarchicalMeshes = [HierarchicalMesh(None,meshes,self.meshProcessor) for meshes in meshLists]
+        self.hierarchical_mesh_anchor.addAll(newHierarchicalMeshes)
+        return newHierarchicalMeshes
+
     def directImportPapermesh(self, mesh):
         hm = HierarchicalMesh(None,None,self.meshProcessor)
         hm.papermesh = mesh.getActor().GetMapper().GetInput()
         hm.mesh = mesh.getActor()
         hm.meshes.append(mesh)
-        hm.setName(hm.writePapermeshStlAndOff("Temp"))
+        hm.setLevelIdx("Temp")
         self.hierarchical_mesh_anchor.add(hm)
         return hm
 
@@ -275,20 +261,53 @@ class Organizer():
         resultMeshes = []
         idx = 0
         meshes = hierarchy.getAllMeshes(asActor=False)
+        if self.parallelProjection and len(meshes) > 1:
+            return self.projectParallel(meshes, resolution)
         for a in meshes:
             try:
                 #todo projection for whole hierarchy not just level one child one
                 if a.hierarchicalMesh.getLevel() > 1: raise Exception("Projection for nested meshes not implemented")
-                mesh = (self.projector.projectPerTriangle(a.projectionActor, a.getActor(), idx, resolution))
+                mesh = (self.projector.project(a.projectionActor, a.getActor(), idx, resolution))
                 resultMeshes.append(mesh)
                 self.projector.createUnfoldedPaperMesh(mesh, a.hierarchicalMesh.unfoldedActor, idx)
             except Exception as e:
-                msgBox = QtWidgets.QMessageBox()
-                msgBox.setText(str(e))
-                msgBox.exec()
+                util.showMessage(str(e))
             idx += 1
         return resultMeshes
 
+    def projectParallel(self, meshes, resolution):
+        '''
+        Projects each structure in its own worker process, every worker renders with its own offscreen render window.
+        The workers are spawned instead of forked, so they do not inherit the event loop or an OpenGL context.
+        The textures and unfolded paper meshes are created afterwards in the order of the structures.
+        :param meshes: the ProjectionStructure-objects to project.
+        :param resolution:
+        :return:
+        '''
+        resultMeshes = []
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(self.projectionWorkers, mp_context=context) as pool:
+            futures = []
+            for idx, a in enumerate(meshes):
+                #todo projection for whole hierarchy not just level one child one
+                if a.hierarchicalMesh.getLevel() > 1:
+                    futures.append(None)
+                    continue
+                task = self.projector.projectionTask(a.projectionActor, a.getActor(), idx, resolution)
+                futures.append(pool.submit(projectionWorker, task))
+
+            for idx, (a, future) in enumerate(zip(meshes, futures)):
+                try:
+                    if future is None: raise Exception("Projection for nested meshes not implemented")
+                    result = future.result()
+                    self.projector.renderStats[idx] = result.pop("renderStats")
+                    mesh = self.projector.createProjectedPaperMesh(result, idx)
+                    resultMeshes.append(mesh)
+                    self.projector.createUnfoldedPaperMesh(mesh, a.hierarchicalMesh.unfoldedActor, idx)
+                except Exception as e:
+                    util.showMessage(str(e))
+        return resultMeshes
+
     def projectPass(self,resolution = [500,500]):
         #todo projection for whole hierarchy not just level one child one
         self.ren.SetViewport([0.0, 0.0, 0.0, 0.0])
@@ -316,17 +335,12 @@ class Organizer():
         self.renderers[0].AddActor(hm.unfoldedActor)
 
         for actor in actors:
-            filename = os.path.join(self.dirname, "../out/2D/texture/texture{}.png".format(count))
-            readerFac = vtk.vtkImageReader2Factory()
-            imageReader = readerFac.CreateImageReader2(filename)
-            imageReader.SetFileName(filename)
-            texture = vtk.vtkTexture()
-            texture.SetInputConnection(imageReader.GetOutputPort())
-
             self.ren.GetRenderWindow().AddRenderer(self.renderers[count+1])
             actors[count].GetProperty().SetColor([1.0,1.0,1.0])
-            actors[count].SetTexture(texture)
-            self.renderers[count+1].AddActor(actors[count])
+            # one actor per atlas page, each with the texture of its page
+            for pageActor in self.projector.createPageActors(actors[count], count):
+                pageActor.GetProperty().SetColor([1.0,1.0,1.0])
+                self.renderers[count+1].AddActor(pageActor)
             count += 1
 
         actors.insert(0,hm.unfoldedActor)
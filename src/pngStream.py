@@ -0,0 +1,210 @@
+import io
+import struct
+import zlib
+import numpy as np
+from PIL import Image
+
+
+def pngChunk(chunkType, data):
+    '''
+    :param chunkType: the 4 byte type of the chunk.
+    :param data:
+    :return: the bytes of the chunk with its length and crc.
+    '''
+    return struct.pack(">I", len(data)) + chunkType + data + struct.pack(">I", zlib.crc32(chunkType + data) & 0xffffffff)
+
+
+class PngRowReader(object):
+    '''
+    Reads an 8 bit RGB or RGBA png from the top row down in tiles of rows, decompressing only as much as needed.
+    Tiles of rows with the filters None, Sub and Up are reconstructed with numpy, as written by PngRowWriter.
+    The Average and Paeth filters depend on the reconstructed pixel to the left, tiles with them are decoded by PIL
+    as a png of just these rows, so the memory still only depends on the size of the tile.
+    '''
+
+    signature = b"\x89PNG\r\n\x1a\n"
+    # components per color type
+    colorTypes = {2: 3, 6: 4}
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        if self.file.read(8) != self.signature:
+            self.close()
+            raise Exception("{} is not a png file".format(path))
+
+        chunkType, data = self.readChunk()
+        width, height, bitDepth, colorType, compression, filter, interlace = struct.unpack(">IIBBBBB", data)
+        if chunkType != b"IHDR" or bitDepth != 8 or colorType not in self.colorTypes or interlace != 0:
+            self.close()
+            raise Exception("{} is not an 8 bit non interlaced RGB or RGBA png".format(path))
+
+        self.width = width
+        self.height = height
+        self.channels = self.colorTypes[colorType]
+
+        self.colorType = colorType
+
+        self.row = 0
+        self.decompressor = zlib.decompressobj()
+        self.buffer = bytearray()
+        self.previous = np.zeros(width * self.channels, dtype=np.uint8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def readChunk(self):
+        header = self.file.read(8)
+        if len(header) < 8:
+            raise Exception("{} is truncated".format(self.path))
+        length, chunkType = struct.unpack(">I4s", header)
+        data = self.file.read(length)
+        self.file.read(4)
+        return chunkType, data
+
+    def nextImageData(self):
+        '''
+        :return: the data of the next IDAT chunk, empty after the last one.
+        '''
+        while True:
+            chunkType, data = self.readChunk()
+            if chunkType == b"IDAT":
+                return data
+            if chunkType == b"IEND":
+                return b""
+
+    def readRows(self, count):
+        '''
+        :param count: the number of rows to read, fewer are returned at the end of the image.
+        :return: (rows, width, channels) uint8 array of the next rows.
+        '''
+        count = min(count, self.height - self.row)
+
+        stride = 1 + self.width * self.channels
+        needed = count * stride
+        while len(self.buffer) < needed:
+            data = self.decompressor.unconsumed_tail or self.nextImageData()
+            decompressed = self.decompressor.decompress(data, needed - len(self.buffer))
+            if not data and not decompressed:
+                raise Exception("{} is truncated".format(self.path))
+            self.buffer += decompressed
+
+        rows = self.unfilter(np.frombuffer(self.buffer, dtype=np.uint8, count=needed).reshape(count, stride))
+        del self.buffer[:needed]
+        self.row += count
+        return rows.reshape(count, self.width, self.channels)
+
+    def unfilter(self, raw):
+        '''
+        :param raw: (rows, 1 + width * channels) array of the filter type and the filtered bytes of each row.
+        :return: (rows, width * channels) array of the reconstructed rows.
+        '''
+        filterTypes = raw[:, 0]
+        if np.any(filterTypes > 4):
+            raise Exception("{} has an invalid row filter".format(self.path))
+        if np.any(filterTypes > 2):
+            rows = self.decodeTile(raw)
+        else:
+            rows = np.empty((len(raw), raw.shape[1] - 1), dtype=np.uint8)
+            for i in range(len(raw)):
+                filterType = raw[i, 0]
+                data = raw[i, 1:]
+                if filterType == 0:
+                    rows[i] = data
+                elif filterType == 1:
+                    rows[i] = np.cumsum(data.reshape(-1, self.channels), axis=0, dtype=np.uint8).ravel()
+                else:
+                    np.add(data, self.previous, out=rows[i])
+                self.previous = rows[i]
+        # the rows are handed out, keep an own copy of the last one
+        self.previous = rows[-1].copy()
+        return rows
+
+    def decodeTile(self, raw):
+        '''
+        Reconstructs rows with any filter by decoding them with PIL. The rows are stored uncompressed in a png,
+        below the last reconstructed row as unfiltered first row, which the filters of the first row refer to.
+        :param raw: (rows, 1 + width * channels) array of the filter type and the filtered bytes of each row.
+        :return: (rows, width * channels) array of the reconstructed rows.
+        '''
+        data = np.empty((len(raw) + 1, raw.shape[1]), dtype=np.uint8)
+        data[0, 0] = 0
+        data[0, 1:] = self.previous
+        data[1:] = raw
+
+        header = struct.pack(">IIBBBBB", self.width, len(data), 8, self.colorType, 0, 0, 0)
+        png = (self.signature + pngChunk(b"IHDR", header) + pngChunk(b"IDAT", zlib.compress(data.tobytes(), 0))
+               + pngChunk(b"IEND", b""))
+        with Image.open(io.BytesIO(png)) as image:
+            rows = np.asarray(image)
+        return rows[1:].reshape(len(raw), -1)
+
+
+class PngRowWriter(object):
+    '''
+    Writes an 8 bit RGB or RGBA png from the top row down in tiles of rows, every row with the Sub filter.
+    '''
+
+    chunkRows = 64
+
+    def __init__(self, path, width, height, channels = 3, level = 6):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.row = 0
+        self.compressor = zlib.compressobj(level)
+
+        self.file = open(path, "wb")
+        self.file.write(PngRowReader.signature)
+        colorType = {v: k for k, v in PngRowReader.colorTypes.items()}[channels]
+        self.writeChunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, colorType, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def writeChunk(self, chunkType, data):
+        self.file.write(pngChunk(chunkType, data))
+
+    def writeRows(self, rows):
+        '''
+        :param rows: (rows, width, channels) uint8 array of the next rows, filtered and compressed in chunks of chunkRows.
+        :return:
+        '''
+        for start in range(0, len(rows), self.chunkRows):
+            chunk = rows[start:start + self.chunkRows].reshape(-1, self.width * self.channels)
+            filtered = np.empty((len(chunk), 1 + chunk.shape[1]), dtype=np.uint8)
+            filtered[:, 0] = 1
+            filtered[:, 1:1 + self.channels] = chunk[:, :self.channels]
+            np.subtract(chunk[:, self.channels:], chunk[:, :-self.channels], out=filtered[:, 1 + self.channels:])
+
+            data = self.compressor.compress(filtered.tobytes())
+            if data:
+                self.writeChunk(b"IDAT", data)
+            self.row += len(chunk)
+
+    def close(self):
+        '''
+        Finishes the png, the number of written rows has to match the height.
+        :return:
+        '''
+        if self.file.closed:
+            return
+        try:
+            if self.row != self.height:
+                raise Exception("{} of {} png rows written".format(self.row, self.height))
+            self.writeChunk(b"IDAT", self.compressor.flush())
+            self.writeChunk(b"IEND", b"")
+        finally:
+            self.file.close()
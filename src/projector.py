@@ -2,7 +2,11 @@ import vtkmodules.all as vtk
 from vtkmodules.numpy_interface.dataset_adapter import numpy_support
 import numpy as np
 import os
+import multiprocessing
 import util
+from textureAtlas import TextureAtlas
+import imageBuffer
+from rasterizer import SoftwareRasterizer, initRasterWorker, rasterWorker
 
 class Projector:
     '''
@@ -11,45 +15,78 @@ class Projector:
 
     dirname = os.path.dirname(__file__)
 
-    def projectPerTriangle(self,dedicatedPaperMesh, structure ,meshNr = 0, resolution = [500,500]):
+    # number of triangles rendered into the tiled viewports of one window. None or 1 renders one triangle per frame,
+    # with projectPerTriangle only if analyticUVs is off as well, see project().
+    batchSize = 16
+    # compute the corner pixels from the camera matrices instead of rendering and detecting colored markers.
+    analyticUVs = True
+    # pack the triangle renderings into square texture atlas pages instead of one long texture strip.
+    useAtlas = True
+    maxTextureSize = 4096
+    # "vtk" renders the triangles with vtk, "software" rasterizes them with numpy in worker processes, without a gpu.
+    backend = "vtk"
+    # worker processes of the software backend, None uses one per cpu.
+    rasterWorkers = None
+    # paper triangles rasterized per task of the software backend.
+    rasterChunk = 64
+    # pixels per world unit of the projection mesh, the unit of the loaded meshes, each triangle is rendered with.
+    # The printed template is rescaled by createUnfoldedPaperMesh(), so this is not a density on the paper.
+    # None renders every triangle at the given resolution.
+    texelDensity = None
+    # the adaptive render sizes are rounded up to multiples of this, so equally sized triangles share a batch.
+    adaptiveSizeStep = 16
+    # the largest width and height of the offscreen window of a batch.
+    maxWindowSize = 8192
+    # the attributes above that configure a projection, copied into the projection worker processes.
+    settings = ["batchSize", "analyticUVs", "useAtlas", "maxTextureSize", "backend", "rasterWorkers", "rasterChunk",
+                "texelDensity", "adaptiveSizeStep", "maxWindowSize"]
+
+    def __init__(self):
+        # render calls, readbacks and rendered pixels of the last projection, per meshNr.
+        self.renderStats = {}
+
+    def project(self, dedicatedPaperMesh, structure, meshNr = 0, resolution = [500,500], asArrays = False):
         '''
-        Rendering method that produces a long texture image of concatenated renderings of the triangles from the papermesh.
+        Projects the structure onto the projection mesh with the configured projection mode.
         :param dedicatedPaperMesh: the projection mesh.
         :param structure: the structure to project on the mesh.
         :param meshNr: index used only for the filename.
         :param resolution: resolution for the rendering of each triangle.
+        :param asArrays: if true the result is returned as arrays, see createProjectedPaperMesh().
+        :return: the projection mesh with the created texture assigned.
+        '''
+        if self.backend == "software":
+            return self.projectSoftware(dedicatedPaperMesh, structure, meshNr, resolution, asArrays, workers=self.rasterWorkers)
+        if self.analyticUVs or (self.batchSize and self.batchSize > 1):
+            return self.projectBatched(dedicatedPaperMesh, structure, meshNr, resolution, self.batchSize or 1, self.analyticUVs, asArrays)
+        return self.projectPerTriangle(dedicatedPaperMesh, structure, meshNr, resolution, asArrays)
+
+    def projectPerTriangle(self,dedicatedPaperMesh, structure ,meshNr = 0, resolution = [500,500], asArrays = False):
+        '''
+        Rendering method that produces a long texture image of concatenated renderings of the triangles from the papermesh.
+        With a texelDensity every triangle is rendered with its own size and parallel scale, see adaptiveRendering().
+        :param dedicatedPaperMesh: the projection mesh.
+        :param structure: the structure to project on the mesh.
+        :param meshNr: index used only for the filename.
+        :param resolution: resolution for the rendering of each triangle, ignored with a texelDensity.
+        :param asArrays: if true the result is returned as arrays (see atlasArrays() and longTextureArrays())
+        and no texture is written.
         :return: the projection mesh with the created texture assigned.
         '''
         paper = dedicatedPaperMesh.GetMapper().GetInput()
 
-        centersFilter = vtk.vtkCellCenters()
-        centersFilter.SetInputData(paper)
-        centersFilter.VertexCellsOn()
-        centersFilter.Update()
+        centers, positions = self.cellCameraPositions(paper)
+        numberOfCells = len(centers)
 
-        normals = vtk.vtkPolyDataNormals()
-        normals.SetInputData(paper)
-
-        normals.ComputePointNormalsOff()
-        normals.ComputeCellNormalsOn()
-        normals.SplittingOff()
-        normals.FlipNormalsOn()
-        normals.Update()
-
-        array = normals.GetOutput()
-        normalDataDouble = array.GetCellData().GetArray("Normals")
+        sizes = None
+        if self.texelDensity:
+            paperPoints, paperTriangles = util.polyDataToArrays(paper)
+            sizes, scales = self.adaptiveRendering(paperPoints[paperTriangles], centers, self.texelDensity)
+            resolution = [int(sizes.max())] * 2
 
         # -----------------
 
-        camera = vtk.vtkCamera()
-        #        camera.SetViewUp(0, 1, 0)
-        camera.ParallelProjectionOn()
-        camera.Zoom(0.01)
-        camera.SetClippingRange(0.0001, 300.01)
-        #TODO reimplement with hierachical Mesh
-        #if inflateStruc:
-        #    if not inflateStruc[meshNr]:
-        #        camera.SetClippingRange(0.0001, 60.01)
+        camera = self.createProjectionCamera()
 
         depthPeeling = True
         occlusion = 0.1
@@ -61,8 +98,7 @@ class Projector:
         buffer.SetLayer(0)
 
         bufferPaper = vtk.vtkRenderer()
-        buffer.SetBackground(255.0, 255.0, 255.0)
-        buffer.SetActiveCamera(camera)
+        bufferPaper.SetActiveCamera(camera)
         bufferPaper.SetLayer(1)
 
         bufferPoints = vtk.vtkRenderer()
@@ -86,6 +122,10 @@ class Projector:
         bufferIren = vtk.vtkRenderWindowInteractor()
         bufferIren.SetRenderWindow(bufferWin)
 
+        # the frames of every triangle are read into the same buffers
+        frameReader = imageBuffer.FrameReader(bufferWin)
+        pointsReader = imageBuffer.FrameReader(bufferWinPoints)
+
         if depthPeeling:
             buffer.SetUseDepthPeeling(True)
             buffer.SetOcclusionRatio(occlusion)
@@ -94,113 +134,303 @@ class Projector:
             buffer.SetUseDepthPeeling(False)
 
         #-----------------
-        transparent = [0.0, 0.0, 0.0, 0.0]
-        cellData = vtk.vtkUnsignedCharArray()
-        cellData.SetNumberOfComponents(4)
-        cellData.SetNumberOfTuples(centersFilter.GetOutput().GetNumberOfPoints())
-        for i in range(centersFilter.GetOutput().GetNumberOfPoints()):
-            cellData.InsertTuple(i, transparent)
-
-        paper.GetCellData().SetScalars(cellData)
-        paper.GetCellData().Modified()
-        paper.Modified()
+        self.setTransparentCellColors(paper, numberOfCells)
         #-----------------
 
+        # the scene is built once, only the camera and the corner points move per triangle
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(paper)
+        paperActor = vtk.vtkActor()
+        paperActor.SetMapper(mapper)
+        bufferPaper.AddActor(paperActor)
+        buffer.AddActor(structure)
+
         uvArray = vtk.vtkDoubleArray()
         uvArray.SetNumberOfComponents(2)
-        newGeometry = vtk.vtkPolyData()
         newPoints = vtk.vtkPoints()
         newCells = vtk.vtkCellArray()
 
         img = np.array([[],[],[]])
-
-        for i in range(centersFilter.GetOutput().GetNumberOfPoints()):
-            p = [0.0, 0.0, 0.0]
-            centersFilter.GetOutput().GetPoint(i, p)
-
-            p2 = normalDataDouble.GetTuple3(i)
-            normalScale = -5
-            #+0.01 because of the lighting, which renders everything white if viewed parallel to the z-axis
-            position = [p[0]+0.01 + (p2[0] * normalScale), p[1]+0.01 + (p2[1] * normalScale), p[2]+0.01 + (p2[2] * normalScale)]
-
-            camera.SetPosition(position)
-            camera.SetFocalPoint(p)
+        atlas = TextureAtlas(self.maxTextureSize) if self.useAtlas else None
+
+        renderedPixels = 0
+        for i in range(numberOfCells):
+            self.setCameraForCell(camera, positions[i], centers[i])
+            if sizes is not None:
+                camera.SetParallelScale(scales[i])
+                bufferWin.SetSize(int(sizes[i]), int(sizes[i]))
+                bufferWinPoints.SetSize(int(sizes[i]), int(sizes[i]))
+            width, height = bufferWin.GetSize()
+            renderedPixels += 2 * width * height
             points = paper.GetCell(i).GetPoints()
 
-            mapper = vtk.vtkPolyDataMapper()
-            mapper.SetInputData(paper)
-            actor = vtk.vtkActor()
-            actor.SetMapper(mapper)
-            bufferPaper.AddActor(actor)
-
-            bufferPoints.RemoveAllViewProps()
-
             self.drawPoints(points,bufferPoints)
 
             # render frame
-            triangle, pointsImg = self.renderHelper(camera, buffer, bufferPaper, bufferPoints, bufferWin, bufferWinPoints, i, structure)
+            triangle, pointsImg = self.renderHelper(frameReader, pointsReader)
 
             # --------------
             #dy, dx, dz = triangle.shape
             print(i)
             #filename = os.path.join(self.dirname, "../out/2D/triangle{}.png".format(i))
-            #util.writeImage(util.NpToVtk(triangle,dx,dy,dz),filename)
+            #imageBuffer.writePng(triangle,filename)
 
             #filename = os.path.join(self.dirname, "../out/2D/triangle{}_points.png".format(i))
-            #util.writeImage(util.NpToVtk(pointsImg, dx, dy, dz), filename)
+            #imageBuffer.writePng(pointsImg, filename)
             # ---------------
 
-            blue = pointsImg[:, :, 2]
-            red = pointsImg[:, :, 0]
-            green = pointsImg[:, :, 1]
-            maskBlue = np.logical_and(np.logical_and(blue > 250, red < 1), green < 1)
-            maskRed = np.logical_and(np.logical_and(red > 250, blue < 1), green < 1)
-            maskGreen = np.logical_and(np.logical_and(green > 250, red < 1), blue < 1)
+            corners = self.findMarkerCorners(pointsImg)
+
+            if corners is not None:
+                if atlas:
+                    atlas.insert(triangle, corners)
+                else:
+                    img = self.appendToLongTexture(img, triangle, corners, uvArray, resolution)
+                self.insertTriangle(points, newPoints, newCells)
 
-            if np.size(np.where(maskRed))!=0 and np.size(np.where(maskGreen))!=0 and np.size(np.where(maskBlue)) != 0:
+        buffer.RemoveActor(structure)
 
-                uvArray.InsertNextTuple2(np.where(maskRed)[1][0] + img.shape[1],np.where(maskRed)[0][0])
-                uvArray.InsertNextTuple2(np.where(maskGreen)[1][0] + img.shape[1],np.where(maskGreen)[0][0])
-                uvArray.InsertNextTuple2(np.where(maskBlue)[1][0] + img.shape[1],np.where(maskBlue)[0][0])
+        self.renderStats[meshNr] = {"renderCalls": 2 * numberOfCells, "readbacks": 2 * numberOfCells,
+                                    "renderedPixels": renderedPixels}
+        print("mesh {}: {} render calls, {} readbacks, {} pixels".format(meshNr, 2 * numberOfCells, 2 * numberOfCells, renderedPixels))
 
-                #potential problems here that large triangles after the first one could be to big for the image shape todo
-                if len(img[0]) == 0:
-                    img = triangle
-                    black = np.zeros((resolution[0], img.shape[1], img.shape[2]))
-                    img = np.vstack((img, black))
-                else:
-                    black = np.zeros((img.shape[0] - triangle.shape[0], triangle.shape[1], triangle.shape[2]))
-                    triangle = np.vstack((triangle, black))
-                    img = np.hstack((img, triangle))
+        if atlas:
+            arrays = self.atlasArrays(atlas, newPoints)
+            return arrays if asArrays else self.createPagedPaperMesh(arrays, meshNr)
+        if asArrays:
+            return self.longTextureArrays(img, uvArray, newPoints)
+        return self.createTexturedPaperMesh(img, uvArray, newPoints, newCells, meshNr)
+
+    def findMarkerCorners(self, pointsImg):
+        '''
+        Detects the red, lime and blue corner markers in the rendering of the corner points.
+        :param pointsImg: the cropped rendering of the corner points.
+        :return: the (column, row) pixel of each corner, or None if not all corners were found.
+        '''
+        blue = pointsImg[:, :, 2]
+        red = pointsImg[:, :, 0]
+        green = pointsImg[:, :, 1]
+        maskBlue = np.logical_and(np.logical_and(blue > 250, red < 1), green < 1)
+        maskRed = np.logical_and(np.logical_and(red > 250, blue < 1), green < 1)
+        maskGreen = np.logical_and(np.logical_and(green > 250, red < 1), blue < 1)
+
+        if np.size(np.where(maskRed))==0 or np.size(np.where(maskGreen))==0 or np.size(np.where(maskBlue)) == 0:
+            return None
+
+        return [[np.where(mask)[1][0], np.where(mask)[0][0]] for mask in [maskRed, maskGreen, maskBlue]]
+
+    def appendToLongTexture(self, img, triangle, corners, uvArray, resolution):
+        '''
+        Appends a rendered triangle to the long texture image and inserts the pixel coordinates of its corners.
+        :param img: the long texture image so far.
+        :param triangle: the cropped rendering of the triangle.
+        :param corners: the (column, row) pixel of each corner within the cropped rendering.
+        :param uvArray: the vtk array the corner pixel coordinates are inserted into.
+        :param resolution: resolution for the rendering of each triangle.
+        :return: the extended long texture image.
+        '''
+        for corner in corners:
+            uvArray.InsertNextTuple2(corner[0] + img.shape[1], corner[1])
+
+        #potential problems here that large triangles after the first one could be to big for the image shape todo
+        if len(img[0]) == 0:
+            img = triangle
+            black = np.zeros((resolution[0], img.shape[1], img.shape[2]))
+            img = np.vstack((img, black))
+        else:
+            black = np.zeros((img.shape[0] - triangle.shape[0], triangle.shape[1], triangle.shape[2]))
+            triangle = np.vstack((triangle, black))
+            img = np.hstack((img, triangle))
+        return img
+
+    def insertTriangle(self, points, newPoints, newCells):
+        '''
+        Inserts a triangle with its own three vertices into the geometry of the dedicated papermesh.
+        :param points: the vtk points of the triangle.
+        :param newPoints: the vtk points of the new geometry.
+        :param newCells: the vtk cells of the new geometry.
+        :return:
+        '''
+        triCell = vtk.vtkTriangle()
 
-                triCell = vtk.vtkTriangle()
+        pointId = newPoints.InsertNextPoint(points.GetPoint(0))
+        triCell.GetPointIds().SetId(0,pointId)
 
-                pointId = newPoints.InsertNextPoint(points.GetPoint(0))
-                triCell.GetPointIds().SetId(0,pointId)
+        pointId = newPoints.InsertNextPoint(points.GetPoint(1))
+        triCell.GetPointIds().SetId(1,pointId)
 
-                pointId = newPoints.InsertNextPoint(points.GetPoint(1))
-                triCell.GetPointIds().SetId(1,pointId)
+        pointId = newPoints.InsertNextPoint(points.GetPoint(2))
+        triCell.GetPointIds().SetId(2,pointId)
 
-                pointId = newPoints.InsertNextPoint(points.GetPoint(2))
-                triCell.GetPointIds().SetId(2,pointId)
+        newCells.InsertNextCell(triCell)
+
+    def texturePath(self, meshNr, page = 0):
+        '''
+        :param meshNr: index of the projected structure.
+        :param page: page of the texture atlas.
+        :return: the path of the texture image, further atlas pages get the page appended to the filename.
+        '''
+        if page == 0:
+            return os.path.join(self.dirname, "../out/2D/texture/texture{}.png".format(meshNr))
+        return os.path.join(self.dirname, "../out/2D/texture/texture{}_{}.png".format(meshNr, page))
+
+    def atlasArrays(self, atlas, newPoints):
+        '''
+        Collects the projection result held by the texture atlas as plain arrays.
+        :param atlas: the texture atlas holding the renderings of the triangles.
+        :param newPoints: the vtk points of the new geometry, three per triangle.
+        :return: dict with the atlas pages, the uvs, the page of each triangle and the triangle corners.
+        '''
+        return {"pages": atlas.getPages(),
+                "uvs": atlas.getTextureCoordinates(),
+                "trianglePages": np.array(atlas.trianglePages, dtype=np.int32),
+                "points": numpy_support.vtk_to_numpy(newPoints.GetData()).astype(np.float64)}
+
+    def longTextureArrays(self, img, uvArray, newPoints):
+        '''
+        Collects the projection result of the long texture image as plain arrays.
+        :param img: the long texture image.
+        :param uvArray: the corner pixel coordinates of each triangle.
+        :param newPoints: the vtk points of the new geometry, three per triangle.
+        :return: dict with the long texture image, the corner pixel coordinates and the triangle corners.
+        '''
+        return {"texture": img,
+                "uvs": numpy_support.vtk_to_numpy(uvArray).astype(np.float64),
+                "points": numpy_support.vtk_to_numpy(newPoints.GetData()).astype(np.float64)}
+
+    def createProjectedPaperMesh(self, arrays, meshNr):
+        '''
+        Creates the dedicated papermesh from a projection result returned as arrays, e.g. by a projection worker.
+        :param arrays: the result of atlasArrays() or longTextureArrays().
+        :param meshNr: index used only for the filename.
+        :return: the projection mesh with the created texture assigned.
+        '''
+        if "pages" in arrays:
+            return self.createPagedPaperMesh(arrays, meshNr)
 
-                newCells.InsertNextCell(triCell)
+        if len(arrays["points"]) == 0:
+            raise Exception("No triangle of structure {} could be projected".format(meshNr))
+        geometry = util.arraysToPolyData(arrays["points"], np.arange(len(arrays["points"])).reshape(-1, 3))
+        uvArray = numpy_support.numpy_to_vtk(arrays["uvs"], deep=1)
+        return self.createTexturedPaperMesh(arrays["texture"], uvArray, geometry.GetPoints(), geometry.GetPolys(), meshNr)
+
+    def createPagedPaperMesh(self, arrays, meshNr):
+        '''
+        Writes the pages of the texture atlas and creates the dedicated papermesh with the uvs mapped onto them.
+        The page of each triangle is stored in the "AtlasPage" cell array.
+        :param arrays: the projection result as returned by atlasArrays().
+        :param meshNr: index used only for the filename.
+        :return: the projection mesh with the first page of the atlas assigned as texture,
+        createPageActors() splits it into one actor per page for displaying it.
+        '''
+        if len(arrays["pages"]) == 0:
+            raise Exception("No triangle of structure {} could be projected".format(meshNr))
+
+        writtenImgs = []
+        for page, img in enumerate(arrays["pages"]):
+            writtenImgs.append(imageBuffer.writePng(img, self.texturePath(meshNr, page)))
+
+        uvArray = numpy_support.numpy_to_vtk(arrays["uvs"], deep=1)
+        pageArray = numpy_support.numpy_to_vtk(arrays["trianglePages"], deep=1)
+        pageArray.SetName("AtlasPage")
+
+        # every triangle has its own three vertices
+        newGeometry = util.arraysToPolyData(arrays["points"], np.arange(len(arrays["points"])).reshape(-1, 3))
+        newGeometry.GetPointData().SetTCoords(uvArray)
+        newGeometry.GetCellData().AddArray(pageArray)
+
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(newGeometry)
+        actor = vtk.vtkActor()
+        actor.SetMapper(mapper)
+
+        texture = vtk.vtkTexture()
+        texture.SetInputData(writtenImgs[0])
+        actor.SetTexture(texture)
 
-                bufferPaper.RemoveAllViewProps()
-                buffer.RemoveAllViewProps()
+        return actor
 
+    def createPageActors(self, dedicatedPaperMesh, meshNr):
+        '''
+        Splits the dedicated papermesh by its "AtlasPage" cell array into one actor per atlas page, each with the texture
+        of its page, like createUnfoldedPaperMesh() does for the unfolding.
+        :param dedicatedPaperMesh: the projection mesh as returned by project().
+        :param meshNr: index used only for the filename.
+        :return: list of the actors, the projection mesh itself with its texture if it has no atlas pages.
+        '''
+        mesh = dedicatedPaperMesh.GetMapper().GetInput()
+        pageArray = mesh.GetCellData().GetArray("AtlasPage")
+        if pageArray is None:
+            return [dedicatedPaperMesh]
+
+        pages = numpy_support.vtk_to_numpy(pageArray)
+        points, triangles = util.polyDataToArrays(mesh)
+
+        actors = []
+        for page in range(int(pages.max()) + 1):
+            pageMesh = util.arraysToPolyData(points, triangles[pages == page])
+            pageMesh.GetPointData().SetTCoords(mesh.GetPointData().GetTCoords())
+
+            mapper = vtk.vtkPolyDataMapper()
+            mapper.SetInputData(pageMesh)
+            actor = vtk.vtkActor()
+            actor.SetMapper(mapper)
+
+            filename = self.texturePath(meshNr, page)
+            readerFac = vtk.vtkImageReader2Factory()
+            imageReader = readerFac.CreateImageReader2(filename)
+            imageReader.SetFileName(filename)
+
+            texture = vtk.vtkTexture()
+            texture.SetInputConnection(imageReader.GetOutputPort())
+            actor.SetTexture(texture)
+            actors.append(actor)
+
+        return actors
+
+    def projectionTask(self, dedicatedPaperMesh, structure, meshNr = 0, resolution = [500,500]):
+        '''
+        Serializes everything a projection worker process needs into arrays and plain values.
+        :param dedicatedPaperMesh: the projection mesh.
+        :param structure: the structure to project on the mesh.
+        :param meshNr: index of the structure.
+        :param resolution: resolution for the rendering of each triangle.
+        :return: the task dict passed to projectionWorker().
+        '''
+        paperPoints, paperTriangles = util.polyDataToArrays(dedicatedPaperMesh.GetMapper().GetInput())
+        structurePoints, structureTriangles = util.polyDataToArrays(structure.GetMapper().GetInput())
+        return {"paperPoints": paperPoints,
+                "paperTriangles": paperTriangles,
+                "structurePoints": structurePoints,
+                "structureTriangles": structureTriangles,
+                "color": structure.GetProperty().GetColor(),
+                "opacity": structure.GetProperty().GetOpacity(),
+                "meshNr": meshNr,
+                "resolution": list(resolution),
+                "settings": {name: getattr(self, name) for name in self.settings}}
+
+    def createTexturedPaperMesh(self, img, uvArray, newPoints, newCells, meshNr):
+        '''
+        Writes the long texture image and creates the dedicated papermesh with the uvs mapped onto it.
+        :param img: the long texture image.
+        :param uvArray: the corner pixel coordinates of each triangle.
+        :param newPoints: the vtk points of the new geometry.
+        :param newCells: the vtk cells of the new geometry.
+        :param meshNr: index used only for the filename.
+        :return: the projection mesh with the created texture assigned.
+        '''
         #todo cutting away the black area at the top of the images.
 
-        dy, dx, dz = img.shape
         filename = os.path.join(self.dirname, "../out/2D/texture/texture{}.png".format(meshNr))
 
-        writtenImg = util.writeImage(util.NpToVtk(img,dx,dy,dz),filename)
+        writtenImg = imageBuffer.writePng(img, filename)
 
         for i in range(uvArray.GetNumberOfTuples()):
             uvArray.SetTuple2(i,uvArray.GetTuple2(i)[0]/img.shape[1],uvArray.GetTuple2(i)[1]/img.shape[0])
 
         #creating the deadicated papermesh with multiple vertices and texture
         #uv coordinates are mapped onto the created long texture
+        newGeometry = vtk.vtkPolyData()
         newGeometry.SetPoints(newPoints)
         newGeometry.SetPolys(newCells)
         newGeometry.GetPointData().SetTCoords(uvArray)
@@ -214,17 +444,463 @@ class Projector:
         texture.SetInputData(writtenImg)
         actor.SetTexture(texture)
 
-        dedicatedPaperMesh = actor
+        return actor
+
+    def cellCameraPositions(self, paper):
+        '''
+        Computes the cell centers, the flipped cell normals and from them the camera position of every cell
+        of the projection mesh at once.
+        :param paper: the polydata of the projection mesh.
+        :return: the cell centers, which are the focal points, and the camera positions as (n, 3) arrays.
+        '''
+        centersFilter = vtk.vtkCellCenters()
+        centersFilter.SetInputData(paper)
+        centersFilter.VertexCellsOn()
+        centersFilter.Update()
 
-        return dedicatedPaperMesh
+        normals = vtk.vtkPolyDataNormals()
+        normals.SetInputData(paper)
+
+        normals.ComputePointNormalsOff()
+        normals.ComputeCellNormalsOn()
+        normals.SplittingOff()
+        normals.FlipNormalsOn()
+        normals.Update()
+
+        centers = numpy_support.vtk_to_numpy(centersFilter.GetOutput().GetPoints().GetData()).astype(np.float64)
+        normals = numpy_support.vtk_to_numpy(normals.GetOutput().GetCellData().GetArray("Normals")).astype(np.float64)
+
+        normalScale = -5
+        #+0.01 because of the lighting, which renders everything white if viewed parallel to the z-axis
+        positions = centers + 0.01 + normals * normalScale
+        return centers, positions
+
+    def createProjectionCamera(self):
+        '''
+        :return: a parallel projection camera with the zoom and clipping range used to render single triangles.
+        '''
+        camera = vtk.vtkCamera()
+        #        camera.SetViewUp(0, 1, 0)
+        camera.ParallelProjectionOn()
+        camera.Zoom(0.01)
+        camera.SetClippingRange(0.0001, 300.01)
+        #TODO reimplement with hierachical Mesh
+        #if inflateStruc:
+        #    if not inflateStruc[meshNr]:
+        #        camera.SetClippingRange(0.0001, 60.01)
+        return camera
+
+    def setCameraForCell(self, camera, position, center):
+        '''
+        Places the camera in front of a cell, looking at the cell center along the flipped cell normal.
+        :param camera: the vtk camera.
+        :param position: the camera position of the cell, see cellCameraPositions().
+        :param center: the cell center.
+        :return:
+        '''
+        camera.SetPosition(position)
+        camera.SetFocalPoint(center)
+
+    def adaptiveRendering(self, paperCorners, centers, texelDensity, margin = 4, maxSize = None):
+        '''
+        Chooses the render size and the parallel scale of the camera of every triangle from its size in world coordinates,
+        so that each triangle gets at least texelDensity pixels per world unit and the rendered pixels follow the
+        printed size instead of the number of triangles.
+        :param paperCorners: the world coordinates of the corners as (n, 3, 3) array.
+        :param centers: the cell centers the cameras look at as (n, 3) array.
+        :param texelDensity: pixels per world unit of the projection mesh.
+        :param margin: pixels kept free around the triangle for the cropping.
+        :param maxSize: the largest render size, by default maxTextureSize.
+        :return: the square render size as (n,) int array and the parallel scale of the camera as (n,) array.
+        '''
+        # the triangle lies within this distance around the focal point in every view direction
+        radii = np.linalg.norm(paperCorners - centers[:, np.newaxis], axis=2).max(axis=1)
+        radii = np.maximum(radii, 0.5 / texelDensity)
+
+        step = self.adaptiveSizeStep
+        sizes = np.ceil((2 * radii * texelDensity + 2 * margin) / step).astype(int) * step
+        sizes = np.clip(sizes, step, max(self.maxTextureSize if maxSize is None else maxSize, step))
+        # half the height of the view, the triangle fills the render up to the margin
+        scales = radii * sizes / (sizes - 2 * margin)
+        return sizes, scales
+
+    def projectBatched(self, dedicatedPaperMesh, structure, meshNr = 0, resolution = [500,500], batchSize = 16, analytic = True, asArrays = False):
+        '''
+        Produces the same long texture image as projectPerTriangle(), but renders batchSize triangles per frame,
+        each into its own viewport of one large offscreen window, and reads the window back once per batch.
+        With a texelDensity the triangles are grouped by their render size, see adaptiveRendering(), and the batches
+        of each group are rendered with the window sized to their tiles.
+        :param dedicatedPaperMesh: the projection mesh.
+        :param structure: the structure to project on the mesh.
+        :param meshNr: index used only for the filename.
+        :param resolution: resolution for the rendering of each triangle, ignored with a texelDensity.
+        :param batchSize: number of triangles rendered per frame.
+        :param analytic: if true the corner pixels are computed from the camera matrices,
+        otherwise the colored corner markers are rendered in a second window and detected in the image.
+        :param asArrays: if true the result is returned as arrays (see atlasArrays() and longTextureArrays())
+        and no texture is written.
+        :return: the projection mesh with the created texture assigned.
+        '''
+        paper = dedicatedPaperMesh.GetMapper().GetInput()
+
+        centers, positions = self.cellCameraPositions(paper)
+        numberOfCells = len(centers)
+        paperPoints, paperTriangles = util.polyDataToArrays(paper)
+        paperCorners = paperPoints[paperTriangles]
+
+        columns = int(np.ceil(np.sqrt(batchSize)))
+        rows = int(np.ceil(batchSize / columns))
+
+        # the tile resolution and the cells of each group of batches
+        scales = None
+        if self.texelDensity:
+            sizes, scales = self.adaptiveRendering(paperCorners, centers, self.texelDensity,
+                                                   maxSize=self.maxWindowSize // max(columns, rows))
+            groups = [([int(size)] * 2, np.flatnonzero(sizes == size)) for size in np.unique(sizes)]
+            resolution = [int(sizes.max())] * 2
+        else:
+            groups = [(resolution, np.arange(numberOfCells))]
+
+        depthPeeling = True
+        occlusion = 0.1
+        numberOfPeels = 10
+
+        bufferWin = vtk.vtkRenderWindow()
+        bufferWin.SetNumberOfLayers(2)
+        bufferWin.SetSize(columns * resolution[0], rows * resolution[1])
+        bufferWin.SetOffScreenRendering(True)
+
+        if not analytic:
+            bufferWinPoints = vtk.vtkRenderWindow()
+            bufferWinPoints.SetNumberOfLayers(1)
+            bufferWinPoints.SetSize(columns * resolution[0], rows * resolution[1])
+            bufferWinPoints.SetOffScreenRendering(True)
+
+        #-----------------
+        self.setTransparentCellColors(paper, numberOfCells)
+
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(paper)
+        paperActor = vtk.vtkActor()
+        paperActor.SetMapper(mapper)
+        #-----------------
+
+        # one camera and one set of renderers per tile, the scene is built once for the whole mesh
+        tiles = []
+        for t in range(batchSize):
+            column = t % columns
+            row = t // columns
+            viewport = [column / columns, row / rows, (column + 1) / columns, (row + 1) / rows]
+
+            camera = self.createProjectionCamera()
+
+            buffer = vtk.vtkRenderer()
+            buffer.SetBackground(255.0, 255.0, 255.0)
+            buffer.SetActiveCamera(camera)
+            buffer.SetViewport(viewport)
+            buffer.SetLayer(0)
+            buffer.AddActor(structure)
+
+            if depthPeeling:
+                buffer.SetUseDepthPeeling(True)
+                buffer.SetOcclusionRatio(occlusion)
+                buffer.SetMaximumNumberOfPeels(numberOfPeels)
+            else:
+                buffer.SetUseDepthPeeling(False)
+
+            bufferPaper = vtk.vtkRenderer()
+            bufferPaper.SetActiveCamera(camera)
+            bufferPaper.SetViewport(viewport)
+            bufferPaper.SetLayer(1)
+            bufferPaper.AddActor(paperActor)
+
+            bufferWin.AddRenderer(buffer)
+            bufferWin.AddRenderer(bufferPaper)
+
+            bufferPoints = None
+            if not analytic:
+                bufferPoints = vtk.vtkRenderer()
+                bufferPoints.SetBackground(255.0, 255.0, 255.0)
+                bufferPoints.SetActiveCamera(camera)
+                bufferPoints.SetViewport(viewport)
+                bufferPoints.SetLayer(0)
+                bufferWinPoints.AddRenderer(bufferPoints)
+
+            tiles.append([camera, buffer, bufferPaper, bufferPoints, row, column])
+
+        # every batch is read into the same buffers
+        frameReader = imageBuffer.FrameReader(bufferWin)
+        if not analytic:
+            pointsReader = imageBuffer.FrameReader(bufferWinPoints)
+
+        uvArray = vtk.vtkDoubleArray()
+        uvArray.SetNumberOfComponents(2)
+        newPoints = vtk.vtkPoints()
+        newCells = vtk.vtkCellArray()
+
+        img = np.array([[],[],[]])
+        atlas = TextureAtlas(self.maxTextureSize) if self.useAtlas else None
+        renderCalls = 0
+        readbacks = 0
+        renderedPixels = 0
+        renderedCells = 0
+
+        # the crops are inserted in the order of the cells, crops of cells rendered ahead of their turn wait in pending
+        pending = {}
+        nextCell = 0
+
+        for tileResolution, cells in groups:
+            bufferWin.SetSize(columns * tileResolution[0], rows * tileResolution[1])
+            if not analytic:
+                bufferWinPoints.SetSize(columns * tileResolution[0], rows * tileResolution[1])
+            windowPixels = columns * tileResolution[0] * rows * tileResolution[1]
+
+            for start in range(0, len(cells), batchSize):
+                batch = cells[start:start + batchSize]
+
+                for t, (camera, buffer, bufferPaper, bufferPoints, row, column) in enumerate(tiles):
+                    draw = t < len(batch)
+                    buffer.SetDraw(draw)
+                    bufferPaper.SetDraw(draw)
+                    if bufferPoints:
+                        bufferPoints.SetDraw(draw)
+                    if not draw:
+                        continue
+
+                    self.setCameraForCell(camera, positions[batch[t]], centers[batch[t]])
+                    if scales is not None:
+                        camera.SetParallelScale(scales[batch[t]])
+
+                    if bufferPoints:
+                        self.drawPoints(paper.GetCell(batch[t]).GetPoints(), bufferPoints)
+
+                # render and read back the whole batch
+                bufferWin.Render()
+                renderCalls += 1
+                renderedPixels += windowPixels
+                frame, depth = frameReader.read()
+                readbacks += 1
+
+                if analytic:
+                    cameras = [tiles[t][0] for t in range(len(batch))]
+                    pixels = self.worldToDisplay(cameras, paperCorners[batch], tileResolution)
+                else:
+                    bufferWinPoints.Render()
+                    renderCalls += 1
+                    renderedPixels += windowPixels
+                    pointsFrame, depth = pointsReader.read()
+                    readbacks += 1
+
+                for t, i in enumerate(batch):
+                    row, column = tiles[t][4], tiles[t][5]
+                    rowSlice = slice(row * tileResolution[1], (row + 1) * tileResolution[1])
+                    columnSlice = slice(column * tileResolution[0], (column + 1) * tileResolution[0])
+
+                    if analytic:
+                        triangle, cornersInCrop = self.cropTriangleAnalytic(frame[rowSlice, columnSlice], pixels[t])
+                    else:
+                        triangle, pointsImg = self.cropTriangleArrays(frame[rowSlice, columnSlice], pointsFrame[rowSlice, columnSlice])
+                        cornersInCrop = self.findMarkerCorners(pointsImg)
+
+                    # the frame buffer is overwritten by the next batch
+                    pending[i] = (triangle if i == nextCell else triangle.copy(), cornersInCrop)
+                    while nextCell in pending:
+                        triangle, cornersInCrop = pending.pop(nextCell)
+                        if cornersInCrop is not None:
+                            if atlas:
+                                atlas.insert(triangle, cornersInCrop)
+                            else:
+                                img = self.appendToLongTexture(img, triangle, cornersInCrop, uvArray, resolution)
+                            self.insertTriangle(paper.GetCell(nextCell).GetPoints(), newPoints, newCells)
+                        nextCell += 1
+
+                renderedCells += len(batch)
+                print("{}/{}".format(renderedCells, numberOfCells))
+
+        self.renderStats[meshNr] = {"renderCalls": renderCalls, "readbacks": readbacks,
+                                    "renderedPixels": renderedPixels}
+        print("mesh {}: {} render calls, {} readbacks, {} pixels".format(meshNr, renderCalls, readbacks, renderedPixels))
+
+        if atlas:
+            arrays = self.atlasArrays(atlas, newPoints)
+            return arrays if asArrays else self.createPagedPaperMesh(arrays, meshNr)
+        if asArrays:
+            return self.longTextureArrays(img, uvArray, newPoints)
+        return self.createTexturedPaperMesh(img, uvArray, newPoints, newCells, meshNr)
+
+    def projectSoftware(self, dedicatedPaperMesh, structure, meshNr = 0, resolution = [500,500], asArrays = False, workers = None, margin = 2):
+        '''
+        Produces the same texture as projectBatched() with analytic uvs, but rasterizes the structure with the
+        SoftwareRasterizer instead of rendering it with vtk. Only the window around each paper triangle is rasterized,
+        chunks of rasterChunk triangles are distributed over worker processes. The rasterizer with the structure arrays
+        is copied into every worker once, when the pool starts.
+        With a texelDensity every triangle gets its own size and parallel scale, see adaptiveRendering().
+        :param dedicatedPaperMesh: the projection mesh.
+        :param structure: the structure to project on the mesh.
+        :param meshNr: index used only for the filename.
+        :param resolution: resolution of the rendering of each triangle the windows are cut from, ignored with a texelDensity.
+        :param asArrays: if true the result is returned as arrays (see atlasArrays() and longTextureArrays())
+        and no texture is written.
+        :param workers: the number of worker processes, None uses one per cpu, 1 rasterizes in this process.
+        :param margin: pixels added around the bounds of each triangle.
+        :return: the projection mesh with the created texture assigned.
+        '''
+        paper = dedicatedPaperMesh.GetMapper().GetInput()
+
+        centers, positions = self.cellCameraPositions(paper)
+        numberOfCells = len(centers)
+        paperPoints, paperTriangles = util.polyDataToArrays(paper)
+        paperCorners = paperPoints[paperTriangles]
+
+        # the resolution of the rendering of every triangle
+        if self.texelDensity:
+            sizes, scales = self.adaptiveRendering(paperCorners, centers, self.texelDensity)
+            resolutions = np.stack((sizes, sizes), axis=1)
+        else:
+            resolutions = np.tile(np.array(resolution[0:2], dtype=int), (numberOfCells, 1))
+
+        # the camera of every triangle as matrix, like for the vtk rendering
+        camera = self.createProjectionCamera()
+        matrices = np.empty((numberOfCells, 4, 4))
+        directions = np.empty((numberOfCells, 3))
+        for i in range(numberOfCells):
+            self.setCameraForCell(camera, positions[i], centers[i])
+            if self.texelDensity:
+                camera.SetParallelScale(scales[i])
+            matrices[i] = self.cameraMatrix(camera, resolutions[i, 0] / resolutions[i, 1])
+            directions[i] = camera.GetDirectionOfProjection()
+        pixels = self.displayCoordinates(matrices, paperCorners, resolutions)
+
+        # the windows of the triangles lying inside the rendering, see cropTriangleAnalytic()
+        size = resolutions[:, np.newaxis]
+        cells = np.flatnonzero(np.all((pixels >= 0) & (pixels < size), axis=(1, 2)))
+        lowers = np.maximum(np.floor(pixels.min(axis=1)).astype(int) - margin, 0)
+        uppers = np.minimum(np.floor(pixels.max(axis=1)).astype(int) + margin, resolutions)
+
+        tasks = []
+        for start in range(0, len(cells), self.rasterChunk):
+            chunk = cells[start:start + self.rasterChunk]
+            tasks.append((matrices[chunk], directions[chunk], lowers[chunk], uppers[chunk], resolutions[chunk]))
+
+        rasterizer = SoftwareRasterizer.fromActor(structure)
+        if workers == 1 or len(tasks) <= 1:
+            initRasterWorker(rasterizer)
+            results = [rasterWorker(task) for task in tasks]
+        else:
+            with multiprocessing.Pool(workers, initializer=initRasterWorker, initargs=(rasterizer,)) as pool:
+                results = pool.map(rasterWorker, tasks)
+        images = [image for result in results for image in result]
+
+        uvArray = vtk.vtkDoubleArray()
+        uvArray.SetNumberOfComponents(2)
+        newPoints = vtk.vtkPoints()
+        newCells = vtk.vtkCellArray()
+
+        img = np.array([[],[],[]])
+        atlas = TextureAtlas(self.maxTextureSize) if self.useAtlas else None
+        for i, triangle in zip(cells, images):
+            cornersInCrop = pixels[i] - lowers[i]
+            if atlas:
+                atlas.insert(triangle, cornersInCrop)
+            else:
+                img = self.appendToLongTexture(img, triangle, cornersInCrop, uvArray, resolutions.max(axis=0))
+            self.insertTriangle(paper.GetCell(i).GetPoints(), newPoints, newCells)
+
+        renderedPixels = int(np.prod(uppers[cells] - lowers[cells], axis=1).sum())
+        self.renderStats[meshNr] = {"renderCalls": 0, "readbacks": 0, "rasterizedTriangles": len(cells),
+                                    "renderedPixels": renderedPixels}
+        print("mesh {}: {} triangles rasterized, {} pixels".format(meshNr, len(cells), renderedPixels))
+
+        if atlas:
+            arrays = self.atlasArrays(atlas, newPoints)
+            return arrays if asArrays else self.createPagedPaperMesh(arrays, meshNr)
+        if asArrays:
+            return self.longTextureArrays(img, uvArray, newPoints)
+        return self.createTexturedPaperMesh(img, uvArray, newPoints, newCells, meshNr)
+
+    def worldToDisplay(self, cameras, corners, resolution):
+        '''
+        Transforms the triangle corners into the display coordinates of the viewport rendered with the matching camera.
+        :param cameras: one vtk camera per triangle.
+        :param corners: the world coordinates of the corners as (n, 3, 3) array.
+        :param resolution: resolution of the viewport.
+        :return: the (x, y) display coordinates of the corners as (n, 3, 2) array, with y pointing up like the rendered images.
+        '''
+        aspect = resolution[0] / resolution[1]
+        matrices = np.array([self.cameraMatrix(camera, aspect) for camera in cameras])
+        return self.displayCoordinates(matrices, corners, resolution)
+
+    def cameraMatrix(self, camera, aspect):
+        '''
+        :param camera: the vtk camera.
+        :param aspect: the aspect ratio of the viewport.
+        :return: the 4x4 composite projection matrix of the camera, world to normalized device coordinates.
+        '''
+        matrix = camera.GetCompositeProjectionTransformMatrix(aspect, -1, 1)
+        return [[matrix.GetElement(r, k) for k in range(4)] for r in range(4)]
+
+    def displayCoordinates(self, matrices, corners, resolution):
+        '''
+        :param matrices: the (n, 4, 4) composite projection matrices.
+        :param corners: the world coordinates of the corners as (n, 3, 3) array.
+        :param resolution: resolution of the viewport, or the (n, 2) resolutions of the viewport of each triangle.
+        :return: the (x, y) display coordinates of the corners as (n, 3, 2) array, see worldToDisplay().
+        '''
+        homogeneous = np.concatenate((corners, np.ones(corners.shape[:2] + (1,))), axis=2)
+        view = np.einsum('nij,nkj->nki', matrices, homogeneous)
+        view = view[:, :, 0:2] / view[:, :, 3:4]
+
+        size = np.asarray(resolution, dtype=float)[..., 0:2]
+        if size.ndim == 2:
+            size = size[:, np.newaxis]
+        return (view + 1.0) * 0.5 * size
+
+    def cropTriangleAnalytic(self, img, pixels, margin = 2):
+        '''
+        Crops the rendering of a single triangle to the bounds of its projected corners.
+        :param img: rendered triangle as numpy array.
+        :param pixels: the (x, y) display coordinates of the corners as (3, 2) array.
+        :param margin: pixels added around the bounds.
+        :return: the cropped image and the corners within the cropped image, or None as corners if a corner lies outside the rendering.
+        '''
+        height, width = img.shape[0:2]
+        if np.any(pixels < 0) or np.any(pixels[:, 0] >= width) or np.any(pixels[:, 1] >= height):
+            return img, None
+
+        lower = np.maximum(np.floor(pixels.min(axis=0)).astype(int) - margin, 0)
+        upper = np.minimum(np.floor(pixels.max(axis=0)).astype(int) + margin, [width, height])
+
+        return img[lower[1]:upper[1], lower[0]:upper[0], :], pixels - lower
+
+    def setTransparentCellColors(self, paper, numberOfCells):
+        '''
+        Assigns fully transparent cell colors to the projection mesh.
+        :param paper: the polydata of the projection mesh.
+        :param numberOfCells: number of cells of the projection mesh.
+        :return:
+        '''
+        cellData = numpy_support.numpy_to_vtk(np.zeros((numberOfCells, 4), dtype=np.uint8), deep=1)
+
+        paper.GetCellData().SetScalars(cellData)
+        paper.GetCellData().Modified()
+        paper.Modified()
 
     def drawPoints(self,points,bufferPoints):
         '''
         Draws the points used for cropping the rendered triangles and uv mapping onto the long texture image.
+        The actor of the points is created on the first call for a renderer, later calls only move its points.
         :param points: the vtk points.
         :param bufferPoints: the renderer for the points.
         :return:
         '''
+        props = bufferPoints.GetViewProps()
+        if props.GetNumberOfItems() > 0:
+            markerPoints = props.GetLastProp().GetMapper().GetInput().GetPoints()
+            for j in range(3):
+                markerPoints.SetPoint(j, points.GetPoint(j))
+            markerPoints.Modified()
+            return
+
         pointActor = vtk.vtkActor()
 
         colors = vtk.vtkNamedColors()
@@ -268,49 +944,30 @@ class Projector:
         pointActor.GetProperty().SetPointSize(2)
         bufferPoints.AddActor(pointActor)
 
-    def renderHelper(self, camera, buffer, bufferPaper, bufferPoints, bufferWin, bufferWinPoints, count, actor):
-        ##Was necessary at some stage of programming, could be removed later on.
-        buffer.AddActor(actor)
-
-        buffer.SetActiveCamera(camera)
-        bufferPaper.SetActiveCamera(camera)
-        bufferPoints.SetActiveCamera(camera)
-
-        bufferWin.Render()
-
-        wti = vtk.vtkWindowToImageFilter()
-        wti.SetInput(bufferWin)
-        wti.SetInputBufferTypeToRGB()
-        wti.Update()
-
-        bufferWinPoints.Render()
+    def renderHelper(self, frameReader, pointsReader):
+        '''
+        Renders a single triangle and its corner points and crops both frames to the bounds of the triangle.
+        :param frameReader: the frame reader of the window of the triangle.
+        :param pointsReader: the frame reader of the window of the points.
+        :return: both frames cropped to the axis aligned bounds, views on the buffers of the readers.
+        '''
+        frameReader.renWin.Render()
+        img, depth = frameReader.read()
 
-        wti2 = vtk.vtkWindowToImageFilter()
-        wti2.SetInput(bufferWinPoints)
-        wti2.SetInputBufferTypeToRGB()
-        wti2.Update()
+        pointsReader.renWin.Render()
+        points, depth = pointsReader.read()
 
-        triangleImg, pointsImg = self.cropRenderedTriangle(wti.GetOutput(), wti2.GetOutput(), bufferWin.GetSize(), count)
+        triangleImg, pointsImg = self.cropTriangleArrays(img, points)
 
         return triangleImg, pointsImg
 
-    def cropRenderedTriangle(self, image, pointsImage, resolution, count = 1):
+    def cropTriangleArrays(self, img, points):
         '''
-        Receives the image of a single triangle and the dedicated image of corner points and crops it to the bounds of the triangle, based on the pointsImage.
-        :param image: rendered triangle as vtk image.
-        :param pointsImage: rendered points as vtk image.
-        :param resolution: resolution of the rendering.
-        :param count:
+        Crops the rendering of a single triangle to the bounds of its corner points.
+        :param img: rendered triangle as numpy array.
+        :param points: rendered points as numpy array.
         :return: returns both images cropped to the axis aligned bounds.
         '''
-        img = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())[:, 0:3]
-        points = numpy_support.vtk_to_numpy(pointsImage.GetPointData().GetScalars())[:, 0:3]
-
-        img.astype(float)
-        img = np.reshape(np.ravel(img), (resolution[0], resolution[1], 3))
-        points.astype(float)
-        points = np.reshape(np.ravel(points), (resolution[0], resolution[1], 3))
-
         blue = points[:,:,2]
         green = points[:,:,1]
         red = points[:,:,0]
@@ -348,11 +1005,15 @@ class Projector:
         textureCoordinates = mesh.GetPointData().GetTCoords()
 
         points = vtk.vtkPoints()
-        cells = vtk.vtkCellArray()
 
         widthMarker = [0.0, 0.0]
         heightMarker = [0.0, 0.0]
 
+        # with a texture atlas each triangle is rendered with the texture of its page
+        pageArray = dedicatedPaperMesh.GetMapper().GetInput().GetCellData().GetArray("AtlasPage")
+        numberOfPages = int(pageArray.GetRange()[1]) + 1 if pageArray else 1
+        pageCells = [vtk.vtkCellArray() for page in range(numberOfPages)]
+
         # creating a mesh according to the uv layout
         for i in range(mesh.GetNumberOfCells()):
             uvs = [[0.0, 0.0], [0.0, 0.0], [0.0, 0.0]]
@@ -360,6 +1021,10 @@ class Projector:
             textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(1), uvs[1])
             textureCoordinates.GetTuple(mesh.GetCell(i).GetPointId(2), uvs[2])
 
+            if pageArray and i < pageArray.GetNumberOfTuples():
+                cells = pageCells[int(pageArray.GetTuple1(i))]
+            else:
+                cells = pageCells[0]
             cells.InsertNextCell(3)
 
             for j in range(len(uvs)):
@@ -382,29 +1047,32 @@ class Projector:
 
         textureCoordinates = dedicatedPaperMesh.GetMapper().GetInput().GetPointData().GetTCoords()
 
-        unfoldedPaper = vtk.vtkPolyData()
+        actors = []
+        for page in range(numberOfPages):
+            unfoldedPaper = vtk.vtkPolyData()
 
-        unfoldedPaper.SetPoints(points)
-        unfoldedPaper.SetPolys(cells)
-        unfoldedPaper.GetPointData().SetTCoords(textureCoordinates)
+            unfoldedPaper.SetPoints(points)
+            unfoldedPaper.SetPolys(pageCells[page])
+            unfoldedPaper.GetPointData().SetTCoords(textureCoordinates)
 
-        mapper = vtk.vtkPolyDataMapper()
-        mapper.SetInputData(unfoldedPaper)
+            mapper = vtk.vtkPolyDataMapper()
+            mapper.SetInputData(unfoldedPaper)
 
-        actor = vtk.vtkActor()
-        actor.SetMapper(mapper)
+            actor = vtk.vtkActor()
+            actor.SetMapper(mapper)
 
-        # ----------------------
+            # ----------------------
 
-        filename = os.path.join(self.dirname, "../out/2D/texture/texture{}.png".format(idx))
-        readerFac = vtk.vtkImageReader2Factory()
-        imageReader = readerFac.CreateImageReader2(filename)
-        imageReader.SetFileName(filename)
+            filename = self.texturePath(idx, page)
+            readerFac = vtk.vtkImageReader2Factory()
+            imageReader = readerFac.CreateImageReader2(filename)
+            imageReader.SetFileName(filename)
 
-        texture = vtk.vtkTexture()
-        texture.SetInputConnection(imageReader.GetOutputPort())
+            texture = vtk.vtkTexture()
+            texture.SetInputConnection(imageReader.GetOutputPort())
 
-        actor.SetTexture(texture)
+            actor.SetTexture(texture)
+            actors.append(actor)
 
         camera = vtk.vtkCamera()
         camera.SetPosition(0, -600, 0)
@@ -415,26 +1083,22 @@ class Projector:
         ren, iren, renWin, wti = util.getbufferRenIntWin(camera, width=5000, height=5000)
         renWin.SetOffScreenRendering(1)
 
-        ren.AddActor(actor)
+        for actor in actors:
+            ren.AddActor(actor)
         renWin.Render()
 
-        wti.Update()
-
-        imgWidth = wti.GetOutput().GetExtent()[1] + 1
-        imgHeight = wti.GetOutput().GetExtent()[3] + 1
+        img, depth = imageBuffer.FrameReader(renWin, front=False).read()
+        img = self.cropUnfolding(img)
 
-        img = self.vtkToNpHelper(wti.GetOutput(), imgWidth, imgHeight)
-
-        dy, dx, dz = img.shape
         filename = os.path.join(self.dirname, "../out/2D/unfolding{}.png".format(idx))
-        util.writeImage(util.NpToVtk(img,dx,dy,dz),filename)
-
-    def vtkToNpHelper(self, img, width, height):
-        img = numpy_support.vtk_to_numpy(img.GetPointData().GetScalars())[:, 0:3]
-        img.astype(float)
-
-        img = np.reshape(np.ravel(img), (width, height, 3))
+        imageBuffer.writePng(img, filename)
 
+    def cropUnfolding(self, img):
+        '''
+        Crops the rendering of the unfolding to a square around the rendered paper.
+        :param img: (height, width, 3) array of the rendering.
+        :return: view on the cropped area.
+        '''
         mask = np.where(img != 255)
         width = mask[0].max() - mask[0].min()
         height = mask[1].max() - mask[1].min()
@@ -445,3 +1109,34 @@ class Projector:
 
         return img
 
+
+def projectionWorker(task):
+    '''
+    Entry point of a projection worker process. Rebuilds the meshes from the task created by Projector.projectionTask()
+    and projects them with an own offscreen render window.
+    :param task: the serialized projection task.
+    :return: the projection result as arrays, see Projector.createProjectedPaperMesh(), and the "renderStats"
+    of the projection.
+    '''
+    # the same projection mode as the projector the task was created with
+    projector = Projector()
+    for name, value in task["settings"].items():
+        setattr(projector, name, value)
+    # the worker already runs in its own process
+    projector.rasterWorkers = 1
+
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputData(util.arraysToPolyData(task["paperPoints"], task["paperTriangles"]))
+    paperActor = vtk.vtkActor()
+    paperActor.SetMapper(mapper)
+
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputData(util.arraysToPolyData(task["structurePoints"], task["structureTriangles"]))
+    structureActor = vtk.vtkActor()
+    structureActor.SetMapper(mapper)
+    structureActor.GetProperty().SetColor(task["color"])
+    structureActor.GetProperty().SetOpacity(task["opacity"])
+
+    result = projector.project(paperActor, structureActor, task["meshNr"], task["resolution"], asArrays=True)
+    result["renderStats"] = projector.renderStats[task["meshNr"]]
+    return result
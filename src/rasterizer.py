@@ -0,0 +1,258 @@
+import numpy as np
+import vtkmodules.all as vtk
+from vtkmodules.numpy_interface.dataset_adapter import numpy_support
+import util
+
+
+class SoftwareRasterizer(object):
+    '''
+    Orthographic software rasterizer of a single structure, the numpy counterpart of rendering the structure
+    with vtk for the projection of one paper triangle. Only the pixels of a window around the paper triangle are
+    rasterized. Fragments are lit by a headlight like the vtk default light, the nearest maxLayers fragments of a pixel
+    are composited front to back with the opacity of the structure onto the white background.
+    The triangles are binned once by their centroids into a uniform grid, a window only visits the triangles of the
+    grid cells around its view axis instead of all triangles of the structure.
+    '''
+
+    # the number of peels of the depth peeling in the vtk path
+    maxLayers = 10
+    background = 255.0
+    # the number of grid cells along the longest side of the bounds of the triangle centroids
+    gridResolution = 32
+
+    def __init__(self, points, triangles, pointNormals = None, color = (1.0, 1.0, 1.0), opacity = 1.0,
+                 ambient = 0.0, diffuse = 1.0, specular = 0.0, specularPower = 1.0):
+        '''
+        :param points: (n, 3) array of the structure points.
+        :param triangles: (m, 3) array of point ids.
+        :param pointNormals: optional (n, 3) array, the normals are interpolated like with gouraud shading,
+        without the triangles are shaded flat.
+        :param color: the rgb color of the structure in [0, 1].
+        :param opacity:
+        :param ambient: the lighting coefficients of the vtk property.
+        :param diffuse:
+        :param specular:
+        :param specularPower:
+        '''
+        self.points = np.asarray(points, dtype=np.float64)
+        self.triangles = np.asarray(triangles, dtype=np.int64)
+        self.color = np.asarray(color, dtype=np.float64)
+        self.opacity = float(opacity)
+        self.ambient = ambient
+        self.diffuse = diffuse
+        self.specular = specular
+        self.specularPower = specularPower
+
+        corners = self.points[self.triangles]
+        faceNormals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.faceNormals = np.nan_to_num(faceNormals / np.linalg.norm(faceNormals, axis=1)[:, np.newaxis])
+        self.pointNormals = None if pointNormals is None else np.asarray(pointNormals, dtype=np.float64)
+
+        self.centroids = corners.mean(axis=1)
+        self.radii = np.linalg.norm(corners - self.centroids[:, np.newaxis], axis=2).max(axis=1)
+        self.buildGrid()
+
+    def buildGrid(self):
+        '''
+        Bins the triangles by their centroids into a uniform grid of gridResolution cells along the longest side.
+        Only the occupied cells are kept, with their centers and the radius around their center that contains all
+        their triangles.
+        '''
+        if len(self.triangles) == 0:
+            self.gridOrder = np.zeros(0, dtype=np.int64)
+            self.gridStarts = np.zeros(0, dtype=np.int64)
+            self.gridCounts = np.zeros(0, dtype=np.int64)
+            self.gridCenters = np.zeros((0, 3))
+            self.gridRadii = np.zeros(0)
+            return
+
+        lowerBound = self.centroids.min(axis=0)
+        extent = self.centroids.max(axis=0) - lowerBound
+        cellSize = max(extent.max() / self.gridResolution, np.finfo(float).tiny)
+        shape = np.floor(extent / cellSize).astype(np.int64) + 1
+        cells = np.minimum(np.floor((self.centroids - lowerBound) / cellSize).astype(np.int64), shape - 1)
+        ids = np.ravel_multi_index(tuple(cells.T), tuple(shape))
+
+        counts = np.bincount(ids, minlength=int(np.prod(shape)))
+        occupied = np.flatnonzero(counts)
+        self.gridOrder = np.argsort(ids, kind='stable')
+        self.gridStarts = (np.cumsum(counts) - counts)[occupied]
+        self.gridCounts = counts[occupied]
+        self.gridCenters = lowerBound + (np.stack(np.unravel_index(occupied, tuple(shape)), axis=1) + 0.5) * cellSize
+        self.gridRadii = (np.maximum.reduceat(self.radii[self.gridOrder], self.gridStarts)
+                          + 0.5 * np.sqrt(3.0) * cellSize)
+
+    def candidateTriangles(self, matrix, direction, lower, upper, resolution):
+        '''
+        Culls the triangles against the cylinder around the view axis of an orthographic camera that contains the window.
+        :param matrix: the 4x4 composite projection matrix of the camera.
+        :param direction: the view direction of the camera.
+        :param lower: the (x, y) pixel of the lower left corner of the window.
+        :param upper: the (x, y) pixel behind the upper right corner of the window.
+        :param resolution: the resolution of the whole rendering.
+        :return: the ascending ids of the triangles that may cover pixels of the window.
+        '''
+        # the corners of the window, one pixel wider, in world coordinates on the plane of depth 0
+        window = np.array([np.asarray(lower) - 1, np.asarray(upper)], dtype=float)
+        ndc = (window + 0.5) / (0.5 * np.array(resolution[0:2], dtype=float)) - 1.0
+        corners = np.c_[ndc, np.zeros(2), np.ones(2)] @ np.linalg.inv(matrix).T
+        corners = corners[:, 0:3] / corners[:, 3:4]
+        center = corners.mean(axis=0)
+        radius = 0.5 * np.linalg.norm(corners[1] - corners[0])
+        direction = np.asarray(direction, dtype=np.float64) / np.linalg.norm(direction)
+
+        def axisDistances(points):
+            offsets = points - center
+            along = offsets @ direction
+            return np.sqrt(np.maximum(np.einsum('ij,ij->i', offsets, offsets) - along * along, 0.0))
+
+        cells = np.flatnonzero(axisDistances(self.gridCenters) <= radius + self.gridRadii)
+        if len(cells) == len(self.gridCenters):
+            return np.arange(len(self.triangles))
+        counts = self.gridCounts[cells]
+        positions = np.repeat(self.gridStarts[cells] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        triangles = self.gridOrder[positions]
+        triangles = triangles[axisDistances(self.centroids[triangles]) <= radius + self.radii[triangles]]
+        return np.sort(triangles)
+
+    @staticmethod
+    def fromActor(actor):
+        '''
+        :param actor: the vtk actor of the structure.
+        :return: a rasterizer with the geometry, the point normals if present and the lighting of the actor.
+        '''
+        mesh = actor.GetMapper().GetInput()
+        triangles = vtk.vtkTriangleFilter()
+        triangles.SetInputData(mesh)
+        triangles.PassVertsOff()
+        triangles.PassLinesOff()
+        triangles.Update()
+        mesh = triangles.GetOutput()
+
+        points, triangles = util.polyDataToArrays(mesh)
+        normals = mesh.GetPointData().GetNormals()
+        if normals is not None:
+            normals = numpy_support.vtk_to_numpy(normals)
+
+        prop = actor.GetProperty()
+        return SoftwareRasterizer(points, triangles, normals, prop.GetColor(), prop.GetOpacity(),
+                                  prop.GetAmbient(), prop.GetDiffuse(), prop.GetSpecular(), prop.GetSpecularPower())
+
+    def render(self, matrix, direction, lower, upper, resolution):
+        '''
+        Rasterizes the structure into a window of the rendering of a camera.
+        :param matrix: the 4x4 composite projection matrix of the camera, world to normalized device coordinates.
+        :param direction: the unit view direction of the camera.
+        :param lower: the (x, y) pixel of the lower left corner of the window.
+        :param upper: the (x, y) pixel behind the upper right corner of the window.
+        :param resolution: the resolution of the whole rendering.
+        :return: (height, width, 3) uint8 image of the window, bottom row first like the vtk renderings.
+        '''
+        width, height = upper[0] - lower[0], upper[1] - lower[1]
+        image = np.full((height * width, 3), self.background)
+
+        candidates = self.candidateTriangles(matrix, direction, lower, upper, resolution)
+        triangles = self.triangles[candidates]
+
+        # display coordinates and depth of the corners, pixel centers lie at .5,
+        # all points are transformed once when that is less work than transforming the corners of the candidates
+        if 3 * len(triangles) < len(self.points):
+            points, cornerIds = self.points[triangles].reshape(-1, 3), np.arange(3 * len(triangles)).reshape(-1, 3)
+        else:
+            points, cornerIds = self.points, triangles
+        homogeneous = points @ matrix[:3, :3].T + matrix[:3, 3]
+        w = points @ matrix[3, :3] + matrix[3, 3]
+        display = (homogeneous[:, 0:2] / w[:, np.newaxis] + 1.0) * 0.5 * np.array(resolution[0:2], dtype=float) - 0.5
+        depth = homogeneous[:, 2] / w
+        corners = display[cornerIds]
+        cornerDepth = depth[cornerIds]
+        minimum = np.ceil(corners.min(axis=1)).astype(np.int64)
+        maximum = np.floor(corners.max(axis=1)).astype(np.int64)
+        minimum = np.maximum(minimum, lower)
+        maximum = np.minimum(maximum, np.array(upper) - 1)
+        area = ((corners[:, 1, 0] - corners[:, 0, 0]) * (corners[:, 2, 1] - corners[:, 0, 1])
+                - (corners[:, 2, 0] - corners[:, 0, 0]) * (corners[:, 1, 1] - corners[:, 0, 1]))
+        visible = (np.all(minimum <= maximum, axis=1) & (area != 0.0)
+                   & (cornerDepth.max(axis=1) >= -1.0) & (cornerDepth.min(axis=1) <= 1.0))
+
+        faces = np.flatnonzero(visible)
+        if len(faces) == 0:
+            return image.astype(np.uint8).reshape(height, width, 3)
+
+        # every pixel of the bounding box of every visible triangle
+        minimum = minimum[faces]
+        size = maximum[faces] - minimum + 1
+        counts = size[:, 0] * size[:, 1]
+        fragmentFaces = np.repeat(faces, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        columns = np.repeat(size[:, 0], counts)
+        x = np.repeat(minimum[:, 0], counts) + offsets % columns
+        y = np.repeat(minimum[:, 1], counts) + offsets // columns
+
+        # barycentric coordinates of the pixel centers
+        c = corners[fragmentFaces]
+        b1 = ((x - c[:, 0, 0]) * (c[:, 2, 1] - c[:, 0, 1]) - (c[:, 2, 0] - c[:, 0, 0]) * (y - c[:, 0, 1])) / area[fragmentFaces]
+        b2 = ((c[:, 1, 0] - c[:, 0, 0]) * (y - c[:, 0, 1]) - (x - c[:, 0, 0]) * (c[:, 1, 1] - c[:, 0, 1])) / area[fragmentFaces]
+        b0 = 1.0 - b1 - b2
+        barycentric = np.stack((b0, b1, b2), axis=1)
+        fragmentDepth = np.einsum('ij,ij->i', barycentric, cornerDepth[fragmentFaces])
+        inside = np.all(barycentric >= 0.0, axis=1) & (fragmentDepth >= -1.0) & (fragmentDepth <= 1.0)
+
+        fragmentFaces = fragmentFaces[inside]
+        barycentric = barycentric[inside]
+        fragmentDepth = fragmentDepth[inside]
+        pixels = (y[inside] - lower[1]) * width + (x[inside] - lower[0])
+
+        # headlight with two sided lighting
+        if self.pointNormals is not None:
+            normals = np.einsum('ij,ijk->ik', barycentric, self.pointNormals[triangles[fragmentFaces]])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                normals = np.nan_to_num(normals / np.linalg.norm(normals, axis=1)[:, np.newaxis])
+        else:
+            normals = self.faceNormals[candidates[fragmentFaces]]
+        lighting = np.abs(normals @ np.asarray(direction, dtype=np.float64))
+        intensity = self.diffuse * lighting + self.specular * lighting ** self.specularPower
+        colors = np.clip(self.ambient + intensity, 0.0, None)[:, np.newaxis] * self.color * 255.0
+        colors = np.clip(colors, 0.0, 255.0)
+
+        # the nearest fragments of every pixel, front to back
+        order = np.lexsort((fragmentDepth, pixels))
+        pixels = pixels[order]
+        colors = colors[order]
+        first = np.r_[True, pixels[1:] != pixels[:-1]]
+        starts = np.flatnonzero(first)
+        rank = np.arange(len(pixels)) - np.repeat(starts, np.diff(np.r_[starts, len(pixels)]))
+        kept = rank < self.maxLayers
+
+        transmission = (1.0 - self.opacity) ** rank[kept]
+        weights = self.opacity * transmission
+        layers = np.minimum(np.bincount(pixels, minlength=height * width), self.maxLayers)
+        for channel in range(3):
+            image[:, channel] *= (1.0 - self.opacity) ** layers
+            image[:, channel] += np.bincount(pixels[kept], weights=weights * colors[kept, channel], minlength=height * width)
+
+        return np.rint(image).astype(np.uint8).reshape(height, width, 3)
+
+
+rasterizer = None
+
+
+def initRasterWorker(structure):
+    '''
+    :param structure: the rasterizer of the structure. It reaches the worker pickled through the initargs of the pool,
+    so every worker holds its own copy of the structure arrays and the grid, made once per pool.
+    '''
+    global rasterizer
+    rasterizer = structure
+
+
+def rasterWorker(task):
+    '''
+    Rasterizes the windows of a chunk of paper triangles in a worker process.
+    :param task: the matrices, view directions, lower and upper window corners and the resolutions of the triangles.
+    :return: the images of the windows.
+    '''
+    matrices, directions, lowers, uppers, resolutions = task
+    return [rasterizer.render(matrix, direction, lower, upper, resolution)
+            for matrix, direction, lower, upper, resolution in zip(matrices, directions, lowers, uppers, resolutions)]
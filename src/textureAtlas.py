@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class TextureAtlas(object):
+    '''
+    Packs the cropped renderings of the triangles into preallocated square uint8 pages with a shelf packer.
+    A new page is started once an image does not fit on any shelf of the existing pages.
+    '''
+
+    def __init__(self, maxSize = 4096, padding = 1):
+        '''
+        :param maxSize: width and height of a page in pixels.
+        :param padding: empty pixels kept between neighbouring images.
+        '''
+        self.maxSize = maxSize
+        self.padding = padding
+
+        self.pages = []
+        # per page a list of shelves as [y, height, x cursor]
+        self.shelves = []
+        # per page the used width and height
+        self.used = []
+
+        # per inserted triangle the page and the pixel coordinates of its corners within that page
+        self.trianglePages = []
+        self.cornerPixels = []
+
+    def insert(self, image, corners):
+        '''
+        Inserts the rendering of a triangle into the atlas.
+        :param image: the cropped rendering of the triangle as (height, width, 3) array.
+        :param corners: the (column, row) pixel of each corner within the cropped rendering.
+        :return: the page index and the (x, y) position of the image within the page.
+        '''
+        height, width = image.shape[0:2]
+        if width > self.maxSize or height > self.maxSize:
+            raise Exception("Triangle rendering of {}x{} pixels exceeds the maximum texture size of {}".format(width, height, self.maxSize))
+
+        page, x, y = self.allocate(width, height)
+        self.pages[page][y:y + height, x:x + width, :] = image[:, :, 0:3]
+        self.used[page][0] = max(self.used[page][0], x + width)
+        self.used[page][1] = max(self.used[page][1], y + height)
+
+        self.trianglePages.append(page)
+        self.cornerPixels.append(np.asarray(corners, dtype=float) + [x, y])
+        return page, x, y
+
+    def allocate(self, width, height):
+        '''
+        Finds a free spot for an image with the shelf packer, starting a new shelf or page if necessary.
+        :param width:
+        :param height:
+        :return: the page index and the (x, y) position within the page.
+        '''
+        for page in range(len(self.pages)):
+            shelves = self.shelves[page]
+            for shelf in shelves:
+                if height <= shelf[1] and shelf[2] + width <= self.maxSize:
+                    x = shelf[2]
+                    shelf[2] += width + self.padding
+                    return page, x, shelf[0]
+
+            top = shelves[-1][0] + shelves[-1][1] + self.padding if shelves else 0
+            if top + height <= self.maxSize:
+                shelves.append([top, height, width + self.padding])
+                return page, 0, top
+
+        self.pages.append(np.zeros((self.maxSize, self.maxSize, 3), dtype=np.uint8))
+        self.shelves.append([[0, height, width + self.padding]])
+        self.used.append([0, 0])
+        return len(self.pages) - 1, 0, 0
+
+    def getPages(self):
+        '''
+        :return: the pages cropped to their used area.
+        '''
+        return [self.pages[p][:self.used[p][1], :self.used[p][0], :] for p in range(len(self.pages))]
+
+    def getTextureCoordinates(self):
+        '''
+        :return: the uvs of all inserted triangles as (3 * n, 2) array, normalized to the used area of their page.
+        '''
+        if not self.cornerPixels:
+            return np.zeros((0, 2))
+        sizes = np.array(self.used, dtype=float)[self.trianglePages]
+        uvs = np.array(self.cornerPixels) / sizes[:, np.newaxis, :]
+        return uvs.reshape(-1, 2)
+
+    def getNumberOfPages(self):
+        return len(self.pages)
@@ -5,6 +5,12 @@ import trimesh
 import meshio
 from vtkmodules.numpy_interface.dataset_adapter import numpy_support
 
+# called with messages for the user, the ui replaces it with a message box.
+messageHandler = print
+
+def showMessage(text):
+    messageHandler(text)
+
 def getbufferRenIntWin(camera = vtk.vtkCamera(),width=2000,height=2000):
     ren = vtk.vtkRenderer()
     ren.SetBackground(255.0, 255.0, 255.0)
@@ -45,29 +51,57 @@ def printSinglePoint(self, x, y, ren, color):
     actor.GetProperty().SetPointSize(2)
     ren.AddActor(actor)
 
-def NpToVtk(img,dx,dy,dz):
-    resultImg = vtk.vtkImageData()
-
-    vtkResult = numpy_support.numpy_to_vtk(img.reshape(dy * dx, dz))
-
-    resultImg.SetSpacing(1., 1., 1.)
-    resultImg.SetOrigin(0., 0., 0.)
-    resultImg.SetDimensions(dx, dy, 1)
-    resultImg.AllocateScalars(numpy_support.get_vtk_array_type(img.dtype), dz)
-    resultImg.GetPointData().SetScalars(vtkResult)
-    return resultImg
-
-def writeImage(img, path):
-    castFilter = vtk.vtkImageCast()
-    castFilter.SetInputData(img)
-    castFilter.SetOutputScalarTypeToUnsignedChar()
-    castFilter.Update()
-
-    writer = vtk.vtkPNGWriter()
-    writer.SetFileName(path)
-    writer.SetInputConnection(castFilter.GetOutputPort())
-    writer.Write()
-    return castFilter.GetOutput()
+def polyDataTriangles(mesh):
+    '''
+    Copies the polygons of a polydata into a triangle array, from the offsets and the connectivity of its cell array.
+    Polygons with more corners are split into fans like readObjArrays() does, so the triangles only match the cells
+    one to one if every polygon is a triangle.
+    :param mesh: a vtk polydata.
+    :return: the triangles as (m, 3) int array.
+    '''
+    polys = mesh.GetPolys()
+    offsets = numpy_support.vtk_to_numpy(polys.GetOffsetsArray()).astype(np.int64)
+    connectivity = numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).astype(np.int64)
+
+    sizes = np.diff(offsets)
+    if np.all(sizes == 3):
+        return connectivity.reshape(-1, 3)
+
+    # the first corner of every fan triangle and the index k of its second corner within the polygon
+    counts = np.maximum(sizes - 2, 0)
+    starts = np.repeat(offsets[:-1], counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    return np.stack((connectivity[starts], connectivity[starts + k], connectivity[starts + k + 1]), axis=1)
+
+def polyDataToArrays(mesh):
+    '''
+    Copies the points and triangles of a polydata into numpy arrays, e.g. to hand it to another process.
+    :param mesh: a vtk polydata, see polyDataTriangles() for polygons that are no triangles.
+    :return: the points as (n, 3) float array and the triangles as (m, 3) int array.
+    '''
+    points = numpy_support.vtk_to_numpy(mesh.GetPoints().GetData()).astype(np.float64)
+    return points, polyDataTriangles(mesh)
+
+def arraysToPolyData(points, triangles):
+    '''
+    Creates a vtk polydata from point and triangle arrays, the inverse of polyDataToArrays().
+    :param points: (n, 3) float array.
+    :param triangles: (m, 3) int array of point ids.
+    :return: the vtk polydata.
+    '''
+    vtkPoints = vtk.vtkPoints()
+    vtkPoints.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(points, dtype=np.float64), deep=1))
+
+    triangles = np.asarray(triangles, dtype=np.int64)
+    offsets = np.arange(0, 3 * len(triangles) + 1, 3, dtype=np.int64)
+    cells = vtk.vtkCellArray()
+    cells.SetData(numpy_support.numpy_to_vtkIdTypeArray(offsets, deep=1),
+                  numpy_support.numpy_to_vtkIdTypeArray(np.ascontiguousarray(triangles.ravel()), deep=1))
+
+    mesh = vtk.vtkPolyData()
+    mesh.SetPoints(vtkPoints)
+    mesh.SetPolys(cells)
+    return mesh
 
 def stlToOff(meshpath):
     dirname = os.path.dirname(__file__)
@@ -109,6 +143,57 @@ def writeObj(mesh,name):
     objWriter.SetInputData(mesh)
     objWriter.Write()
 
+def writeOff(points, triangles, path):
+    '''
+    Writes a triangle mesh given as arrays in .off format.
+    :param points: (n, 3) float array.
+    :param triangles: (m, 3) int array of point ids.
+    :param path: the file path.
+    :return:
+    '''
+    with open(path, "w") as f:
+        f.write("OFF\n{} {} 0\n".format(len(points), len(triangles)))
+        np.savetxt(f, points, fmt="%.17g")
+        np.savetxt(f, np.hstack((np.full((len(triangles), 1), 3), triangles)), fmt="%d")
+
+def readObjArrays(path):
+    '''
+    Reads the vertices, texture coordinates and faces of an .obj file into numpy arrays, polygons are split into fans.
+    Like the vtkOBJReader every face corner gets its own point if the texture coordinate ids differ from the vertex ids.
+    :param path: the file path.
+    :return: the points as (n, 3) array, the triangles as (m, 3) array and the uvs as (n, 2) array or None.
+    '''
+    vertices = []
+    tcoords = []
+    cornerVertices = []
+    cornerTCoords = []
+    with open(path) as f:
+        for line in f:
+            values = line.split()
+            if not values:
+                continue
+            if values[0] == 'v':
+                vertices.append(values[1:4])
+            elif values[0] == 'vt':
+                tcoords.append(values[1:3])
+            elif values[0] == 'f':
+                corners = [v.split('/') for v in values[1:]]
+                for k in range(1, len(corners) - 1):
+                    for corner in (corners[0], corners[k], corners[k + 1]):
+                        cornerVertices.append(int(corner[0]) - 1)
+                        cornerTCoords.append(int(corner[1]) - 1 if len(corner) > 1 and corner[1] else -1)
+
+    vertices = np.array(vertices, dtype=np.float64).reshape(-1, 3)
+    tcoords = np.array(tcoords, dtype=np.float64).reshape(-1, 2)
+    cornerVertices = np.array(cornerVertices, dtype=np.int64)
+    cornerTCoords = np.array(cornerTCoords, dtype=np.int64)
+
+    if len(tcoords) == 0:
+        return vertices, cornerVertices.reshape(-1, 3), None
+    if np.array_equal(cornerVertices, cornerTCoords):
+        return vertices, cornerVertices.reshape(-1, 3), tcoords[:len(vertices)]
+    return vertices[cornerVertices], np.arange(len(cornerVertices)).reshape(-1, 3), tcoords[cornerTCoords]
+
 def readObj(path):
     importer = vtk.vtkOBJReader()
     importer.SetFileName(path)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules of src import each other by their plain names, boolean is imported from the repository root
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "src"))
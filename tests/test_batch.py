@@ -0,0 +1,72 @@
+import json
+
+import pytest
+import vtkmodules.all as vtk
+
+import batch
+import organizer
+from diskCache import DiskCache
+
+
+@pytest.fixture
+def manifest(tmp_path, monkeypatch):
+    '''
+    A manifest with one small sphere. The papermesh cache is moved to tmp_path and the unfolding, projection and
+    multiplication, which need mu3d and an OpenGL context, only print progress like the real steps.
+    '''
+    sphere = vtk.vtkSphereSource()
+    sphere.SetRadius(20)
+    sphere.Update()
+    writer = vtk.vtkSTLWriter()
+    writer.SetFileName(str(tmp_path / "sphere.stl"))
+    writer.SetInputData(sphere.GetOutput())
+    writer.Write()
+
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({"iterations": 10, "structures": [{"files": ["sphere.stl"], "projection": "Inflate"}]}))
+
+    monkeypatch.setattr(organizer.HierarchicalMesh, "paperMeshCache", DiskCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(organizer.Organizer, "hierarchical_mesh_anchor",
+                        organizer.HierarchicalMesh(None, None, organizer.Organizer.meshProcessor))
+    monkeypatch.setattr(organizer.Organizer, "unfoldPaperMeshPass", lambda self, iterations: print("unfolded"))
+    monkeypatch.setattr(organizer.Organizer, "projectPass", lambda self, resolution: print("1/1"))
+    monkeypatch.setattr(organizer.Organizer, "brightenMultiplication", lambda self: print("multiplied"))
+    return path
+
+
+def runBatch(capfd, argv):
+    status = batch.main(argv)
+    return status, json.loads(capfd.readouterr().out)
+
+
+def test_success(manifest, capfd):
+    status, report = runBatch(capfd, [str(manifest)])
+    assert status == 0 and report["status"] == 0
+    assert report["errors"] == []
+    assert set(report["timings"]) == {"load", "unfold", "project", "multiply", "total"}
+
+
+def test_failed_step(manifest, capfd, monkeypatch):
+    def fail(self, resolution):
+        raise Exception("no texture")
+    monkeypatch.setattr(organizer.Organizer, "projectPass", fail)
+
+    status, report = runBatch(capfd, [str(manifest)])
+    assert status == 1 and report["status"] == 1
+    assert report["failedStep"] == "project"
+    assert report["errors"] == ["project: no texture"]
+
+
+def test_invalid_manifest(tmp_path, capfd):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({"structures": [{"files": ["missing.stl"]}]}))
+
+    status, report = runBatch(capfd, [str(path)])
+    assert status == 2 and report["status"] == 2
+
+
+def test_report_file(manifest, tmp_path, capfd):
+    reportPath = tmp_path / "report.json"
+    assert batch.main([str(manifest), "--report", str(reportPath)]) == 0
+    assert capfd.readouterr().out == ""
+    assert json.loads(reportPath.read_text())["status"] == 0
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import vtkmodules.all as vtk
+
+import util
+from containment import ContainmentTree
+
+
+def sphere(center, radius):
+    source = vtk.vtkSphereSource()
+    source.SetCenter(center)
+    source.SetRadius(radius)
+    source.SetThetaResolution(16)
+    source.SetPhiResolution(16)
+    source.Update()
+    return source.GetOutput()
+
+
+def cube(lower, upper):
+    source = vtk.vtkCubeSource()
+    source.SetBounds(lower[0], upper[0], lower[1], upper[1], lower[2], upper[2])
+    triangles = vtk.vtkTriangleFilter()
+    triangles.SetInputConnection(source.GetOutputPort())
+    clean = vtk.vtkCleanPolyData()
+    clean.SetInputConnection(triangles.GetOutputPort())
+    clean.Update()
+    return clean.GetOutput()
+
+
+def referenceContains(meshA, meshB):
+    '''
+    The test of the former mim library with vtk: all points of meshB inside meshA and no contact between the surfaces.
+    '''
+    enclosed = vtk.vtkSelectEnclosedPoints()
+    enclosed.SetInputData(meshB)
+    enclosed.SetSurfaceData(meshA)
+    enclosed.Update()
+    inside = all(enclosed.IsInside(i) for i in range(meshB.GetNumberOfPoints()))
+
+    collision = vtk.vtkCollisionDetectionFilter()
+    collision.SetInputData(0, meshA)
+    collision.SetInputData(1, meshB)
+    collision.SetMatrix(0, vtk.vtkMatrix4x4())
+    collision.SetMatrix(1, vtk.vtkMatrix4x4())
+    collision.SetCollisionModeToFirstContact()
+    collision.Update()
+    return inside and collision.GetNumberOfContacts() == 0
+
+
+cases = {
+    "nested": (sphere((0, 0, 0), 10), sphere((2, 0, 0), 3), True),
+    "nestedCubes": (cube((-1, -1, -1), (1, 1, 1)), cube((-0.5, -0.5, -0.5), (0.5, 0.5, 0.5)), True),
+    "containing": (sphere((2, 0, 0), 3), sphere((0, 0, 0), 10), False),
+    "disjoint": (sphere((0, 0, 0), 2), sphere((10, 0, 0), 2), False),
+    "overlapping": (sphere((0, 0, 0), 5), sphere((4, 0, 0), 3), False),
+    "touchingInside": (cube((-1, -1, -1), (1, 1, 1)), cube((0, -0.5, -0.5), (1, 0.5, 0.5)), False),
+    "touchingCorner": (cube((-1, -1, -1), (1, 1, 1)), cube((0, 0, 0), (1, 1, 1)), False),
+    "touchingOutside": (cube((-1, -1, -1), (1, 1, 1)), cube((1, -0.5, -0.5), (2, 0.5, 0.5)), False),
+}
+
+
+@pytest.mark.parametrize("name", sorted(cases))
+def test_contains_agrees_with_the_reference(name):
+    meshA, meshB, expected = cases[name]
+    treeA = ContainmentTree(*util.polyDataToArrays(meshA))
+    treeB = ContainmentTree(*util.polyDataToArrays(meshB))
+
+    assert referenceContains(meshA, meshB) == expected
+    assert treeA.contains(treeB) == expected
+
+
+def test_points_inside_agree_with_the_reference():
+    mesh = sphere((1, 2, 3), 5)
+    points = np.random.RandomState(0).uniform(-6, 8, (500, 3))
+
+    vtkPoints = vtk.vtkPoints()
+    for point in points:
+        vtkPoints.InsertNextPoint(point)
+    polydata = vtk.vtkPolyData()
+    polydata.SetPoints(vtkPoints)
+    enclosed = vtk.vtkSelectEnclosedPoints()
+    enclosed.SetInputData(polydata)
+    enclosed.SetSurfaceData(mesh)
+    enclosed.Update()
+    expected = [bool(enclosed.IsInside(i)) for i in range(len(points))]
+
+    assert list(ContainmentTree(*util.polyDataToArrays(mesh)).pointsInside(points)) == expected
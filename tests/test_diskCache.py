@@ -0,0 +1,80 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+import vtkmodules.all as vtk
+
+from diskCache import DiskCache
+
+
+def test_keys_depend_only_on_the_content(tmp_path):
+    first, second = tmp_path / "first.stl", tmp_path / "second.stl"
+    first.write_bytes(b"solid")
+    second.write_bytes(b"solid")
+    array = np.arange(6, dtype=np.int32).reshape(2, 3)
+
+    key = DiskCache.createKey([str(first)], {"iterations": 10, "scale": 2.0}, [array])
+    assert key == DiskCache.createKey([str(second)], {"scale": 2.0, "iterations": 10}, [array.copy()])
+    # the key does not change between runs, the papermesh cache stays valid
+    expected = hashlib.sha256(b"solid" + b"<i4(2, 3)" + array.tobytes() + b'{"iterations": 10, "scale": 2.0}')
+    assert key == expected.hexdigest()
+
+    assert key != DiskCache.createKey([str(first)], {"iterations": 11, "scale": 2.0}, [array])
+    assert key != DiskCache.createKey([str(first)], {"iterations": 10, "scale": 2.0}, [array.astype(np.int64)])
+    assert key != DiskCache.createKey([str(first)], {"iterations": 10, "scale": 2.0}, [array.reshape(3, 2)])
+    second.write_bytes(b"solid sphere")
+    assert key != DiskCache.createKey([str(second)], {"iterations": 10, "scale": 2.0}, [array])
+    assert DiskCache.createKey([str(tmp_path / "missing.stl")]) is None
+
+
+def test_entries_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    sphere = vtk.vtkSphereSource()
+    sphere.Update()
+    arrays = {"uvs": np.random.RandomState(0).rand(5, 2), "seed": np.array(3)}
+
+    assert cache.get("mesh") is None and cache.getArrays("arrays") is None
+    cache.put("mesh", sphere.GetOutput())
+    cache.putArrays("arrays", arrays)
+
+    mesh = cache.get("mesh")
+    assert mesh.GetNumberOfPoints() == sphere.GetOutput().GetNumberOfPoints()
+    assert mesh.GetNumberOfCells() == sphere.GetOutput().GetNumberOfCells()
+    cached = cache.getArrays("arrays")
+    assert set(cached) == set(arrays)
+    assert all(np.array_equal(cached[name], arrays[name]) for name in arrays)
+
+    cache.remove("arrays")
+    assert cache.getArrays("arrays") is None
+
+
+def test_failed_writes_keep_the_old_entry(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.putArrays("key", {"value": np.array([1])})
+
+    def failingWrite(path):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+        raise IOError("disk full")
+
+    with pytest.raises(IOError):
+        cache.store("key", ".npz", failingWrite)
+    assert os.listdir(str(tmp_path)) == ["key.npz"]
+    assert np.array_equal(cache.getArrays("key")["value"], [1])
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.putArrays(key, {"value": np.zeros(1000)})
+        os.utime(cache.getPath(key, ".npz"), (1000 + i, 1000 + i))
+    entrySize = os.path.getsize(cache.getPath("a", ".npz"))
+
+    # reading a marks it as the most recently used entry
+    assert cache.getArrays("a") is not None
+    cache.maxBytes = 3 * entrySize
+    cache.putArrays("d", {"value": np.zeros(1000)})
+
+    assert cache.getArrays("b") is None
+    assert all(cache.getArrays(key) is not None for key in ["a", "c", "d"])
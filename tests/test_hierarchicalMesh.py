@@ -0,0 +1,55 @@
+import vtkmodules.all as vtk
+from hierarchicalMesh import HierarchicalMesh
+
+
+def sphereNode(center, radius, label):
+    '''
+    :return: a hierarchical mesh with a sphere as papermesh, without structures and papermesh generation.
+    '''
+    sphere = vtk.vtkSphereSource()
+    sphere.SetCenter(center)
+    sphere.SetRadius(radius)
+    sphere.SetThetaResolution(16)
+    sphere.SetPhiResolution(16)
+    sphere.Update()
+
+    node = HierarchicalMesh(None, None, None)
+    node.papermesh = sphere.GetOutput()
+    node.mesh = vtk.vtkActor()
+    node.name = label
+    return node
+
+
+def treeOf(node):
+    return [(child.name, child.level, child.childIdx, treeOf(child)) for child in node.children]
+
+
+# A and B overlap, C lies inside both, D only inside A, E only inside B and O contains all of them
+overlapping = [((0, 0, 0), 10, "A"), ((6, 0, 0), 10, "B"), ((3, 0, 0), 2, "C"),
+               ((-6, 0, 0), 1, "D"), ((12, 0, 0), 1, "E"), ((3, 0, 0), 25, "O")]
+
+
+def test_addAllBuildsTheTreeOfAdd():
+    for order in [overlapping, overlapping[::-1], overlapping[2:] + overlapping[:2]]:
+        incremental = HierarchicalMesh(None, None, None)
+        for center, radius, label in order:
+            incremental.add(sphereNode(center, radius, label))
+
+        bulk = HierarchicalMesh(None, None, None)
+        bulk.addAll([sphereNode(center, radius, label) for center, radius, label in order])
+
+        assert treeOf(bulk) == treeOf(incremental)
+
+
+def test_addAllIntoExistingTree():
+    incremental = HierarchicalMesh(None, None, None)
+    bulk = HierarchicalMesh(None, None, None)
+    for center, radius, label in overlapping[:2]:
+        incremental.add(sphereNode(center, radius, label))
+        bulk.add(sphereNode(center, radius, label))
+
+    for center, radius, label in overlapping[2:]:
+        incremental.add(sphereNode(center, radius, label))
+    bulk.addAll([sphereNode(center, radius, label) for center, radius, label in overlapping[2:]])
+
+    assert treeOf(bulk) == treeOf(incremental)
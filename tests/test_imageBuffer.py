@@ -0,0 +1,27 @@
+import numpy as np
+from PIL import Image
+
+import imageBuffer
+
+
+def test_fromNumpy_shares_the_memory_of_the_array():
+    array = np.zeros((4, 5, 3), dtype=np.uint8)
+    image = imageBuffer.fromNumpy(array)
+    array[1, 2] = [10, 20, 30]
+    assert np.array_equal(imageBuffer.toNumpy(image), array)
+
+
+def test_writePng_writes_the_rows_top_down(tmp_path):
+    path = str(tmp_path / "image.png")
+    for components in [3, 4]:
+        array = np.random.RandomState(components).randint(0, 256, (37, 53, components))
+
+        written = imageBuffer.writePng(array.astype(np.float64), path)
+
+        assert np.array_equal(np.asarray(Image.open(path)), array[::-1])
+        assert np.array_equal(imageBuffer.toNumpy(written, components), array)
+
+
+def test_writePng_keeps_uint8_images(tmp_path):
+    image = imageBuffer.fromNumpy(np.full((6, 7, 3), 200, dtype=np.uint8))
+    assert imageBuffer.writePng(image, str(tmp_path / "image.png")) is image
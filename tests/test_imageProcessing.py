@@ -0,0 +1,86 @@
+import numpy as np
+from PIL import Image
+
+import imageBuffer
+from benchmark import referenceOptimizedBrighten, renderingTestImage
+from imageProcessing import ImageProcessor
+
+
+def brightenMultiplyInMemory(processor, images):
+    '''
+    :return: the images brightened with brightenChannels and multiplied with multiplyPixels, in one piece.
+    '''
+    height, width, _ = images[0].shape
+    layers = []
+    for image in images:
+        layer = np.empty((height * width, 3), dtype=np.uint8)
+        processor.brightenPixels(image.reshape(-1, 3), processor.brightenChannels(image), layer)
+        layers.append(layer)
+    processor.multiplyPixels(layers[0], layers[1:])
+    return layers[0].reshape(height, width, 3)
+
+
+def test_streamed_brighten_multiply_equals_in_memory(tmp_path):
+    height, width = 150, 41
+
+    # red and green have equal sums below blue, so no channel is strictly the smallest,
+    # their float means differ in the last bit
+    random = np.random.RandomState(0)
+    tied = random.randint(0, 200, (height, width, 3)).astype(np.uint8)
+    tied[:, :, 1] = random.permutation(tied[:, :, 0].ravel()).reshape(height, width)
+    tied[:, :, 2] = 255
+    reddish = random.randint(0, 256, (height, width, 3)).astype(np.uint8)
+    reddish[:, :, 1] //= 2
+    bluish = random.randint(0, 256, (height, width, 3)).astype(np.uint8)
+    bluish[:, :, 0] //= 3
+    images = [tied, reddish, bluish]
+
+    processor = ImageProcessor(width, height)
+    processor.tileRows = 16
+    assert processor.brightenChannels(tied) is None
+
+    paths = []
+    for i, image in enumerate(images):
+        paths.append(str(tmp_path / "layer{}.png".format(i)))
+        Image.fromarray(image).save(paths[-1])
+    outPath = str(tmp_path / "result.png")
+    processor.brightenMultiplyFiles(paths, outPath)
+
+    assert np.array_equal(np.asarray(Image.open(outPath)), brightenMultiplyInMemory(processor, images))
+
+
+def test_multiplyImages_equals_the_float_multiplication():
+    # every pair of uint8 values, multiplied with a third random image
+    values = np.arange(256, dtype=np.uint8)
+    first = np.repeat(values[:, np.newaxis], 256, axis=1)
+    images = [np.stack((first, first.T, first), axis=2), np.stack((first.T, first, first[::-1]), axis=2),
+              np.random.RandomState(1).randint(0, 256, (256, 256, 3)).astype(np.uint8)]
+
+    # the former multiplication of the normalized images pair by pair, cast to uint8 after every step
+    expected = images[0]
+    for image in images[1:]:
+        expected = (expected / 255 * (image / 255) * 255).astype(np.uint8)
+
+    processor = ImageProcessor(256, 256)
+    processor.multiplyChunk = 1000
+    result = processor.multiplyImages([imageBuffer.fromNumpy(image) for image in images], 256, 256)
+    assert np.array_equal(imageBuffer.toNumpy(result, 3), expected)
+
+
+def test_optimizedBrighten_equals_the_float_brightening():
+    size = 256
+    processor = ImageProcessor(size, size)
+    processor.brightenChunk = 1000
+    values = np.repeat(np.arange(256, dtype=np.uint8)[:, np.newaxis], 256, axis=1)
+
+    for darkChannel in range(3):
+        # every pair of values of the other channels, with a dark random brightened channel
+        pixels = np.empty((size, size, 3), dtype=np.uint8)
+        others = [channel for channel in range(3) if channel != darkChannel]
+        pixels[:, :, others[0]] = values
+        pixels[:, :, others[1]] = values.T
+        pixels[:, :, darkChannel] = np.random.RandomState(darkChannel).randint(0, 128, (size, size))
+
+        for image in [imageBuffer.fromNumpy(pixels), renderingTestImage(size, darkChannel)]:
+            expected = imageBuffer.toNumpy(referenceOptimizedBrighten(image, size, size), 3)
+            assert np.array_equal(imageBuffer.toNumpy(processor.optimizedBrighten(image, size, size), 3), expected)
@@ -0,0 +1,109 @@
+import time
+
+import numpy as np
+import pytest
+
+from diskCache import DiskCache
+from meshProcessing import MeshProcessing
+
+
+class FakeGraph(object):
+    '''
+    Stands in for the mu3d graph, its unfolding lays the loaded triangles side by side in the plane.
+    '''
+
+    def __init__(self):
+        self.unfoldings = 0
+
+    def load(self, path):
+        with open(path) as f:
+            self.numberOfTriangles = int(f.read().split()[2])
+
+    def unfold(self, iterations, seed):
+        self.unfoldings += 1
+        return True
+
+    def save(self, filename, gluetabsFilename):
+        with open(filename, "w") as f:
+            for i in range(self.numberOfTriangles):
+                f.write("v {0} 0 0\nv {0}.5 0 0\nv {0} 0.5 0\n".format(i))
+                f.write("vt {0} 0\nvt {0}.5 0\nvt {0} 0.5\n".format(i))
+                f.write("f {0}/{0} {1}/{1} {2}/{2}\n".format(3 * i + 1, 3 * i + 2, 3 * i + 3))
+
+
+def tetrahedron():
+    points = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=float)
+    triangles = np.array([[0, 2, 1], [0, 1, 3], [0, 3, 2], [1, 2, 3]])
+    return points, triangles
+
+
+def test_unchanged_meshes_are_unfolded_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(MeshProcessing, "unfoldCache", DiskCache(str(tmp_path)))
+    processor = MeshProcessing()
+    points, triangles = tetrahedron()
+
+    graph = FakeGraph()
+    unfolded = processor.mu3dUnfold(points, triangles, graph, 10)
+    assert graph.unfoldings == 1
+
+    # the same geometry with its own copy of every corner, as the triangle soups of the papermeshes
+    soup = points[triangles].reshape(-1, 3)
+    cached = processor.mu3dUnfold(soup, np.arange(len(soup)).reshape(-1, 3), graph, 10)
+    assert graph.unfoldings == 1
+    assert all(np.array_equal(a, b) for a, b in zip(unfolded, cached))
+
+    processor.mu3dUnfold(points, triangles, graph, 10, seed=1)
+    processor.mu3dUnfold(points, triangles, graph, 20)
+    processor.mu3dUnfold(points + [0, 0, 1], triangles, graph, 10)
+    assert graph.unfoldings == 4
+
+
+# per seed the seconds the fake unfolding takes and whether it succeeds, per mesh index
+seedBehaviour = {}
+
+
+def fakeUnfold(self, points, triangles, graph, iterations, seed = 0):
+    duration, success = seedBehaviour[int(points[0, 0])][seed]
+    time.sleep(duration)
+    return "mesh {} seed {}".format(int(points[0, 0]), seed) if success else None
+
+
+@pytest.fixture
+def fakeSeeds(monkeypatch):
+    '''
+    Replaces the mu3d unfolding of the forked workers with fakeUnfold, the meshes carry their index in the first point.
+    '''
+    monkeypatch.setattr(MeshProcessing, "mu3dUnfold", fakeUnfold)
+    monkeypatch.setattr(MeshProcessing, "createGraph", staticmethod(lambda: None))
+    seedBehaviour.clear()
+
+    def meshes(*behaviours):
+        seedBehaviour.update(enumerate(behaviours))
+        return [(np.full((3, 3), float(idx)), np.array([[0, 1, 2]])) for idx in range(len(behaviours))]
+    return meshes
+
+
+def test_the_first_successful_seed_in_order_is_kept(fakeSeeds):
+    meshes = fakeSeeds({0: (0.3, False), 1: (0.6, True), 2: (0.0, True)})
+    results = MeshProcessing().mu3dUnfoldSeeds(meshes, 10, seeds=[0, 1, 2], workers=3)
+    assert results == ["mesh 0 seed 1"]
+
+
+def test_seeds_stop_once_every_mesh_is_decided(fakeSeeds):
+    meshes = fakeSeeds({0: (0.0, True), 1: (30.0, True)}, {0: (0.0, False), 1: (0.2, True)})
+    start = time.time()
+    processor = MeshProcessing()
+    results = processor.mu3dUnfoldSeeds(meshes, 10, seeds=[0, 1], workers=4)
+    assert time.time() - start < 10.0
+    assert results == ["mesh 0 seed 0", "mesh 1 seed 1"]
+    assert processor.timedOutMeshes == []
+
+
+def test_meshes_without_success_in_their_budget_time_out(fakeSeeds):
+    meshes = fakeSeeds({0: (0.0, False), 1: (0.1, True)}, {0: (30.0, True), 1: (30.0, True)})
+    start = time.time()
+    processor = MeshProcessing()
+    results = processor.mu3dUnfoldSeeds(meshes, 10, seeds=[0, 1], timeBudget=1.0, workers=4)
+    assert time.time() - start < 10.0
+    assert results == ["mesh 0 seed 1", None]
+    assert processor.timedOutMeshes == [1]
@@ -0,0 +1,113 @@
+import struct
+import zlib
+import numpy as np
+from PIL import Image
+from pngStream import PngRowReader, PngRowWriter, pngChunk
+
+
+def filterRows(pixels, filterTypes):
+    '''
+    Filters the rows of an image like a png encoder, row i with filterTypes[i % len(filterTypes)].
+    :param pixels: (height, width, channels) uint8 array.
+    :return: the filtered bytes with the filter type in front of every row.
+    '''
+    height, width, channels = pixels.shape
+    rows = pixels.reshape(height, -1).astype(np.int32)
+    filtered = bytearray()
+    previous = np.zeros(width * channels, dtype=np.int32)
+    for i, row in enumerate(rows):
+        filterType = filterTypes[i % len(filterTypes)]
+        left = np.concatenate((np.zeros(channels, dtype=np.int32), row[:-channels]))
+        upperLeft = np.concatenate((np.zeros(channels, dtype=np.int32), previous[:-channels]))
+        if filterType == 0:
+            prediction = 0
+        elif filterType == 1:
+            prediction = left
+        elif filterType == 2:
+            prediction = previous
+        elif filterType == 3:
+            prediction = (left + previous) // 2
+        else:
+            estimate = left + previous - upperLeft
+            distanceLeft = np.abs(estimate - left)
+            distanceUp = np.abs(estimate - previous)
+            distanceUpperLeft = np.abs(estimate - upperLeft)
+            prediction = np.where((distanceLeft <= distanceUp) & (distanceLeft <= distanceUpperLeft), left,
+                                  np.where(distanceUp <= distanceUpperLeft, previous, upperLeft))
+        filtered.append(filterType)
+        filtered += ((row - prediction) % 256).astype(np.uint8).tobytes()
+        previous = row
+    return bytes(filtered)
+
+
+def writeFilteredPng(path, pixels, filterTypes):
+    height, width, channels = pixels.shape
+    header = struct.pack(">IIBBBBB", width, height, 8, {3: 2, 4: 6}[channels], 0, 0, 0)
+    data = zlib.compress(filterRows(pixels, filterTypes))
+    with open(path, "wb") as f:
+        f.write(PngRowReader.signature + pngChunk(b"IHDR", header))
+        # the image data split over several chunks
+        for start in range(0, len(data), 1000):
+            f.write(pngChunk(b"IDAT", data[start:start + 1000]))
+        f.write(pngChunk(b"IEND", b""))
+
+
+def readTiles(path, tileRows):
+    with PngRowReader(path) as reader:
+        tiles = []
+        while reader.row < reader.height:
+            tiles.append(reader.readRows(tileRows))
+    return np.concatenate(tiles)
+
+
+def gradientImage(channels):
+    random = np.random.RandomState(channels)
+    # smooth gradients with noise, so all predictors and the wrap around of the bytes occur
+    y, x = np.mgrid[0:37, 0:53]
+    pixels = (x[:, :, np.newaxis] * 5 + y[:, :, np.newaxis] * 3 + np.arange(channels) * 40
+              + random.randint(0, 30, (37, 53, channels)))
+    return (pixels % 256).astype(np.uint8)
+
+
+def test_paethRows(tmp_path, monkeypatch):
+    for channels in [3, 4]:
+        pixels = gradientImage(channels)
+        path = str(tmp_path / "paeth{}.png".format(channels))
+        writeFilteredPng(path, pixels, [4])
+        assert np.array_equal(np.asarray(Image.open(path)), pixels)
+
+        # only the tiles are decoded, never the whole file
+        imageOpen = Image.open
+        def openTile(fp, *args):
+            assert not isinstance(fp, str), "the whole png was decoded"
+            return imageOpen(fp, *args)
+        monkeypatch.setattr(Image, "open", openTile)
+        for tileRows in [1, 5, 64]:
+            assert np.array_equal(readTiles(path, tileRows), pixels)
+        monkeypatch.undo()
+
+
+def test_mixedFilterRows(tmp_path):
+    for channels in [3, 4]:
+        pixels = gradientImage(channels)
+        path = str(tmp_path / "mixed{}.png".format(channels))
+        writeFilteredPng(path, pixels, [4, 3, 0, 1, 2, 3, 2, 4, 1])
+        for tileRows in [1, 2, 7, 64]:
+            assert np.array_equal(readTiles(path, tileRows), pixels)
+
+
+def test_pillowPng(tmp_path):
+    pixels = gradientImage(3)
+    path = str(tmp_path / "pillow.png")
+    Image.fromarray(pixels).save(path)
+    assert np.array_equal(readTiles(path, 8), pixels)
+
+
+def test_writerRoundTrip(tmp_path):
+    pixels = gradientImage(4)
+    path = str(tmp_path / "written.png")
+    with PngRowWriter(path, 53, 37, 4) as writer:
+        writer.writeRows(pixels[:20])
+        writer.writeRows(pixels[20:])
+    assert np.array_equal(readTiles(path, 16), pixels)
+    assert np.array_equal(np.asarray(Image.open(path)), pixels)
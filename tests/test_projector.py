@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import util
+from benchmark import sphereActor
+from projector import Projector, projectionWorker
+
+
+def adaptiveProjector(tmp_path, batchSize):
+    projector = Projector()
+    projector.texelDensity = 20
+    projector.batchSize = batchSize
+    projector.analyticUVs = True
+    projector.useAtlas = False
+    projector.dirname = str(tmp_path / "src")
+    os.makedirs(os.path.join(projector.dirname, "../out/2D/texture"))
+    return projector
+
+
+def test_adaptive_projection_is_batched(tmp_path):
+    paper = sphereActor(10.0, (0, 0, 0), 12, (1, 1, 1))
+    structure = sphereActor(6.0, (2, 0, 0), 16, (1, 0.5, 0))
+    batchSize = 16
+
+    projector = adaptiveProjector(tmp_path, batchSize)
+    result = projector.project(paper, structure, 0, [100, 100], asArrays=True)
+    stats = projector.renderStats[0]
+
+    paperPoints, paperTriangles = util.polyDataToArrays(paper.GetMapper().GetInput())
+    centers, positions = projector.cellCameraPositions(paper.GetMapper().GetInput())
+    sizes, scales = projector.adaptiveRendering(paperPoints[paperTriangles], centers, projector.texelDensity)
+    sizeCounts = np.unique(sizes, return_counts=True)[1]
+
+    # the triangles of a render size share their batches
+    assert len(sizeCounts) > 1
+    assert stats["renderCalls"] == sum(int(np.ceil(count / batchSize)) for count in sizeCounts)
+    assert stats["renderCalls"] < len(paperTriangles) / 4
+    assert stats["readbacks"] == stats["renderCalls"]
+
+    # the triangles are inserted in the order of the cells
+    assert np.allclose(result["points"], paperPoints[paperTriangles].reshape(-1, 3))
+
+
+def test_projection_worker_uses_the_projector_settings(tmp_path):
+    paper = sphereActor(10.0, (0, 0, 0), 8, (1, 1, 1))
+    structure = sphereActor(6.0, (2, 0, 0), 16, (1, 0.5, 0))
+
+    projector = adaptiveProjector(tmp_path, 9)
+    projector.adaptiveSizeStep = 32
+    projector.maxWindowSize = 300
+    projector.rasterChunk = 7
+
+    task = projector.projectionTask(paper, structure, 0, [100, 100])
+    assert task["settings"] == {name: getattr(projector, name) for name in Projector.settings}
+
+    result = projectionWorker(task)
+    serial = projector.project(paper, structure, 1, [100, 100], asArrays=True)
+
+    assert result["renderStats"] == projector.renderStats[1]
+    assert np.allclose(result["uvs"], serial["uvs"])
+    # the worker rebuilds the meshes without their normals, so only the layout of the textures is the same
+    assert result["texture"].shape == serial["texture"].shape
+
+
+def test_render_stats_are_per_projector():
+    first, second = Projector(), Projector()
+    first.renderStats[0] = {"renderCalls": 1}
+    assert second.renderStats == {}
@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+
+import projector
+import rasterizer
+from benchmark import sphereActor
+from projector import Projector
+
+
+def test_culled_rendering_equals_rendering_all_triangles(tmp_path, monkeypatch):
+    paper = sphereActor(10.0, (0, 0, 0), 8, (1, 1, 1))
+    structure = sphereActor(6.0, (2, 0, 0), 48, (1, 0.5, 0))
+
+    tasks = []
+    def recordTask(task):
+        tasks.append(task)
+        return rasterizer.rasterWorker(task)
+    monkeypatch.setattr(projector, "rasterWorker", recordTask)
+
+    softwareProjector = Projector()
+    softwareProjector.texelDensity = 20
+    softwareProjector.rasterWorkers = 1
+    softwareProjector.dirname = str(tmp_path / "src")
+    os.makedirs(os.path.join(softwareProjector.dirname, "../out/2D/texture"))
+    softwareProjector.projectSoftware(paper, structure, 0, asArrays=True, workers=1)
+
+    culled = rasterizer.rasterizer
+    unculled = rasterizer.SoftwareRasterizer.fromActor(structure)
+    unculled.candidateTriangles = lambda *window: np.arange(len(unculled.triangles))
+
+    numberOfCandidates = []
+    for task in tasks:
+        for window in zip(*task):
+            numberOfCandidates.append(len(culled.candidateTriangles(*window)))
+            assert np.array_equal(culled.render(*window), unculled.render(*window))
+
+    assert len(numberOfCandidates) == 8 * 6 * 2
+    assert np.mean(numberOfCandidates) < len(culled.triangles) / 2
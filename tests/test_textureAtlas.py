@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from textureAtlas import TextureAtlas
+
+
+def insertImages(atlas, count, seed=0):
+    '''
+    Inserts images of random sizes, each filled with random pixels, with the corners at three of their pixels.
+    :return: the images, their corners and the page and position returned by insert().
+    '''
+    random = np.random.RandomState(seed)
+    images, corners, placements = [], [], []
+    for i in range(count):
+        height, width = random.randint(1, 40, 2)
+        images.append(random.randint(0, 256, (height, width, 3)).astype(np.uint8))
+        corners.append(np.stack((random.randint(0, width, 3), random.randint(0, height, 3)), axis=1))
+        placements.append(atlas.insert(images[-1], corners[-1]))
+    return images, corners, placements
+
+
+def test_images_lie_inside_their_page_without_overlapping():
+    atlas = TextureAtlas(128, padding=1)
+    images, corners, placements = insertImages(atlas, 60)
+
+    for i, (image, (page, x, y)) in enumerate(zip(images, placements)):
+        height, width = image.shape[0:2]
+        assert 0 <= x and x + width <= atlas.maxSize and 0 <= y and y + height <= atlas.maxSize
+        assert np.array_equal(atlas.pages[page][y:y + height, x:x + width], image)
+
+        # neighbours on the same page keep the padding between them
+        for other, (otherPage, otherX, otherY) in zip(images[:i], placements[:i]):
+            otherHeight, otherWidth = other.shape[0:2]
+            assert (page != otherPage or x >= otherX + otherWidth + atlas.padding or otherX >= x + width + atlas.padding
+                    or y >= otherY + otherHeight + atlas.padding or otherY >= y + height + atlas.padding)
+
+
+def test_full_pages_start_new_pages():
+    atlas = TextureAtlas(64)
+    images, corners, placements = insertImages(atlas, 40)
+
+    assert atlas.getNumberOfPages() > 1
+    assert sorted(set(page for page, x, y in placements)) == list(range(atlas.getNumberOfPages()))
+    for page, used in zip(atlas.getPages(), atlas.used):
+        assert page.shape == (used[1], used[0], 3)
+
+
+def test_texture_coordinates_point_at_the_corners():
+    atlas = TextureAtlas(64)
+    images, corners, placements = insertImages(atlas, 40)
+    uvs = atlas.getTextureCoordinates().reshape(-1, 3, 2)
+    pages = atlas.getPages()
+
+    assert np.array_equal(atlas.trianglePages, [page for page, x, y in placements])
+    for image, imageCorners, (page, x, y), triangleUvs in zip(images, corners, placements, uvs):
+        assert np.all((triangleUvs >= 0.0) & (triangleUvs <= 1.0))
+        pixels = np.rint(triangleUvs * [pages[page].shape[1], pages[page].shape[0]]).astype(int)
+        assert np.array_equal(pixels, imageCorners + [x, y])
+        for (column, row), (pageColumn, pageRow) in zip(imageCorners, pixels):
+            assert np.array_equal(pages[page][pageRow, pageColumn], image[row, column])
+
+
+def test_images_larger_than_a_page_are_rejected():
+    atlas = TextureAtlas(32)
+    with pytest.raises(Exception):
+        atlas.insert(np.zeros((10, 33, 3), dtype=np.uint8), [[0, 0], [1, 0], [0, 1]])
+    assert atlas.getNumberOfPages() == 0
+    assert atlas.getTextureCoordinates().shape == (0, 2)
@@ -0,0 +1,37 @@
+import warnings
+
+import numpy as np
+import vtkmodules.all as vtk
+
+import util
+
+
+def test_polyDataToArrays_round_trip():
+    sphere = vtk.vtkSphereSource()
+    sphere.Update()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        points, triangles = util.polyDataToArrays(sphere.GetOutput())
+        mesh = util.arraysToPolyData(points, triangles)
+
+    assert triangles.shape == (sphere.GetOutput().GetNumberOfCells(), 3)
+    for i in [0, len(triangles) // 2, len(triangles) - 1]:
+        ids = mesh.GetCell(i).GetPointIds()
+        assert [ids.GetId(j) for j in range(3)] == list(triangles[i])
+    assert np.array_equal(util.polyDataToArrays(mesh)[1], triangles)
+
+
+def test_polygons_are_split_into_fans():
+    points = vtk.vtkPoints()
+    for i in range(8):
+        points.InsertNextPoint(i, i % 3, 0)
+    polys = vtk.vtkCellArray()
+    for cell in [[0, 1, 2, 3], [4, 5, 6], [1, 3, 5, 7, 0]]:
+        polys.InsertNextCell(len(cell), cell)
+    mesh = vtk.vtkPolyData()
+    mesh.SetPoints(points)
+    mesh.SetPolys(polys)
+
+    triangles = util.polyDataTriangles(mesh)
+    assert triangles.tolist() == [[0, 1, 2], [0, 2, 3], [4, 5, 6], [1, 3, 5], [1, 5, 7], [1, 7, 0]]